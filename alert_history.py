@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 告警历史查询模块
+
+将 alerts.log（含 logs/ 下的压缩归档）解析一次，建立按 基金代码 / 日期 / 告警类型
+组织的本地索引 (alert_index.pkl)，之后每次只增量解析新追加的日志行。
+
+用法:
+    python main.py history --code 162719 --days 30     # 单只基金的告警统计
+    python main.py history --top 20 --hours 8-10        # 早盘时段告警最多的基金
+"""
+
+import os
+import re
+import gzip
+import pickle
+import hashlib
+import tempfile
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import logger_util
+from config import ALERT_INDEX_FILE
+
+INDEX_VERSION = 1
+
+# 索引文件路径（回放模式下指向临时目录）
+INDEX_PATH = ALERT_INDEX_FILE
+
+# [2026-02-01 05:30:51] [溢价告警] 石油LOF(162719) 溢价率: 32.57% (阈值: 10.0%)
+# [2026-02-01 05:30:51] [异动告警] 石油LOF(162719) 溢价率: -3.10% (Z值: -4.52)
+LINE_PATTERN = re.compile(
+    r"^\[(\d{4}-\d{2}-\d{2}) (\d{2}):(\d{2}):(\d{2})\] \[(\S+?)告警\] (.*)\((\w+)\) \S+?率: (-?[\d.]+)% \((?:阈值|Z值): (-?[\d.]+)%?\)"
+)
+
+ALERT_TYPES = {"溢价": "premium", "折价": "discount", "异动": "anomaly"}
+
+# 用于识别日志文件是否被滚动替换：取首行的摘要
+HEAD_BYTES = 256
+
+
+def _head_digest(data):
+    return hashlib.md5(data).hexdigest()
+
+
+class AlertIndex:
+    """告警历史索引"""
+
+    def __init__(self):
+        self.log_offset = 0
+        self.log_head = ""
+        self.log_head_len = 0
+        self.archives = set()  # 已解析的归档文件名
+        self.names = {}  # code -> 最新名称
+        # code -> {'times': [时间戳], 'types': [...], 'rates': [...]}，按时间升序
+        self.funds = {}
+        # 'YYYY-MM-DD' -> {code: 告警次数}
+        self.days = {}
+
+    # ------------------------------------------------------------ 构建
+
+    def ingest(self, text):
+        """解析日志文本并加入索引"""
+        added = 0
+        for line in text.splitlines():
+            match = LINE_PATTERN.match(line)
+            if not match:
+                continue
+            date, hh, mm, ss, kind, name, code, rate, threshold = match.groups()
+            ts = datetime(int(date[:4]), int(date[5:7]), int(date[8:10]),
+                          int(hh), int(mm), int(ss)).timestamp()
+            fund = self.funds.get(code)
+            if fund is None:
+                fund = self.funds[code] = {'times': [], 'types': [], 'rates': []}
+            # 日志按时间追加，极少数乱序时插入到正确位置以保持有序
+            pos = len(fund['times'])
+            if pos and fund['times'][-1] > ts:
+                pos = bisect_right(fund['times'], ts)
+            fund['times'].insert(pos, ts)
+            fund['types'].insert(pos, ALERT_TYPES.get(kind, kind))
+            fund['rates'].insert(pos, float(rate))
+            self.names[code] = name
+            day = self.days.setdefault(date, {})
+            day[code] = day.get(code, 0) + 1
+            added += 1
+        return added
+
+    def update(self, log_file=None, archive_dir=None):
+        """
+        增量更新索引：先处理新出现的归档文件，再处理当前日志的新增部分（默认为 logger_util 当前的日志路径）
+
+        Returns:
+            int: 新增的告警条数
+        """
+        log_file = log_file or logger_util.LOG_PATH
+        archive_dir = archive_dir or logger_util.ARCHIVE_PATH
+        added = 0
+
+        if os.path.isdir(archive_dir):
+            for filename in sorted(os.listdir(archive_dir)):
+                if not filename.endswith(".log.gz") or filename in self.archives:
+                    continue
+                with gzip.open(os.path.join(archive_dir, filename), 'rb') as f:
+                    data = f.read()
+                # 该归档正是此前增量解析的日志文件：只解析未读部分
+                matched = self.log_head and _head_digest(data[:self.log_head_len]) == self.log_head
+                start = self.log_offset if matched else 0
+                added += self.ingest(data[start:].decode('utf-8', errors='replace'))
+                self.archives.add(filename)
+                if matched:
+                    self.log_offset = 0
+                    self.log_head = ""
+
+        if os.path.exists(log_file):
+            with open(log_file, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(0)
+                head = f.read(self.log_head_len or HEAD_BYTES)
+                if not self.log_head or _head_digest(head) != self.log_head or size < self.log_offset:
+                    # 新文件（或被替换）：从头解析
+                    self.log_offset = 0
+                f.seek(self.log_offset)
+                data = f.read()
+                f.seek(0)
+                head = f.read(HEAD_BYTES)
+            self.log_head = _head_digest(head)
+            self.log_head_len = len(head)
+            # 只解析到最后一个完整行
+            end = data.rfind(b"\n") + 1
+            if end:
+                added += self.ingest(data[:end].decode('utf-8', errors='replace'))
+                self.log_offset += end
+        return added
+
+    # ------------------------------------------------------------ 查询
+
+    @staticmethod
+    def _in_hours(ts, hours):
+        if not hours:
+            return True
+        hour = datetime.fromtimestamp(ts).hour
+        return hours[0] <= hour < hours[1]
+
+    def fund_stats(self, code, since=None, until=None, hours=None):
+        """
+        单只基金在时间范围内的告警统计
+
+        Args:
+            code: 基金代码
+            since, until: 时间范围 (datetime)，None 表示不限
+            hours: 小时范围 (start, end)，如 (8, 10) 表示 08:00-09:59
+
+        Returns:
+            dict: 统计结果，无告警返回 None
+        """
+        fund = self.funds.get(code)
+        if not fund:
+            return None
+        times = fund['times']
+        lo = bisect_left(times, since.timestamp()) if since else 0
+        hi = bisect_right(times, until.timestamp()) if until else len(times)
+        picked = [i for i in range(lo, hi) if self._in_hours(times[i], hours)]
+        if not picked:
+            return None
+
+        rates = [fund['rates'][i] for i in picked]
+        types = [fund['types'][i] for i in picked]
+        first, last = times[picked[0]], times[picked[-1]]
+        active_days = {datetime.fromtimestamp(times[i]).strftime("%Y-%m-%d") for i in picked}
+        span_start = since.timestamp() if since else first
+        span_end = until.timestamp() if until else last
+        span_days = max(1.0, (span_end - span_start) / 86400)
+        return {
+            'code': code,
+            'name': self.names.get(code, ''),
+            'count': len(picked),
+            'premium': types.count('premium'),
+            'discount': types.count('discount'),
+            'anomaly': types.count('anomaly'),
+            'first': datetime.fromtimestamp(first),
+            'last': datetime.fromtimestamp(last),
+            'active_days': len(active_days),
+            'per_day': len(picked) / span_days,
+            'rate_mean': sum(rates) / len(rates),
+            'rate_max': max(rates),
+            'rate_min': min(rates),
+            'rate_last': rates[-1]
+        }
+
+    def top_funds(self, since=None, until=None, hours=None, alert_type=None, limit=20):
+        """
+        告警次数最多的基金
+
+        Returns:
+            list: [(code, name, count)]，按次数降序
+        """
+        counts = {}
+        if hours is None and alert_type is None:
+            # 只按日期过滤时直接使用日期索引
+            start = since.strftime("%Y-%m-%d") if since else ""
+            end = until.strftime("%Y-%m-%d") if until else "9999"
+            for date, day in self.days.items():
+                if start <= date <= end:
+                    for code, n in day.items():
+                        counts[code] = counts.get(code, 0) + n
+        else:
+            lo_ts = since.timestamp() if since else float('-inf')
+            hi_ts = until.timestamp() if until else float('inf')
+            for code, fund in self.funds.items():
+                times = fund['times']
+                n = 0
+                for i in range(bisect_left(times, lo_ts), bisect_right(times, hi_ts)):
+                    if alert_type and fund['types'][i] != alert_type:
+                        continue
+                    if self._in_hours(times[i], hours):
+                        n += 1
+                if n:
+                    counts[code] = n
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(code, self.names.get(code, ''), n) for code, n in ranked]
+
+
+def load_index(path=None):
+    """加载索引，不存在或版本不符时返回空索引"""
+    path = path or INDEX_PATH
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+            if payload.get('version') == INDEX_VERSION:
+                return payload['index']
+        except Exception as e:
+            print(f"读取告警索引失败: {e}，将重建索引")
+    return AlertIndex()
+
+
+def save_index(index, path=None):
+    """保存索引（同目录下唯一的临时文件 + 原子替换，多个进程同时保存时互不覆盖临时文件）"""
+    path = path or INDEX_PATH
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'version': INDEX_VERSION, 'index': index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存告警索引失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def update_index(rebuild=False):
+    """
+    增量更新并保存索引
+
+    Returns:
+        AlertIndex: 最新索引
+    """
+    index = AlertIndex() if rebuild else load_index()
+    if index.update() or rebuild:
+        save_index(index)
+    return index
+
+
+def parse_hours(text):
+    """解析小时范围 '8-10' -> (8, 11)，包含结束小时"""
+    if not text:
+        return None
+    start, _, end = text.partition("-")
+    start = int(start)
+    end = int(end) if end else start
+    return start, end + 1
+
+
+def run_history_command(args):
+    """执行 history 子命令"""
+    index = update_index(rebuild=args.rebuild)
+    until = datetime.strptime(args.until, "%Y-%m-%d") + timedelta(days=1, seconds=-1) if args.until else None
+    if args.since:
+        since = datetime.strptime(args.since, "%Y-%m-%d")
+    elif args.days:
+        since = (until or datetime.now()) - timedelta(days=args.days)
+    else:
+        since = None
+    hours = parse_hours(args.hours)
+    range_text = f"{since:%Y-%m-%d} ~ {(until or datetime.now()):%Y-%m-%d}" if since else "全部"
+    if hours:
+        # hours 的结束小时不含在内，按包含的范围显示：8-10 -> 08:00-10:59
+        range_text += f"  时段 {hours[0]:02d}:00-{hours[1] - 1:02d}:59"
+
+    if args.code:
+        stats = index.fund_stats(args.code, since, until, hours)
+        if not stats:
+            print(f"基金 {args.code} 在 {range_text} 内没有告警记录")
+            return
+        print(f"[{stats['name']}({stats['code']})] {range_text}")
+        print(f"告警次数: {stats['count']} (溢价 {stats['premium']} / 折价 {stats['discount']} / 异动 {stats['anomaly']})")
+        print(f"首次: {stats['first']:%Y-%m-%d %H:%M:%S}  最近: {stats['last']:%Y-%m-%d %H:%M:%S}")
+        print(f"告警天数: {stats['active_days']}  日均告警: {stats['per_day']:.2f}")
+        print(f"比率: 平均 {stats['rate_mean']:.2f}%  最高 {stats['rate_max']:.2f}%  "
+              f"最低 {stats['rate_min']:.2f}%  最近 {stats['rate_last']:.2f}%")
+        return
+
+    alert_type = {"premium": "premium", "discount": "discount", "anomaly": "anomaly"}.get(args.type)
+    ranked = index.top_funds(since, until, hours, alert_type, args.top)
+    print(f"[告警次数排行] {range_text}")
+    if not ranked:
+        print("没有告警记录")
+    for i, (code, name, count) in enumerate(ranked, 1):
+        print(f"{i:>3}. {code}  {name:<20}{count:>6}")
+
+
+def add_history_parser(subparsers):
+    """注册 history 子命令参数"""
+    p = subparsers.add_parser("history", help="Query alert history from alerts.log")
+    p.add_argument("--code", help="基金代码（不指定则输出告警次数排行）")
+    p.add_argument("--days", type=int, default=30, help="最近N天 (默认30，0表示全部)")
+    p.add_argument("--since", help="开始日期 YYYY-MM-DD")
+    p.add_argument("--until", help="结束日期 YYYY-MM-DD")
+    p.add_argument("--hours", help="小时范围，如 8-10")
+    p.add_argument("--type", choices=["premium", "discount", "anomaly"], help="只统计指定告警类型")
+    p.add_argument("--top", type=int, default=20, help="排行数量")
+    p.add_argument("--rebuild", action="store_true", help="重建索引")
+    return p
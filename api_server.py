@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - HTTP API 服务模块
+
+--serve 模式下一个进程循环执行监控，并通过本地 HTTP JSON API 提供最新结果，
+多个界面实例 (--connect) 共享同一份抓取结果，不再各自请求上游接口。
+
+路由（均为 GET）:
+    /api/funds              最新基金表（含每只基金的溢价率及状态）
+    /api/funds/<code>       单只基金
+    /api/alerts             最近的告警记录，?since=<id> 只返回更新的
+    /api/history/<code>     单只基金的历史数据，?days=N（默认 7）
+    /api/events             变更事件流 (Server-Sent Events)：fund / alert / cycle / reset
+    /api/status             服务状态
+
+响应带 ETag，客户端用 If-None-Match 重新验证时未变化返回 304；
+请求头含 Accept-Encoding: gzip 时压缩响应。同一版本的响应体只序列化、压缩一次，由全部读者共享。
+
+用法:
+    python main.py --serve 8700                  # 监听 127.0.0.1:8700
+    python main.py --serve 0.0.0.0:8700          # 允许局域网访问
+    python main.py --connect http://host:8700    # 界面作为瘦客户端
+"""
+
+import json
+import gzip
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import (
+    config, SERVE_DEFAULT_PORT, SERVE_CYCLE_INTERVAL, SERVE_ALERT_LIMIT, SERVE_EVENT_LIMIT,
+    SERVE_KEEPALIVE, SERVE_GZIP_MIN_BYTES
+)
+
+def _clean(value):
+    """NaN 转为 None，保证输出合法 JSON"""
+    return None if isinstance(value, float) and value != value else value
+
+
+def build_row(fund, nav_price, nav_estimated, premium_rate, discount_rate, zscore, status):
+    """由 get_all_fund_data 的基金数据及计算结果构造基金表的一行（字段与界面表格行一致，瘦客户端直接使用）"""
+    row = {
+        'code': fund['code'],
+        'name': fund['name'],
+        'category': fund.get('category') or 'lof',
+        'market_price': fund['market_price'],
+        'nav_price': nav_price,
+        'nav_estimated': nav_estimated,
+        'nav_date': fund.get('nav_date') or '',
+        'volume': fund.get('volume'),
+        'amount': fund.get('amount'),
+        'premium_rate': premium_rate,
+        'discount_rate': discount_rate,
+        'zscore': zscore,
+        'status': status,
+        'fund_state': fund.get('fund_state') or ''
+    }
+    return {key: _clean(value) for key, value in row.items()}
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+class Body:
+    """某一版本的响应体，按需生成 gzip 压缩版本（只压缩一次）"""
+
+    def __init__(self, etag, raw):
+        self.etag = etag
+        self.raw = raw
+        self._gzip = None
+
+    def encoded(self, accept_gzip):
+        """返回 (内容, 是否压缩)"""
+        if not accept_gzip or len(self.raw) < SERVE_GZIP_MIN_BYTES:
+            return self.raw, False
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.raw, compresslevel=6)
+        return self._gzip, True
+
+
+class FundTable:
+    """
+    监控结果的共享视图：最新基金表、最近告警及变更事件
+
+    监控循环逐只写入（update_fund / add_alert），HTTP 线程读取；
+    内容未变化的基金不产生新版本，也不推送事件。
+    """
+
+    def __init__(self, alert_limit=SERVE_ALERT_LIMIT, event_limit=SERVE_EVENT_LIMIT):
+        self._cond = threading.Condition()
+        self.funds = {}  # code -> 行
+        self.row_versions = {}  # code -> 该行最后变化时的版本
+        self.version = 0  # 基金表版本，任一行或本轮状态变化时递增
+        self.cycle = {'state': 'idle', 'started': None, 'finished': None, 'count': 0}
+        self.cycles = 0  # 已完成的轮数（历史数据随之变化）
+        self.alerts = deque(maxlen=alert_limit)
+        self.alert_id = 0
+        self.events = deque(maxlen=event_limit)  # (序号, 事件名, JSON)
+        self.seq = 0
+        self._seen = set()  # 本轮已更新的基金
+        self._bodies = {}  # 缓存的响应体: 键 -> Body
+
+    # ------------------------------------------------------------ 写入（监控循环）
+
+    def _emit(self, name, payload):
+        self.seq += 1
+        self.events.append((self.seq, name, _dumps(payload)))
+        self._cond.notify_all()
+
+    def begin_cycle(self):
+        with self._cond:
+            self._seen = set()
+            self.version += 1
+            self.cycle = {'state': 'running', 'started': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                          'finished': self.cycle.get('finished'), 'count': 0}
+            self._emit('cycle', dict(self.cycle, version=self.version))
+
+    def update_fund(self, row):
+        """写入一行，内容变化时推送 fund 事件"""
+        code = row['code']
+        with self._cond:
+            self._seen.add(code)
+            if self.funds.get(code) == row:
+                return False
+            self.funds[code] = row
+            self.version += 1
+            self.row_versions[code] = self.version
+            self._emit('fund', row)
+            return True
+
+    def add_alert(self, record):
+        """追加一条告警（log_alert 返回的记录）"""
+        with self._cond:
+            self.alert_id += 1
+            alert = dict(record, id=self.alert_id)
+            self.alerts.append(alert)
+            self._emit('alert', alert)
+
+    def end_cycle(self, complete=True):
+        """
+        一轮结束
+
+        Args:
+            complete: 本轮是否成功获取了基金列表；成功时移除本轮未出现的基金（如已退市）
+        """
+        with self._cond:
+            removed = [code for code in self.funds if code not in self._seen] if complete else []
+            for code in removed:
+                del self.funds[code]
+                self.row_versions.pop(code, None)
+            self.version += 1
+            self.cycles += 1
+            self.cycle = dict(self.cycle, state='finished' if complete else 'failed',
+                              finished=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), count=len(self._seen))
+            self._emit('cycle', dict(self.cycle, version=self.version, removed=removed))
+
+    def load(self, rows, saved_at=None):
+        """启动时用快照数据预填基金表，读者无需等待首轮抓取"""
+        with self._cond:
+            for row in rows:
+                self.funds[row['code']] = row
+                self.row_versions[row['code']] = self.version + 1
+            self.version += 1
+            self.cycle = dict(self.cycle, state='snapshot',
+                              finished=saved_at.strftime("%Y-%m-%d %H:%M:%S") if saved_at else None,
+                              count=len(rows))
+
+    def load_recent_alerts(self, limit=SERVE_ALERT_LIMIT):
+        """从 alerts.jsonl 末尾读取最近的告警"""
+        import os
+        import logger_util
+        logger_util.flush_alerts()
+        if not os.path.exists(logger_util.JSONL_PATH):
+            return
+        with self._cond:
+            for line in logger_util.tail_lines(logger_util.JSONL_PATH, limit):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.alert_id += 1
+                self.alerts.append(dict(record, id=self.alert_id))
+
+    # ------------------------------------------------------------ 读取（HTTP 线程）
+
+    def _body(self, key, etag_of, build):
+        """同一 ETag 的响应体只生成一次（ETag 与内容在同一把锁内取得，保证一致）"""
+        with self._cond:
+            etag = etag_of()
+            body = self._bodies.get(key)
+            if body is not None and body.etag == etag:
+                return body
+            payload = build()
+        body = Body(etag, _dumps(payload))
+        with self._cond:
+            self._bodies[key] = body
+        return body
+
+    def funds_etag(self):
+        return f'W/"f{self.version}"'
+
+    def funds_body(self):
+        return self._body('funds', self.funds_etag, lambda: {
+            'version': self.version,
+            'event_id': self.seq,
+            'cycle': self.cycle,
+            'funds': list(self.funds.values())
+        })
+
+    def fund_etag(self, code):
+        return f'W/"{code}-{self.row_versions.get(code, 0)}"'
+
+    def fund_body(self, code):
+        with self._cond:
+            row = self.funds.get(code)
+            etag = self.fund_etag(code)
+        if row is None:
+            return None
+        return Body(etag, _dumps(row))
+
+    def alerts_etag(self):
+        return f'W/"a{self.alert_id}"'
+
+    def alerts_body(self, since=None):
+        if since is None:
+            return self._body('alerts', self.alerts_etag, lambda: {'alerts': list(self.alerts)})
+        with self._cond:
+            etag = self.alerts_etag()
+            alerts = [a for a in self.alerts if a['id'] > since]
+        return Body(etag, _dumps({'alerts': alerts}))
+
+    def status(self):
+        with self._cond:
+            return {'version': self.version, 'event_id': self.seq, 'cycle': self.cycle,
+                    'cycles': self.cycles, 'funds': len(self.funds), 'alerts': len(self.alerts)}
+
+    def snapshot(self):
+        """基金表的一致副本 (version, cycle, funds)，供终端看板读取"""
+        with self._cond:
+            return self.version, dict(self.cycle), dict(self.funds)
+
+    def wait_events(self, after, timeout):
+        """
+        等待序号大于 after 的事件
+
+        Returns:
+            tuple: (events, last)
+                events: [(序号, 事件名, JSON)]；超时为空列表；
+                        after 之后的事件已被淘汰（或来自上一次启动）时为 None，客户端需重新获取全表
+                last: 下一次等待使用的序号
+        """
+        with self._cond:
+            if after == self.seq:
+                self._cond.wait(timeout)
+            if after > self.seq or (self.events and after < self.events[0][0] - 1):
+                return None, self.seq
+            if after == self.seq:
+                return [], after
+            start = len(self.events) - (self.seq - after)
+            events = [self.events[i] for i in range(start, len(self.events))]
+            return events, self.seq
+
+
+# ---------------------------------------------------------------- HTTP 服务
+
+class APIServer:
+    """只读 HTTP JSON API"""
+
+    def __init__(self, table, host="127.0.0.1", port=SERVE_DEFAULT_PORT):
+        self.table = table
+        self.stopping = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        server = self
+        table = self.table
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # 静默访问日志
+
+            def _not_modified(self, etag):
+                return etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(","))
+
+            def _send_body(self, body):
+                """发送 JSON 响应，支持 If-None-Match 及 gzip"""
+                if body is None:
+                    return self._send_error(404, "not found")
+                if self._not_modified(body.etag):
+                    self.send_response(304)
+                    self.send_header("ETag", body.etag)
+                    self.end_headers()
+                    return
+                content, gzipped = body.encoded("gzip" in self.headers.get("Accept-Encoding", ""))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("ETag", body.etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Vary", "Accept-Encoding")
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _send_error(self, status, message):
+                content = _dumps({'error': message})
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path.rstrip("/")
+                query = parse_qs(url.query)
+                try:
+                    if path == "/api/funds":
+                        return self._send_body(table.funds_body())
+                    if path.startswith("/api/funds/"):
+                        return self._send_body(table.fund_body(path[len("/api/funds/"):]))
+                    if path == "/api/alerts":
+                        since = int(query["since"][0]) if "since" in query else None
+                        return self._send_body(table.alerts_body(since))
+                    if path.startswith("/api/history/"):
+                        days = int(query.get("days", ["7"])[0])
+                        return self._send_body(self._history(path[len("/api/history/"):], days))
+                    if path == "/api/events":
+                        return self._stream_events(query)
+                    if path == "/api/status":
+                        return self._send_body(Body(f'W/"s{table.seq}"', _dumps(table.status())))
+                    self._send_error(404, "not found")
+                except ValueError as e:
+                    self._send_error(400, str(e))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _history(self, code, days):
+                """历史数据只在每轮结束时变化，ETag 取已完成的轮数"""
+                etag = f'W/"h{table.cycles}-{days}"'
+                if self._not_modified(etag):
+                    return Body(etag, b"")
+                from history_store import scan_fund
+                since = datetime.now() - timedelta(days=days) if days else None
+                records = [dict(r, time=r['time'].strftime("%Y-%m-%d %H:%M:%S"))
+                           for r in scan_fund(code, since)]
+                return Body(etag, _dumps({'code': code, 'records': [
+                    {key: _clean(value) for key, value in r.items()} for r in records]}))
+
+            def _stream_events(self, query):
+                """Server-Sent Events：断线重连时按 Last-Event-ID 补发错过的事件"""
+                last_id = self.headers.get("Last-Event-ID") or query.get("last_id", [None])[0]
+                last = int(last_id) if last_id else table.seq
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(f"retry: {int(SERVE_KEEPALIVE * 1000)}\n\n".encode())
+                self.wfile.flush()
+                while not server.stopping.is_set():
+                    events, last = table.wait_events(last, SERVE_KEEPALIVE)
+                    if events is None:
+                        chunk = f"id: {last}\nevent: reset\ndata: {{}}\n\n".encode()
+                    elif not events:
+                        chunk = b": keepalive\n\n"
+                    else:
+                        chunk = b"".join(f"id: {seq}\nevent: {name}\ndata: ".encode() + data + b"\n\n"
+                                         for seq, name, data in events)
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+
+        return Handler
+
+
+# ---------------------------------------------------------------- 客户端（界面瘦客户端模式）
+
+class FundTableClient:
+    """API 客户端：带 ETag 重新验证的全表获取及 SSE 事件订阅"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()  # 默认请求 gzip 并自动解压
+        self.etag = None
+        self.payload = None
+
+    def fetch_funds(self):
+        """
+        获取基金表
+
+        Returns:
+            tuple: (payload, changed)，未变化 (304) 时 changed 为 False、payload 为上次结果
+        """
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = self.session.get(f"{self.base_url}/api/funds", headers=headers, timeout=10)
+        if response.status_code == 304:
+            return self.payload, False
+        response.raise_for_status()
+        self.etag = response.headers.get("ETag")
+        self.payload = response.json()
+        return self.payload, True
+
+    def iter_events(self, last_id=None):
+        """
+        订阅变更事件，连接断开时抛出异常
+
+        使用 http.client 逐行读取：requests 的 iter_lines 会等缓冲区填满才返回，事件会被延迟。
+
+        Yields:
+            tuple: (事件序号, 事件名, 数据)
+        """
+        import http.client
+        url = urlparse(self.base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(url.hostname, url.port, timeout=SERVE_KEEPALIVE * 2)
+        headers = {"Accept": "text/event-stream"}
+        if last_id is not None:
+            headers["Last-Event-ID"] = str(last_id)
+        try:
+            connection.request("GET", url.path.rstrip("/") + "/api/events", headers=headers)
+            response = connection.getresponse()
+            if response.status != 200:
+                raise ConnectionError(f"HTTP {response.status}")
+            event = {}
+            while True:
+                line = response.readline()
+                if not line:
+                    raise ConnectionError("服务器关闭了连接")
+                line = line.decode('utf-8').rstrip("\r\n")
+                if line:
+                    if not line.startswith(":"):
+                        field, _, value = line.partition(":")
+                        event[field] = value[1:] if value.startswith(" ") else value
+                    continue
+                if 'data' in event:
+                    yield int(event['id']) if event.get('id') else None, event.get('event', 'message'), \
+                        json.loads(event['data'])
+                event = {}
+        finally:
+            connection.close()
+
+
+# ---------------------------------------------------------------- 服务模式入口
+
+def parse_address(text):
+    """'8700' / '0.0.0.0:8700' -> (host, port)；为空时使用默认端口"""
+    host, _, port = str(text or "").rpartition(":")
+    return host or "127.0.0.1", int(port) if port else SERVE_DEFAULT_PORT
+
+
+def load_snapshot_rows():
+    """将本地快照按当前阈值计算为基金表行"""
+    from snapshot import load_snapshot
+    from calculator import calculate_premium_discount, get_status, select_nav
+    from rules import load_rule_engine
+
+    funds, saved_at = load_snapshot()
+    p_threshold = config.get("premium_threshold")
+    d_threshold = config.get("discount_threshold")
+    nav_source = config.get("nav_source")
+    rows = []
+    for fund in funds:
+        nav_price, nav_estimated = select_nav(fund['nav_price'], fund.get('est_nav'), nav_source)
+        premium_rate, discount_rate = calculate_premium_discount(fund['market_price'], nav_price)
+        status = get_status(premium_rate, discount_rate, p_threshold, d_threshold)
+        rows.append(build_row(fund, nav_price, nav_estimated, premium_rate, discount_rate, None, status))
+    rule_engine = load_rule_engine()
+    if rule_engine and rows:
+        for row, status in zip(rows, rule_engine.evaluate(rows, p_threshold, d_threshold)):
+            row['status'] = status
+    return rows, saved_at
+
+
+def run_server(address, interval=SERVE_CYCLE_INTERVAL, profile=False):
+    """
+    启动 HTTP API 并循环执行监控（Ctrl+C 退出）
+
+    Args:
+        address: 监听地址 '[HOST:]PORT'
+        interval: 两轮监控开始时间的间隔（秒）
+    """
+    from cli import LOFMonitorCLI
+
+    host, port = parse_address(address)
+    table = FundTable()
+    rows, saved_at = load_snapshot_rows()
+    if rows:
+        table.load(rows, saved_at)
+    table.load_recent_alerts()
+    server = APIServer(table, host, port).start()
+    print(f"HTTP API 已启动: {server.base_url}/api/funds  (每 {interval} 秒刷新一轮)")
+
+    cli = LOFMonitorCLI(profile=profile, publisher=table)
+    try:
+        while True:
+            started = time.time()
+            try:
+                cli.run_monitor_cycle()
+            except Exception as e:
+                print(f"监控循环出错: {e}")
+                table.end_cycle(complete=False)
+            time.sleep(max(0.0, interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        print("\n正在停止 HTTP API...")
+    finally:
+        server.stop()
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 阈值回测模块
+
+在历史溢价率数据上评估一组 (溢价阈值, 折价阈值) 组合，判定语义与实时监控一致：
+    - 状态判定同 calculator.get_status：溢价率 >= 溢价阈值为溢价告警，否则折价率 >= 折价阈值为折价告警
+    - 同一基金每天最多告警一次（同 ConfigManager 的每日去重），取当天第一次越过阈值的时刻
+对每个组合输出告警次数、命中率（告警后 N 个交易日内溢价率收敛过半的比例）及平均收敛幅度。
+
+数据来源:
+    history   history/ 目录中每轮监控保存的数据（见 history_store），一天内可有多轮
+    akshare   全部 LOF 的历史收盘价与单位净值（首次下载后缓存到 backtest_data.pkl）；
+              盘中监控使用的是上一交易日净值，因此按 收盘价 / 前一净值 计算溢价率
+
+计算按 基金 × 日期 × 阈值 向量化：先求每只基金每天溢价率/折价率的累计最大值（单调），
+任意阈值当天首次越过的时刻即可一次比较得到，整个网格只需按溢价阈值循环一次。
+
+用法:
+    python main.py backtest                                    # 使用本地历史数据，默认网格
+    python main.py backtest --source akshare --days 365        # 下载一年的收盘价/净值
+    python main.py backtest --premium 2:20:2 --discount 3,5,8 --horizon 5 --csv grid.csv
+"""
+
+import os
+import math
+import pickle
+import threading
+from datetime import datetime, timedelta
+from config import BACKTEST_DATA_FILE
+from metrics import metrics
+
+DATA_VERSION = 1
+
+# akshare 历史行情/净值接口访问的主机（用于指标统计）
+EASTMONEY_HIST_HOST = "push2his.eastmoney.com"
+EASTMONEY_NAV_HOST = "fund.eastmoney.com"
+
+# 下载历史数据的并发数
+FETCH_WORKERS = 8
+
+
+class PremiumPanel:
+    """
+    溢价率面板数据
+
+    Attributes:
+        codes: 基金代码列表 (F)
+        values: 带符号溢价率矩阵 F × T（%，缺失为 NaN）
+        day_starts: 每个交易日在时间轴上的起始下标 (D)，时间轴按时间升序
+        days: 交易日列表 (D)
+    """
+
+    def __init__(self, codes, values, day_starts, days):
+        self.codes = codes
+        self.values = values
+        self.day_starts = day_starts
+        self.days = days
+
+
+# ------------------------------------------------------------ 数据加载
+
+def load_history_panel(since=None, until=None):
+    """
+    由 history/ 中保存的每轮监控数据构建面板
+
+    Args:
+        since, until: 日期范围 'YYYY-MM-DD'，None 表示不限
+
+    Returns:
+        PremiumPanel: 面板数据；没有历史数据返回 None
+    """
+    import numpy as np
+    from history_store import list_days, iter_blocks
+
+    blocks, day_starts, days = [], [], []
+    for date in list_days():
+        if (since and date < since) or (until and date > until):
+            continue
+        day_blocks = list(iter_blocks(date))
+        if day_blocks:
+            day_starts.append(len(blocks))
+            days.append(date)
+            blocks.extend(day_blocks)
+    if not blocks:
+        return None
+
+    codes = sorted({code for block in blocks for code in block['codes']})
+    row = {code: i for i, code in enumerate(codes)}
+    values = np.full((len(codes), len(blocks)), np.nan)
+    for t, block in enumerate(blocks):
+        rows = np.fromiter((row[code] for code in block['codes']), dtype=np.intp, count=len(block['codes']))
+        values[rows, t] = np.frombuffer(block['premium'], dtype=float)
+    return PremiumPanel(codes, values, np.asarray(day_starts), days)
+
+
+def _load_universe():
+    """LOF 基金代码列表"""
+    from universe import universe_codes
+    return universe_codes("lof")
+
+
+def fetch_fund_series(code, start_date, end_date):
+    """
+    下载单只基金的历史收盘价与单位净值
+
+    Returns:
+        tuple: (dates, premiums) 交易日 'YYYY-MM-DD' 列表及对应的带符号溢价率 (%)；失败返回 None
+    """
+    import pandas as pd
+    import akshare as ak
+
+    try:
+        with metrics.track("backtest_fetch", EASTMONEY_HIST_HOST) as span:
+            price_df = ak.fund_lof_hist_em(symbol=code, period="daily", start_date=start_date.replace("-", ""),
+                                           end_date=end_date.replace("-", ""), adjust="")
+            if price_df is None or price_df.empty:
+                span.outcome = 'failure'
+                return None
+        with metrics.track("backtest_fetch", EASTMONEY_NAV_HOST) as span:
+            nav_df = ak.fund_open_fund_info_em(symbol=code, indicator="单位净值走势")
+            if nav_df is None or nav_df.empty:
+                span.outcome = 'failure'
+                return None
+    except Exception:
+        return None
+
+    # 按位置取列，避免编码问题导致的列名匹配失败：日期, 开盘, 收盘 / 净值日期, 单位净值
+    prices = pd.DataFrame({'date': pd.to_datetime(price_df.iloc[:, 0]),
+                           'close': pd.to_numeric(price_df.iloc[:, 2], errors='coerce')})
+    navs = pd.DataFrame({'date': pd.to_datetime(nav_df.iloc[:, 0]),
+                         'nav': pd.to_numeric(nav_df.iloc[:, 1], errors='coerce')}).dropna()
+    # 每个交易日对应此前最近一次公布的净值
+    merged = pd.merge_asof(prices.sort_values('date'), navs.sort_values('date'), on='date',
+                           allow_exact_matches=False).dropna()
+    merged = merged[merged['nav'] > 0]
+    premiums = (merged['close'] / merged['nav'] - 1) * 100
+    return merged['date'].dt.strftime('%Y-%m-%d').tolist(), premiums.round(4).tolist()
+
+
+def load_akshare_panel(days=365, refresh=False, progress_callback=None):
+    """
+    下载（或读取缓存的）全部 LOF 的历史收盘价/净值并构建面板
+
+    Args:
+        days: 回溯天数
+        refresh: 忽略缓存重新下载
+        progress_callback: 进度回调 (done, total)
+
+    Returns:
+        PremiumPanel: 面板数据；没有可用数据返回 None
+    """
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+
+    end_date = datetime.now().strftime("%Y-%m-%d")
+    start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    # 缓存按基金保存，同一天内重复回测不再下载
+    cache = {}
+    if not refresh and os.path.exists(BACKTEST_DATA_FILE):
+        try:
+            with open(BACKTEST_DATA_FILE, 'rb') as f:
+                payload = pickle.load(f)
+            if (payload.get('version') == DATA_VERSION and payload.get('fetched') == end_date
+                    and payload.get('start') <= start_date):
+                cache = payload['series']
+        except Exception as e:
+            print(f"读取回测数据缓存失败: {e}，将重新下载")
+
+    codes = _load_universe()
+    missing = [code for code in codes if code not in cache]
+    if missing:
+        lock = threading.Lock()
+        done = [0]
+
+        def fetch(code):
+            series = fetch_fund_series(code, start_date, end_date)
+            with lock:
+                done[0] += 1
+                if progress_callback:
+                    progress_callback(done[0], len(missing))
+            return code, series
+
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            for code, series in executor.map(fetch, missing):
+                cache[code] = series
+        try:
+            with open(BACKTEST_DATA_FILE, 'wb') as f:
+                pickle.dump({'version': DATA_VERSION, 'fetched': end_date, 'start': start_date, 'series': cache},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"保存回测数据缓存失败: {e}")
+
+    universe = set(codes)
+    series = {code: s for code, s in cache.items() if s and code in universe}
+    dates = sorted({d for ds, _ in series.values() for d in ds if d >= start_date})
+    if not series or not dates:
+        return None
+    column = {d: i for i, d in enumerate(dates)}
+    fund_codes = sorted(series)
+    values = np.full((len(fund_codes), len(dates)), np.nan)
+    for i, code in enumerate(fund_codes):
+        ds, ps = series[code]
+        for d, p in zip(ds, ps):
+            t = column.get(d)
+            if t is not None:
+                values[i, t] = p
+    # 日线数据每天一个时间点
+    return PremiumPanel(fund_codes, values, np.arange(len(dates)), dates)
+
+
+# ------------------------------------------------------------ 回测计算
+
+def _day_running_max(values, day_starts):
+    """按交易日分段的累计最大值"""
+    import numpy as np
+    out = np.empty_like(values)
+    bounds = list(day_starts) + [values.shape[1]]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        out[:, start:end] = np.maximum.accumulate(values[:, start:end], axis=1)
+    return out
+
+
+def _first_cross(running, day_starts, thresholds):
+    """
+    每只基金每天首次越过各阈值的时间下标
+
+    Args:
+        running: 按天分段单调不减的矩阵 F × T
+        thresholds: 阈值数组 (K)
+
+    Returns:
+        ndarray: F × D × K 时间下标，当天未越过为 -1
+    """
+    import numpy as np
+    n_funds, n_times = running.shape
+    bounds = list(day_starts) + [n_times]
+    result = np.full((n_funds, len(day_starts), len(thresholds)), -1, dtype=np.int64)
+    for k, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        crossed = running[:, start:end, None] >= thresholds  # F × 段长 × K
+        hit = crossed[:, -1, :]  # 单调：当天最后时刻越过即当天越过
+        result[:, k, :] = np.where(hit, start + crossed.argmax(axis=1), -1)
+    return result
+
+
+def run_backtest(panel, premium_thresholds, discount_thresholds, horizon=3, hit_ratio=0.5):
+    """
+    在面板数据上评估阈值网格
+
+    Args:
+        panel: PremiumPanel
+        premium_thresholds, discount_thresholds: 阈值列表 (%)
+        horizon: 告警后观察收敛的交易日数
+        hit_ratio: 溢价率收敛达到告警时绝对值的该比例视为命中
+
+    Returns:
+        list: 每个组合一个结果字典，顺序为 溢价阈值 × 折价阈值
+    """
+    import numpy as np
+
+    values = panel.values
+    n_funds, n_times = values.shape
+    n_days = len(panel.day_starts)
+    pt = np.asarray(premium_thresholds, dtype=float)
+    dt = np.asarray(discount_thresholds, dtype=float)
+
+    # get_status 中缺失的比率按 0 处理；溢价率/折价率为带符号溢价率的正/负部分
+    premium = np.where(np.isnan(values), 0.0, np.maximum(values, 0.0))
+    discount = np.where(np.isnan(values), 0.0, np.maximum(-values, 0.0))
+    first_p = _first_cross(_day_running_max(premium, panel.day_starts), panel.day_starts, pt)
+    first_d = _first_cross(_day_running_max(discount, panel.day_starts), panel.day_starts, dt)
+
+    # 每只基金每个交易日最后一个有效值，用于观察告警后的收敛
+    bounds = list(panel.day_starts) + [n_times]
+    day_close = np.full((n_funds, n_days), np.nan)
+    for k, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        segment = values[:, start:end]
+        valid = ~np.isnan(segment)
+        last = segment.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+        day_close[:, k] = np.where(valid.any(axis=1), segment[np.arange(n_funds), last], np.nan)
+    future = np.full_like(day_close, np.nan)
+    if horizon < n_days:
+        future[:, :n_days - horizon] = day_close[:, horizon:]
+
+    flat = values.reshape(-1)
+    row_offset = (np.arange(n_funds) * n_times)[:, None]
+    value_d = flat[row_offset[..., None] + np.maximum(first_d, 0)]  # F × D × B
+
+    results = []
+    for a, p_limit in enumerate(pt):
+        tp = first_p[:, :, a, None]  # F × D × 1
+        has_p = tp >= 0
+        has_d = first_d >= 0
+        # 当天先越过的一侧告警（同一时刻溢价优先，同 get_status 的判定顺序），之后当天不再告警
+        is_p = has_p & (~has_d | (tp <= first_d))
+        is_d = has_d & ~is_p
+        alerted = is_p | is_d
+
+        value_p = flat[row_offset + np.maximum(first_p[:, :, a], 0)][..., None]
+        start = np.where(is_p, value_p, value_d)
+        # 收敛幅度：溢价告警看溢价率回落，折价告警看折价率回升，单位为百分点
+        decay = np.where(is_p, start - future[..., None], future[..., None] - start)
+        measurable = alerted & ~np.isnan(decay)
+        hits = measurable & (decay >= hit_ratio * np.abs(start))
+
+        alert_counts = alerted.sum(axis=(0, 1))
+        premium_counts = is_p.sum(axis=(0, 1))
+        measured = measurable.sum(axis=(0, 1))
+        hit_counts = hits.sum(axis=(0, 1))
+        decay_sums = np.where(measurable, decay, 0.0).sum(axis=(0, 1))
+        fund_counts = alerted.any(axis=1).sum(axis=0)
+        for b, d_limit in enumerate(dt):
+            results.append({
+                'premium_threshold': float(p_limit),
+                'discount_threshold': float(d_limit),
+                'alerts': int(alert_counts[b]),
+                'premium_alerts': int(premium_counts[b]),
+                'discount_alerts': int(alert_counts[b] - premium_counts[b]),
+                'per_day': alert_counts[b] / n_days if n_days else 0.0,
+                'funds': int(fund_counts[b]),
+                'measured': int(measured[b]),
+                'hit_rate': hit_counts[b] / measured[b] if measured[b] else None,
+                'avg_decay': decay_sums[b] / measured[b] if measured[b] else None
+            })
+    return results
+
+
+# ------------------------------------------------------------ 命令行
+
+def parse_grid(text):
+    """解析阈值网格：'2:20:2'（起:止:步长，含终点）或 '3,5,8'"""
+    if ":" in text:
+        parts = [float(x) for x in text.split(":")]
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) > 2 else 1.0
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 6) for i in range(max(count, 0))]
+    return [float(x) for x in text.split(",") if x.strip()]
+
+
+def _fmt(value, digits, suffix=""):
+    return f"{value:.{digits}f}{suffix}" if value is not None else "N/A"
+
+
+def run_backtest_command(args):
+    """执行 backtest 子命令"""
+    import time
+
+    premium_grid = parse_grid(args.premium)
+    discount_grid = parse_grid(args.discount)
+    if not premium_grid or not discount_grid:
+        print("阈值网格为空")
+        return
+
+    if args.source == "akshare":
+        def progress(done, total):
+            if done % 20 == 0 or done == total:
+                print(f"\r下载历史数据: {done}/{total}", end="", flush=True)
+        panel = load_akshare_panel(args.days, args.refresh, progress)
+        print()
+    else:
+        since = (datetime.now() - timedelta(days=args.days)).strftime("%Y-%m-%d") if args.days else None
+        panel = load_history_panel(since)
+    if panel is None:
+        print("没有可用的历史数据" + ("（先运行监控积累 history/ 数据，或使用 --source akshare）"
+                                     if args.source == "history" else ""))
+        return
+
+    started = time.perf_counter()
+    results = run_backtest(panel, premium_grid, discount_grid, args.horizon, args.hit_ratio)
+    elapsed = time.perf_counter() - started
+
+    print(f"[阈值回测] {panel.days[0]} ~ {panel.days[-1]}  基金 {len(panel.codes)}  交易日 {len(panel.days)}  "
+          f"时间点 {panel.values.shape[1]}  组合 {len(results)}  耗时 {elapsed:.2f}s")
+    print(f"命中: 告警后 {args.horizon} 个交易日内溢价率收敛达到告警时的 {args.hit_ratio:.0%}")
+
+    if args.csv:
+        import csv
+        with open(args.csv, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"已导出 {len(results)} 个组合到 {args.csv}")
+
+    rows = results
+    if args.min_alerts:
+        rows = [r for r in rows if r['measured'] >= args.min_alerts]
+    if args.sort != "grid":
+        rows = sorted(rows, key=lambda r: r[args.sort] if r[args.sort] is not None else float('-inf'),
+                      reverse=True)
+    if args.top:
+        rows = rows[:args.top]
+
+    from cli import align_text
+    headers = ['溢价阈值', '折价阈值', '告警', '溢价', '折价', '日均', '基金', '命中率', '平均收敛']
+    widths = [10, 10, 8, 8, 8, 9, 7, 9, 11]
+    print("".join(align_text(h, w, 'right') for h, w in zip(headers, widths)))
+    for r in rows:
+        hit_rate = r['hit_rate'] * 100 if r['hit_rate'] is not None else None
+        cells = [f"{r['premium_threshold']:.2f}", f"{r['discount_threshold']:.2f}", r['alerts'],
+                 r['premium_alerts'], r['discount_alerts'], f"{r['per_day']:.2f}", r['funds'],
+                 _fmt(hit_rate, 1, '%'), _fmt(r['avg_decay'], 2, 'pp')]
+        print("".join(align_text(c, w, 'right') for c, w in zip(cells, widths)))
+
+
+def add_backtest_parser(subparsers):
+    """注册 backtest 子命令参数"""
+    p = subparsers.add_parser("backtest", help="Backtest premium/discount threshold grids on historical data")
+    p.add_argument("--source", choices=["history", "akshare"], default="history",
+                   help="数据来源: history（本地监控历史，默认）或 akshare（下载历史收盘价/净值）")
+    p.add_argument("--days", type=int, default=365, help="回溯天数 (默认365，0表示全部本地历史)")
+    p.add_argument("--premium", default="1:20:1", help="溢价阈值网格，如 2:20:2 或 3,5,8 (默认 1:20:1)")
+    p.add_argument("--discount", default="1:20:1", help="折价阈值网格 (默认 1:20:1)")
+    p.add_argument("--horizon", type=int, default=3, help="观察收敛的交易日数 (默认3)")
+    p.add_argument("--hit-ratio", type=float, default=0.5, help="收敛达到告警时溢价率的该比例视为命中 (默认0.5)")
+    p.add_argument("--sort", choices=["grid", "hit_rate", "avg_decay", "alerts"], default="grid",
+                   help="结果排序方式 (默认按网格顺序)")
+    p.add_argument("--top", type=int, default=0, help="只显示前N个组合")
+    p.add_argument("--min-alerts", type=int, default=0, help="只显示可评估告警数不少于该值的组合")
+    p.add_argument("--csv", help="导出全部组合到 CSV 文件")
+    p.add_argument("--refresh", action="store_true", help="忽略缓存重新下载历史数据 (akshare)")
+    return p
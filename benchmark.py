@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 性能基准模块
+
+用法:
+    python benchmark.py startup                      # 启动耗时基准
+    python benchmark.py startup --max-menu-ms 300    # 超出预算时返回非零退出码（回归检查）
+    python benchmark.py micro                        # 计算/渲染热点路径微基准
+    python benchmark.py micro --baseline             # 与 benchmark_baseline.json 对比，退化时返回非零退出码
+    python benchmark.py micro --save-baseline benchmark_baseline.json
+    xvfb-run -a python benchmark.py micro --suite ui  # 无显示器时在 Xvfb 下执行UI套件
+"""
+
+import os
+import sys
+import json
+import random
+import timeit
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_FILE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+
+# 与基线相比允许的退化比例（比较各轮相对参考负载耗时的中位数，偶发的慢轮次和机器整体快慢不影响结果）
+DEFAULT_TOLERANCE = 0.25
+
+# 受内存分配/GC/窗口系统影响、进程间波动较大的用例（HTML解析、配置去重读取系统时钟、Tk渲染）的容忍度，写入基线条目
+NOISY_TOLERANCE = 0.5
+
+# 微基准每个用例的计时轮数
+DEFAULT_REPEAT = 7
+
+# 启动路径上不应加载的重量级模块
+HEAVY_MODULES = ("akshare", "pandas", "bs4", "requests", "tkinter")
+
+# 每个场景在独立解释器中执行，脚本结束时向 stdout 输出一行 JSON 结果
+STARTUP_SCENARIOS = {
+    # 终端模式：经 main 的参数解析（含各子命令的注册）到打印出第一个菜单
+    "cli_menu": """
+import sys
+import cli
+cli.LOFMonitorCLI.start = cli.LOFMonitorCLI.print_menu
+sys.argv = ["main.py", "-t"]
+import main
+main.main()
+""",
+    # 单次运行模式：导入到发起第一次数据请求前（加载数据获取依赖）
+    "run_once_first_fetch": """
+import cli
+import data_fetcher
+import pandas, akshare, requests, bs4
+""",
+}
+
+SCENARIO_TEMPLATE = """
+import io, sys, time, json, contextlib
+_t0 = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+{body}
+_elapsed = (time.perf_counter() - _t0) * 1000
+print(json.dumps({{"elapsed_ms": _elapsed, "modules": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def run_startup_scenario(name, repeat=5):
+    """
+    在独立子进程中多次执行启动场景
+
+    Args:
+        name: 场景名称 (STARTUP_SCENARIOS 的键)
+        repeat: 重复次数
+
+    Returns:
+        dict: {'median_ms', 'min_ms', 'max_ms', 'heavy_modules'}
+    """
+    body = "\n".join("    " + line for line in STARTUP_SCENARIOS[name].strip().splitlines())
+    script = SCENARIO_TEMPLATE.format(body=body, heavy=HEAVY_MODULES)
+
+    samples = []
+    modules = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", script], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=120)
+        if proc.returncode != 0:
+            raise RuntimeError(f"场景 {name} 执行失败: {proc.stderr.strip()}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(result["elapsed_ms"])
+        modules = result["modules"]
+
+    return {
+        "median_ms": round(statistics.median(samples), 2),
+        "min_ms": round(min(samples), 2),
+        "max_ms": round(max(samples), 2),
+        "heavy_modules": modules
+    }
+
+
+def run_startup_benchmarks(repeat=5):
+    """执行全部启动场景"""
+    return {name: run_startup_scenario(name, repeat) for name in STARTUP_SCENARIOS}
+
+
+def check_startup(results, max_menu_ms):
+    """
+    启动回归检查
+
+    Returns:
+        list: 失败原因列表，空列表表示通过
+    """
+    failures = []
+    menu = results.get("cli_menu")
+    if menu:
+        if menu["heavy_modules"]:
+            failures.append(f"cli_menu 加载了重量级模块: {', '.join(menu['heavy_modules'])}")
+        if max_menu_ms and menu["median_ms"] > max_menu_ms:
+            failures.append(f"cli_menu 启动耗时 {menu['median_ms']}ms 超出预算 {max_menu_ms}ms")
+    return failures
+
+
+# ---------------------------------------------------------------- 微基准
+
+def reference_workload():
+    """固定的纯 Python 负载（字典、字符串格式化、浮点运算），用于换算机器当前的速度"""
+    table = {}
+    for i in range(2000):
+        key = f"{i:06d}"
+        table[key] = table.get(key, 0.0) + i * 1.5
+    return sum(len(key) for key in table)
+
+
+def time_case(func, number=None, repeat=DEFAULT_REPEAT):
+    """
+    多次执行并统计耗时，每轮先测一次参考负载再测用例
+
+    机器的速度在进程之间甚至进程内会整体波动（共享 CPU、频率调节），
+    与基线对比时使用各轮 用例耗时/参考耗时 的中位数，两者同时变慢时不算退化。
+
+    Args:
+        func: 无参可调用对象
+        number: 每轮调用次数，默认自动选择使每轮至少约 0.2 秒（单次很快的用例计时噪声较大）
+        repeat: 轮数
+
+    Returns:
+        dict: {'median_ms', 'min_ms', 'relative'}（单次调用耗时，相对参考负载的耗时倍数）
+    """
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    reference = timeit.Timer(reference_workload)
+    ref_number, _ = reference.autorange()
+    samples, ratios = [], []
+    for _ in range(repeat):
+        ref_time = reference.timeit(ref_number) / ref_number
+        case_time = timer.timeit(number) / number
+        samples.append(case_time * 1000)
+        ratios.append(case_time / ref_time)
+    return {"median_ms": round(statistics.median(samples), 4), "min_ms": round(min(samples), 4),
+            "relative": round(statistics.median(ratios), 4)}
+
+
+def make_fund_rows(count, seed=0):
+    """生成合成的 (场内价格, 场外净值) 数据"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        nav = rng.uniform(0.5, 3.0)
+        rows.append((round(nav * (1 + rng.uniform(-0.4, 0.4)), 3), round(nav, 4)))
+    return rows
+
+
+def bench_compute(sizes=(1000, 10000, 100000)):
+    """calculate_premium_discount + get_status 全表计算"""
+    from calculator import calculate_premium_discount, get_status
+
+    results = {}
+    for size in sizes:
+        rows = make_fund_rows(size)
+
+        def run():
+            for market_price, nav_price in rows:
+                premium_rate, discount_rate = calculate_premium_discount(market_price, nav_price)
+                get_status(premium_rate, discount_rate, 10.0, 10.0)
+
+        result = time_case(run)
+        result["items"] = size
+        results[f"calc_status_{size}"] = result
+    return results
+
+
+def bench_align(rows=1000):
+    """cli.align_text 行格式化（与 run_monitor_cycle 相同的列宽）"""
+    from cli import align_text
+
+    widths = (8, 20, 8, 8, 10, 10, 10, 20)
+    data = [
+        (f"{160000 + i:06d}", f"合成债券LOF{i}", "1.2345", "1.1000", "12.23%", "N/A", "⚠️ 溢价", "暂停申购 开放赎回")
+        for i in range(rows)
+    ]
+
+    def run():
+        for cells in data:
+            "".join(align_text(cell, width) for cell, width in zip(cells, widths))
+
+    result = time_case(run)
+    result["items"] = rows
+    return {f"align_rows_{rows}": result}
+
+
+def bench_parse(recording=None, pages=20):
+    """extract_fund_state 详情页HTML解析（录制页面或合成页面）"""
+    from data_fetcher import extract_fund_state
+
+    if recording:
+        from replay import load_recording
+        html_list = [html for html in load_recording(recording)["pages"].values() if html][:pages]
+    else:
+        from replay import build_synthetic_universe
+        html_list = list(build_synthetic_universe(pages)["pages"].values())
+    if not html_list:
+        return {}
+
+    def run():
+        for html in html_list:
+            extract_fund_state(html)
+
+    result = time_case(run)
+    result["items"] = len(html_list)
+    result["tolerance"] = NOISY_TOLERANCE
+    return {f"parse_state_{len(html_list)}_pages": result}
+
+
+def bench_config(alerted=500, checks=10000):
+    """ConfigManager 每日去重检查 (is_fund_alerted)"""
+    import config as config_module
+
+    manager = config_module.config
+    saved_file = config_module.CONFIG_FILE
+    tmp_dir = tempfile.mkdtemp(prefix="lof_bench_")
+    # 指向临时配置文件，避免基准测试改写真实 config.json
+    config_module.CONFIG_FILE = os.path.join(tmp_dir, "config.json")
+    try:
+        manager.check_reset_daily_alerts()
+        for i in range(alerted):
+            manager.mark_fund_alerted(f"{160000 + i:06d}")
+        codes = [f"{160000 + i * 7:06d}" for i in range(checks)]
+
+        def run():
+            for code in codes:
+                manager.is_fund_alerted(code)
+
+        result = time_case(run)
+        result["items"] = checks
+        result["tolerance"] = NOISY_TOLERANCE
+        return {f"config_dedup_{alerted}x{checks}": result}
+    finally:
+        manager.flush()
+        config_module.CONFIG_FILE = saved_file
+        manager.load_config()
+
+
+def bench_ui(rows=2000):
+    """LOFMonitorApp.refresh_table / apply_sort_data（隐藏窗口的 Tk）"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"跳过UI基准: 无法创建Tk窗口 ({e})")
+        return {}
+
+    try:
+        root.withdraw()
+        from ui import LOFMonitorApp
+        from calculator import calculate_premium_discount, get_status
+
+        app = LOFMonitorApp(root)
+        app.stale_codes = set()
+        funds = []
+        for i, (market_price, nav_price) in enumerate(make_fund_rows(rows)):
+            premium_rate, discount_rate = calculate_premium_discount(market_price, nav_price)
+            funds.append({
+                'code': f"{160000 + i:06d}", 'name': f"合成LOF{i}",
+                'market_price': market_price, 'nav_price': nav_price,
+                'premium_rate': premium_rate, 'discount_rate': discount_rate,
+                'status': get_status(premium_rate, discount_rate, 10.0, 10.0),
+                'fund_state': "开放申购 开放赎回"
+            })
+        app.fund_data = funds
+
+        results = {f"ui_refresh_table_{rows}": time_case(app.refresh_table)}
+
+        app.sort_column = "premium_rate"
+
+        def sort():
+            app.sort_reverse = not app.sort_reverse
+            app.apply_sort_data()
+
+        results[f"ui_apply_sort_{rows}"] = time_case(sort)
+        for result in results.values():
+            result["items"] = rows
+            result["tolerance"] = NOISY_TOLERANCE
+        return results
+    finally:
+        root.destroy()
+
+
+MICRO_SUITES = {
+    "compute": bench_compute,
+    "align": bench_align,
+    "parse": bench_parse,
+    "config": bench_config,
+    "ui": bench_ui,
+}
+
+
+def run_micro_benchmarks(suites=None, recording=None):
+    """
+    执行微基准
+
+    Args:
+        suites: 要执行的套件名称列表，None 表示全部
+        recording: parse 套件使用的录制数据文件
+
+    Returns:
+        dict: {用例名: {'median_ms', 'min_ms', 'relative', 'items'[, 'tolerance']}}
+    """
+    results = {}
+    for name in suites or MICRO_SUITES:
+        if name == "parse":
+            results.update(bench_parse(recording))
+        else:
+            results.update(MICRO_SUITES[name]())
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    与基线对比：两边都有 relative 时比较相对参考负载的耗时倍数，否则比较耗时中位数；
+    基线条目可用 tolerance 字段单独设置该用例的容忍度
+
+    Returns:
+        list: 超出容忍度的退化项 (用例名, 当前耗时中位数, 基线耗时中位数, 变化比例)
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("median_ms"):
+            continue
+        change = result["median_ms"] / base["median_ms"] - 1
+        if result.get("relative") and base.get("relative"):
+            change = result["relative"] / base["relative"] - 1
+        result["baseline_ms"] = base["median_ms"]
+        result["change"] = round(change, 4)
+        if change > base.get("tolerance", tolerance):
+            regressions.append((name, result["median_ms"], base["median_ms"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LOF基金监控性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_startup = sub.add_parser("startup", help="启动耗时基准（导入到首个菜单/首次获取）")
+    p_startup.add_argument("--repeat", type=int, default=5, help="每个场景重复次数")
+    p_startup.add_argument("--max-menu-ms", type=float, default=0, help="终端菜单启动耗时预算 (ms)，0 表示不检查耗时")
+    p_startup.add_argument("--json", dest="json_path", help="结果输出到 JSON 文件")
+    p_micro = sub.add_parser("micro", help="计算/渲染热点路径微基准")
+    p_micro.add_argument("--suite", action="append", choices=sorted(MICRO_SUITES), help="只执行指定套件（可重复）")
+    p_micro.add_argument("--recording", help="parse 套件使用的录制数据文件（默认使用合成页面）")
+    p_micro.add_argument("--json", dest="json_path", help="结果输出到 JSON 文件")
+    p_micro.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE_FILE,
+                         help="与基线文件对比（不指定文件时使用 benchmark_baseline.json）")
+    p_micro.add_argument("--save-baseline", metavar="FILE", help="将结果保存为基线文件")
+    p_micro.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的退化比例")
+    args = parser.parse_args()
+
+    if args.command == "micro":
+        run_micro_command(args)
+        return
+
+    results = run_startup_benchmarks(args.repeat)
+    for name, r in results.items():
+        heavy = ", ".join(r["heavy_modules"]) or "-"
+        print(f"{name:<24} median {r['median_ms']:>9.2f}ms  min {r['min_ms']:>9.2f}ms  已加载: {heavy}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"startup": results}, f, indent=4, ensure_ascii=False)
+
+    failures = check_startup(results, args.max_menu_ms)
+    for reason in failures:
+        print(f"[回归] {reason}")
+    sys.exit(1 if failures else 0)
+
+
+def run_micro_command(args):
+    """执行微基准命令"""
+    results = run_micro_benchmarks(args.suite, args.recording)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+
+    for name, r in results.items():
+        line = f"{name:<32} median {r['median_ms']:>10.4f}ms  min {r['min_ms']:>10.4f}ms"
+        if "change" in r:
+            line += f"  基线median {r['baseline_ms']:.4f}ms ({r['change']:+.1%})"
+        print(line)
+
+    payload = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, indent=4, ensure_ascii=False)
+
+    for name, current, base, change in regressions:
+        print(f"[回归] {name}: {current:.4f}ms，基线 {base:.4f}ms ({change:+.1%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -40,7 +40,39 @@ def calculate_premium_discount(market_price, nav_price):
         return 0, 0
 
 
-def get_status(premium_rate, discount_rate, premium_threshold, discount_threshold):
+def select_nav(nav_price, est_nav, nav_source="official"):
+    """
+    选择计算溢价率使用的净值
+    
+    Args:
+        nav_price: 官方公布的场外净值（通常为上一交易日）
+        est_nav: 按指数实时行情估算的净值（见 iopv），无法估算时为 None
+        nav_source: "official" 使用官方净值，"estimated" 优先使用估算净值
+        
+    Returns:
+        tuple: (净值, 是否为估算值)
+    """
+    if nav_source == "estimated" and est_nav is not None:
+        return est_nav, True
+    return nav_price, False
+
+
+def signed_premium(premium_rate, discount_rate):
+    """
+    将互斥的溢价率/折价率合并为一个带符号的比率（折价为负）
+    
+    Returns:
+        float: 带符号比率，无法计算时返回 None
+    """
+    if premium_rate:
+        return premium_rate
+    if discount_rate:
+        return -discount_rate
+    return 0.0 if premium_rate is not None or discount_rate is not None else None
+
+
+def get_status(premium_rate, discount_rate, premium_threshold, discount_threshold,
+               zscore=None, zscore_threshold=0):
     """
     判断基金状态
     
@@ -49,9 +81,11 @@ def get_status(premium_rate, discount_rate, premium_threshold, discount_threshol
         discount_rate: 折价率
         premium_threshold: 溢价阈值
         discount_threshold: 折价阈值
+        zscore: 溢价率相对该基金历史的 z 分数（见 rolling_stats）
+        zscore_threshold: z 分数绝对值达到该值时判定为异动，0 表示不启用
         
     Returns:
-        str: 'premium_alert' | 'discount_alert' | 'premium' | 'discount' | 'normal'
+        str: 'premium_alert' | 'discount_alert' | 'anomaly_alert' | 'premium' | 'discount' | 'normal'
     """
     if premium_rate is None:
         premium_rate = 0
@@ -62,6 +96,8 @@ def get_status(premium_rate, discount_rate, premium_threshold, discount_threshol
         return 'premium_alert'  # 溢价超过阈值，需要告警
     elif discount_rate >= discount_threshold:
         return 'discount_alert'  # 折价超过阈值，需要告警
+    elif zscore_threshold and zscore is not None and abs(zscore) >= zscore_threshold:
+        return 'anomaly_alert'  # 未超过固定阈值，但明显偏离该基金的历史水平
     elif premium_rate > 0:
         return 'premium'  # 正常溢价
     elif discount_rate > 0:
@@ -6,24 +6,23 @@ LOF基金溢价监控程序 - 终端交互模块
 import sys
 import time
 import threading
-from config import config
-from data_fetcher import get_all_fund_data
-from calculator import calculate_premium_discount, get_status
-from notifier import send_dingtalk_alert, format_alert_message
-from logger_util import log_alert
+from config import config, NOTIFY_DRAIN_TIMEOUT, DISPLAY_WIDTH_CACHE_SIZE
+from calculator import calculate_premium_discount, get_status, signed_premium, select_nav
+from logger_util import log_alert, flush_alerts
+from metrics import metrics
 
 import unicodedata
+from functools import lru_cache
+
+@lru_cache(maxsize=DISPLAY_WIDTH_CACHE_SIZE)
+def display_width(text):
+    """字符串的显示宽度 (中文等全角字符占2，其余占1)；按字符串缓存，基金名称等反复出现的文本只计算一次"""
+    return sum(2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1 for char in text)
 
 def align_text(text, width, align='left'):
     """处理包含中文字符的字符串对齐"""
     text = str(text)
-    # 计算实际显示宽度 (中文字符占2，英文字符占1)
-    d_width = 0
-    for char in text:
-        if unicodedata.east_asian_width(char) in ('W', 'F'):
-            d_width += 2
-        else:
-            d_width += 1
+    d_width = display_width(text)
     
     padding = max(0, width - d_width)
     if align == 'left':
@@ -34,10 +33,20 @@ def align_text(text, width, align='left'):
         left = padding // 2
         return ' ' * left + text + ' ' * (padding - left)
 
+class CycleCancelled(Exception):
+    """监控循环被中止（如终端看板退出）"""
+
 class LOFMonitorCLI:
-    def __init__(self):
+    def __init__(self, profile=False, shard=None, publisher=None, sinks=None):
         self.running = False
         self.monitor_thread = None
+        self.profile = profile  # 是否对监控循环进行性能剖析
+        self.shard = shard  # 分片运行 (index, count)，结果写入分片文件由 merge 合并
+        self.publisher = publisher  # HTTP API 模式下的共享基金表 (api_server.FundTable)
+        self.sinks = sinks or []  # --output 结果输出 (sinks.OutputSink)，每算完一只基金写入一条记录
+        from delta import DeltaEngine
+        self.delta = DeltaEngine()  # 连续运行时只重新计算输入变化的基金
+        self.cancelled = False  # 由 cancel() 设置，进行中的一轮在下一只基金到达时中止
         
     def start(self):
         """启动终端交互"""
@@ -72,6 +81,9 @@ class LOFMonitorCLI:
         print(f"溢价阈值: {config.get('premium_threshold')}%")
         print(f"折价阈值: {config.get('discount_threshold')}%")
         print(f"钉钉Webhook: {config.get('dingtalk_webhook') or '未设置'}")
+        channels = [name for key, name in (("wecom_webhook", "企业微信"), ("feishu_webhook", "飞书"),
+                                           ("alert_webhook_url", "Webhook")) if config.get(key)]
+        print(f"其他通知渠道: {'、'.join(channels) or '未设置'}")
         
     def modify_config(self):
         print("\n[修改配置]")
@@ -107,16 +119,57 @@ class LOFMonitorCLI:
             config.set("dingtalk_secret", val)
             print("密钥已更新")
             
+    def cancel(self):
+        """中止进行中的监控循环：尚未开始的请求不再等待，run_monitor_cycle 抛出 CycleCancelled"""
+        self.cancelled = True
+    
     def start_monitoring(self):
         print("\n[开始监控]")
         self.run_monitor_cycle()
             
     def run_monitor_cycle(self):
         """执行一次监控循环"""
+        if self.profile:
+            from profiler import profile_session
+            with profile_session("cycle"):
+                self._run_monitor_cycle()
+        else:
+            self._run_monitor_cycle()
+            
+    def _run_monitor_cycle(self):
+        """监控循环主体"""
+        # 延迟导入数据获取及通知模块（akshare/requests 加载较慢，菜单操作无需加载）
+        from data_fetcher import get_all_fund_data
+        from notifier import get_dispatcher, get_backends, format_alert_message, create_alert_digest
+        from history_store import append_cycle
+        from rolling_stats import get_rolling_stats, save_rolling_stats
+        from fetch_cache import save_fetch_cache
+        from rules import load_rule_engine
+        from delta import evaluation_context
+        session = None
+        if self.shard:
+            from sharding import ShardSession
+            session = ShardSession(self.shard)
+        rule_engine = load_rule_engine()  # 未配置 rules.json 时为 None，使用全局阈值
+        rolling_stats = get_rolling_stats()
+        dispatcher = get_dispatcher(session.outbox_file) if session else get_dispatcher()
+        digest = create_alert_digest()
+        publisher = self.publisher
+        sinks = self.sinks
+        if publisher:
+            publisher.begin_cycle()
+        if publisher or sinks:
+            from api_server import build_row
+        cycle_started = time.strftime("%Y-%m-%d %H:%M:%S")
+        
         print(f"\n正在刷新数据 ({time.strftime('%H:%M:%S')})...")
         
         threshold_premium = config.get("premium_threshold")
         threshold_discount = config.get("discount_threshold")
+        threshold_zscore = config.get("anomaly_zscore")
+        nav_source = config.get("nav_source")
+        delta = self.delta
+        delta.begin_cycle(evaluation_context(threshold_premium, threshold_discount, threshold_zscore, nav_source))
         
         # 定义列宽
         w_code, w_name, w_mkt, w_nav, w_pre, w_dis, w_stat, w_fstate = 8, 20, 8, 8, 10, 10, 10, 20
@@ -137,32 +190,101 @@ class LOFMonitorCLI:
         print("-" * 100)
         
         count_container = [0]  # 使用列表以在回调中修改计数
+        unchanged_alerts = [0]  # 输入未变化、未重复打印的告警基金数
+        cycle_rows = []  # 本轮完整数据表，结束后写入历史存储
+        
+        def raise_alert(alert):
+            """记录告警日志并提交发送 (发送成功后才标记今日已告警)；汇总模式下先收集，本轮结束后合并发送"""
+            code, name, alert_type, rate, threshold, zscore, market_price, nav_price, f_state, nav_estimated = alert
+            record = log_alert(code, name, alert_type, rate, threshold, zscore)
+            if publisher:
+                publisher.add_alert(record)
+            if not config.is_fund_alerted(code):
+                if digest:
+                    digest.add(code, name, alert_type, rate, market_price, nav_price, f_state, zscore,
+                               nav_estimated)
+                else:
+                    msg = format_alert_message(code, name, alert_type, rate, market_price, nav_price, f_state,
+                                               zscore, nav_estimated)
+                    dispatcher.submit(msg, fund_code=code)
+        
+        def publish(record, fund):
+            """基金表行发布到 HTTP API 的共享基金表并写入结果输出"""
+            if publisher:
+                publisher.update_fund(record)
+            if sinks:
+                record = dict(record, cycle=cycle_started, market_time=fund.get('market_time'))
+                for sink in sinks:
+                    sink.write(record)
         
         def on_fund_received(fund):
+            if self.cancelled:
+                raise CycleCancelled()
             code = fund['code']
+            change = delta.diff(fund)
+            if not change.kinds:
+                # 输入与上一轮相同：沿用上一轮的结果，不重新计算、不重复打印
+                result = change.previous
+                cycle_rows.append(result['row'])
+                if result['record']:
+                    publish(result['record'], fund)
+                if result['alert']:
+                    count_container[0] += 1
+                    unchanged_alerts[0] += 1
+                    # 跨日后或上次未能提交发送时仍需告警（未配置通知渠道时不重复记录）
+                    if get_backends() and not config.is_fund_alerted(code) and not dispatcher.is_pending(code):
+                        raise_alert(result['alert'])
+                return
+            
             name = fund['name']
             market_price = fund['market_price']
-            nav_price = fund['nav_price']
+            # 官方净值或按指数行情估算的净值
+            nav_price, nav_estimated = select_nav(fund['nav_price'], fund.get('est_nav'), nav_source)
             f_state = fund.get('fund_state', '')
             
-            # 计算溢价/折价率
-            premium_rate, discount_rate = calculate_premium_discount(market_price, nav_price)
+            with metrics.track("compute"):
+                # 计算溢价/折价率
+                premium_rate, discount_rate = calculate_premium_discount(market_price, nav_price)
+                
+                # 更新该基金的溢价率滚动统计，得到本次的偏离程度
+                signed_rate = signed_premium(premium_rate, discount_rate)
+                zscore = rolling_stats.update(code, signed_rate)
+                
+                # 判断状态（配置了规则时使用该基金的有效阈值）
+                limits = rule_engine.lookup(code, f_state) if rule_engine else None
+                p_limit, d_limit, z_limit = limits or (threshold_premium, threshold_discount, threshold_zscore)
+                status = get_status(premium_rate, discount_rate, p_limit, d_limit, zscore, z_limit)
+            
+            record = None
+            if publisher or sinks:
+                record = build_row(fund, nav_price, nav_estimated, premium_rate, discount_rate, zscore, status)
+                publish(record, fund)
             
-            # 判断状态
-            status = get_status(premium_rate, discount_rate, threshold_premium, threshold_discount)
+            row = {
+                'code': code,
+                'market_price': market_price,
+                'nav_price': nav_price,
+                'nav_date': fund.get('nav_date', ''),
+                'premium_rate': premium_rate,
+                'discount_rate': discount_rate,
+                'status': status,
+                'fund_state': f_state
+            }
+            cycle_rows.append(row)
             
-            if status in ['premium_alert', 'discount_alert']:
+            alert = None
+            if status in ['premium_alert', 'discount_alert', 'anomaly_alert']:
                 count_container[0] += 1
                 
                 # 格式化数据
                 p_rate_str = f"{premium_rate:.2f}%" if premium_rate is not None else "N/A"
                 d_rate_str = f"{discount_rate:.2f}%" if discount_rate is not None else "N/A"
                 m_price_str = f"{market_price:.4f}" if market_price else "N/A"
-                n_price_str = f"{nav_price:.4f}" if nav_price else "N/A"
-                status_text = "⚠️ 溢价" if status == 'premium_alert' else "⚠️ 折价"
+                n_price_str = (("≈" if nav_estimated else "") + f"{nav_price:.4f}") if nav_price else "N/A"
+                status_text = {'premium_alert': "⚠️ 溢价", 'discount_alert': "⚠️ 折价"}.get(status, "⚠️ 异动")
                 
                 # 构建对齐行
-                row = (
+                line = (
                     align_text(code, w_code) +
                     align_text(name[:15], w_name) + # 限制名称长度防干扰
                     align_text(m_price_str, w_mkt) +
@@ -174,24 +296,27 @@ class LOFMonitorCLI:
                 )
                 
                 # 打印单行结果 (加上\r清空当前进度行)
-                print(f"\r{row}")
+                print(f"\r{line}")
                 
                 # 触发告警
-                alert_type = 'premium' if status == 'premium_alert' else 'discount'
-                rate = premium_rate if alert_type == 'premium' else discount_rate
-                threshold = threshold_premium if alert_type == 'premium' else threshold_discount
-                
-                # 记录日志
-                log_alert(code, name, alert_type, rate, threshold)
+                if status == 'premium_alert':
+                    alert_type, rate, threshold = 'premium', premium_rate, p_limit
+                elif status == 'discount_alert':
+                    alert_type, rate, threshold = 'discount', discount_rate, d_limit
+                else:
+                    alert_type, rate, threshold = 'anomaly', signed_rate, z_limit
                 
-                # 发送钉钉 (每日去重由 notifier.py 和 config.py 处理)
-                if not config.is_fund_alerted(code):
-                    msg = format_alert_message(code, name, alert_type, rate, market_price, nav_price, f_state)
-                    send_dingtalk_alert(config.get("dingtalk_webhook"), config.get("dingtalk_secret"), msg, fund_code=code)
+                alert = (code, name, alert_type, rate, threshold, zscore, market_price, nav_price, f_state,
+                         nav_estimated)
+                raise_alert(alert)
+            
+            transition = delta.commit(code, {'row': row, 'record': record, 'alert': alert}, status)
+            if transition and alert is None and transition.old in ['premium_alert', 'discount_alert', 'anomaly_alert']:
+                print("\r" + align_text(code, w_code) + align_text(name[:15], w_name) + "告警解除")
  
         def print_progress(current, total, name, fund_data):
             m_price = fund_data.get('market_price')
-            n_price = fund_data.get('nav_price')
+            n_price = select_nav(fund_data.get('nav_price'), fund_data.get('est_nav'), nav_source)[0]
             p_rate_str = "N/A"
             if m_price and n_price and n_price != 0:
                 p_rate = (m_price - n_price) / n_price * 100
@@ -200,11 +325,54 @@ class LOFMonitorCLI:
             print(f"\r正在获取数据: {current}/{total} ({fund_data['code']} {name[:15]} 场内：{m_price or 'N/A'} 净值：{n_price or 'N/A'} 溢价率：{p_rate_str}) 状态：{fund_data['fund_state']}", end="", flush=True)
 
         # 获取数据并传入回调
-        get_all_fund_data(
+        def on_fund_list(fund_df):
+            rule_engine.prepare(fund_df, threshold_premium, threshold_discount, threshold_zscore)
+        
+        funds = get_all_fund_data(
             progress_callback=print_progress,
-            data_callback=on_fund_received
+            data_callback=on_fund_received,
+            list_callback=on_fund_list if rule_engine else None,
+            shard=self.shard
         )
         
+        if publisher:
+            publisher.end_cycle(complete=bool(funds))
+        delta.end_cycle(complete=bool(funds))
+        for sink in sinks:
+            sink.flush()
+        
         print("\n" + "-" * 100)
         if count_container[0] == 0:
             print("没有发现超过阈值的基金")
+        elif unchanged_alerts[0]:
+            print(f"另有 {unchanged_alerts[0]} 只告警基金与上一轮相同，未重复显示")
+        if len(funds) != delta.counts['added']:
+            print(f"本轮变化: {delta.summary()}")
+        if len(set(fund['category'] for fund in funds)) > 1:
+            from data_fetcher import CATEGORIES
+            counts = {}
+            for fund in funds:
+                counts[fund['category']] = counts.get(fund['category'], 0) + 1
+            print("本轮基金: " + " / ".join(f"{CATEGORIES[c]['label']} {n}" for c, n in counts.items()))
+        
+        if digest:
+            digest.flush()
+        if not session:
+            append_cycle(cycle_rows)
+            save_rolling_stats()
+            save_fetch_cache()
+        
+        # 等待后台发送队列完成，再写出本轮累积的告警日志及配置修改（告警去重记录等）
+        dispatcher.drain(timeout=NOTIFY_DRAIN_TIMEOUT)
+        if session:
+            session.save(funds, cycle_rows, rolling_stats, dispatcher)
+        flush_alerts()
+        config.flush()
+        
+        # 打印并导出各阶段运行指标
+        print("\n[运行指标]")
+        print(metrics.summary())
+        if session:
+            metrics.export(*session.metrics_paths)
+        else:
+            metrics.export()
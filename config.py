@@ -5,12 +5,30 @@ LOF基金溢价监控程序 - 配置模块
 
 import os
 import json
-from datetime import datetime
+import time
+import atexit
+import threading
+from datetime import datetime, timedelta
 
 # 文件路径
 LOF_FUNDS_FILE = "lof_funds.csv"
 ALERTS_LOG_FILE = "alerts.log"
+ALERTS_JSONL_FILE = "alerts.jsonl"
+ALERTS_ARCHIVE_DIR = "logs"
+ALERT_INDEX_FILE = "alert_index.pkl"
+OUTBOX_FILE = "outbox.json"
 CONFIG_FILE = "config.json"
+SNAPSHOT_FILE = "fund_snapshot.pkl"
+HISTORY_DIR = "history"
+ROLLING_STATS_FILE = "rolling_stats.pkl"
+RULES_FILE = "rules.json"
+BACKTEST_DATA_FILE = "backtest_data.pkl"
+IOPV_MAP_FILE = "iopv_map.json"
+SHARD_DIR = "shards"
+CACHE_BUNDLE_FILE = "cache_bundle.bin"
+METRICS_JSON_FILE = "metrics.json"
+METRICS_PROM_FILE = "metrics.prom"
+PROFILE_DIR = "profile"
 
 # UI配置常量
 WINDOW_TITLE = "LOF基金溢价监控系统"
@@ -20,11 +38,93 @@ WINDOW_HEIGHT = 700
 # 颜色配置
 COLOR_PREMIUM = "#00C853"   # 溢价颜色 - 绿色
 COLOR_DISCOUNT = "#FF5252"  # 折价颜色 - 红色
+COLOR_ANOMALY = "#FFB300"   # 异动颜色 - 琥珀色
 COLOR_NORMAL = "#FFFFFF"    # 正常颜色 - 白色
 COLOR_BG_DARK = "#1E1E2E"   # 深色背景
 COLOR_BG_CARD = "#2D2D3F"   # 卡片背景
 COLOR_ACCENT = "#7C3AED"    # 主题色 - 紫色
 
+# 配置变更后延迟写盘的时间（秒），期间的多次修改合并为一次写入
+CONFIG_FLUSH_DELAY = 2.0
+
+# 告警日志：缓冲条数/时间达到上限时批量写盘，文件超过大小上限时压缩归档
+ALERTS_LOG_BUFFER_LINES = 50
+ALERTS_LOG_FLUSH_INTERVAL = 2.0
+ALERTS_LOG_MAX_BYTES = 1024 * 1024
+
+# 告警发送：钉钉机器人每分钟最多20条；失败后指数退避重试；
+# 单次运行结束前最多等待发件箱清空的秒数（其余留在发件箱中，当天下次运行继续发送，跨日后丢弃）
+DINGTALK_RATE_LIMIT = 20
+DINGTALK_RATE_WINDOW = 60.0
+WECOM_RATE_LIMIT = 20
+FEISHU_RATE_LIMIT = 100
+WEBHOOK_RATE_LIMIT = 60
+NOTIFY_TIMEOUT = 10
+NOTIFY_MAX_ATTEMPTS = 6
+NOTIFY_BACKOFF_BASE = 2.0
+NOTIFY_BACKOFF_MAX = 120.0
+NOTIFY_DRAIN_TIMEOUT = 20.0
+
+# 异动检测：EWMA 平滑系数；样本数不足时不判定；标准差下限（百分点），避免波动极小的基金被轻微变化触发
+EWMA_ALPHA = 0.05
+ANOMALY_MIN_SAMPLES = 30
+ANOMALY_MIN_STD = 0.2
+
+# 估算净值：校准时拟合优度低于该值的基金不映射指数
+IOPV_MIN_R2 = 0.6
+
+# 抓取缓存：净值在每天该时刻（开始发布当日净值）失效；发布时段内尚未更新到当日的净值每隔该秒数重新获取；
+# 交易状态缓存的有效期（秒），过期后用详情页的 HTTP 验证器 (ETag/Last-Modified) 重新验证；
+# 过期条目保留用于重新验证的最长时间（秒）；缓存包创建超过该秒数后整体丢弃
+NAV_REFRESH_HOUR = 16
+NAV_PENDING_TTL = 1800
+FUND_STATE_TTL = 6 * 3600
+CACHE_STALE_MAX_AGE = 7 * 86400
+CACHE_BUNDLE_MAX_AGE = 3 * 86400
+
+# --output 结果输出：累计该条数或距上次刷新超过该秒数时刷新（SQLite 提交一次事务）；文件写缓冲大小
+SINK_FLUSH_RECORDS = 100
+SINK_FLUSH_INTERVAL = 1.0
+SINK_BUFFER_BYTES = 64 * 1024
+
+# 基金列表缓存 (lof_funds.csv) 用实时列表刷新成员的间隔（秒）；按代码查询行情时每次请求的代码数
+UNIVERSE_TTL = 86400
+QUOTE_BATCH_SIZE = 200
+
+# 品种分类（lof / etf / closed 封闭式 / reits）各自的并发请求数：净值接口及详情页抓取按分类分别限流，
+# 某一分类的接口变慢时不会挤占其他分类；可用 config.json 的 category_workers 或环境变量 CATEGORY_WORKERS 覆盖
+CATEGORY_WORKERS = {"lof": 4, "etf": 8, "closed": 2, "reits": 2}
+
+# HTTP API 服务 (--serve)：默认端口；两轮监控开始时间的间隔（秒）；内存中保留的最近告警/变更事件条数；
+# SSE 连接的保活间隔（秒）；超过该字节数的响应按 gzip 压缩
+SERVE_DEFAULT_PORT = 8700
+SERVE_CYCLE_INTERVAL = 60
+SERVE_ALERT_LIMIT = 500
+SERVE_EVENT_LIMIT = 5000
+SERVE_KEEPALIVE = 15.0
+SERVE_GZIP_MIN_BYTES = 1024
+
+# 终端看板 (--dashboard)：两轮监控开始时间的间隔（秒）；画面刷新间隔（秒）；连接 --serve 时重新验证基金表的间隔（秒）；
+# 保留的程序输出行数；显示宽度缓存的字符串数（基金名称、格式化后的价格等）
+DASHBOARD_CYCLE_INTERVAL = 60
+DASHBOARD_FRAME_INTERVAL = 0.25
+DASHBOARD_POLL_INTERVAL = 1.0
+DASHBOARD_LOG_LINES = 200
+DISPLAY_WIDTH_CACHE_SIZE = 65536
+
+# 通知渠道配置（配置项 -> 环境变量）：只从环境变量读取或在界面中临时设置，不写入 config.json
+CHANNEL_ENV_KEYS = {
+    "dingtalk_webhook": "DINGTALK_WEBHOOK",
+    "dingtalk_secret": "DINGTALK_SECRET",
+    "wecom_webhook": "WECOM_WEBHOOK",
+    "feishu_webhook": "FEISHU_WEBHOOK",
+    "feishu_secret": "FEISHU_SECRET",
+    "alert_webhook_url": "ALERT_WEBHOOK_URL"
+}
+
+# 汇总模式：单条汇总消息的最大字符数（钉钉 Markdown 消息上限约 5000 字符，超出则拆分为多条）
+DIGEST_MAX_CHARS = 3500
+
 class ConfigManager:
     _instance = None
     
@@ -36,12 +136,25 @@ class ConfigManager:
     
     def load_config(self):
         """加载配置"""
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._flush_timer = None
+        self.persist = True  # 分片运行时为 False：修改只保留在内存中，由 merge 统一写回
+        self._today = ""
+        self._today_expires = 0.0
+        
         self.default_config = {
             "premium_threshold": 30.0,
             "discount_threshold": 40.0,
             "last_alert_date": "",
             "alerted_funds": [],  # 当日已告警的基金代码列表
-            "mode": "ui"  # "ui" or "terminal"
+            "mode": "ui",  # "ui" or "terminal"
+            "alert_mode": "single",  # "single" 逐只发送 or "digest" 每轮汇总发送
+            "digest_critical_rate": 0.0,  # 汇总模式下比率达到该值时立即发送，0 表示不启用
+            "anomaly_zscore": 0.0,  # 溢价率偏离自身历史的 z 分数达到该值时异动告警，0 表示不启用
+            "nav_source": "official",  # "official" 官方净值 or "estimated" 按指数实时行情估算的净值
+            "categories": ["lof"],  # 监控的品种分类，可选 lof / etf / closed / reits
+            "category_workers": {}  # 各分类的并发请求数，未设置的分类使用 CATEGORY_WORKERS
         }
         
         if os.path.exists(CONFIG_FILE):
@@ -50,7 +163,7 @@ class ConfigManager:
                     saved_config = json.load(f)
                     
                     # 剔除加载到的敏感信息（防止旧配置干扰）
-                    for key in ["dingtalk_webhook", "dingtalk_secret"]:
+                    for key in CHANNEL_ENV_KEYS:
                         if key in saved_config:
                             del saved_config[key]
                             
@@ -67,7 +180,9 @@ class ConfigManager:
         # 从环境变量覆盖配置 (用于GitHub Actions)
         env_mapping = {
             "PREMIUM_THRESHOLD": "premium_threshold",
-            "DISCOUNT_THRESHOLD": "discount_threshold"
+            "DISCOUNT_THRESHOLD": "discount_threshold",
+            "DIGEST_CRITICAL_RATE": "digest_critical_rate",
+            "ANOMALY_ZSCORE": "anomaly_zscore"
         }
         for env_key, config_key in env_mapping.items():
             env_val = os.environ.get(env_key)
@@ -76,69 +191,147 @@ class ConfigManager:
                     self.config[config_key] = float(env_val)
                 except ValueError:
                     print(f"环境变量 {env_key} 格式错误: {env_val}")
+        alert_mode = os.environ.get("ALERT_MODE")
+        if alert_mode:
+            if alert_mode in ("single", "digest"):
+                self.config["alert_mode"] = alert_mode
+            else:
+                print(f"环境变量 ALERT_MODE 格式错误: {alert_mode}")
+        nav_source = os.environ.get("NAV_SOURCE")
+        if nav_source:
+            if nav_source in ("official", "estimated"):
+                self.config["nav_source"] = nav_source
+            else:
+                print(f"环境变量 NAV_SOURCE 格式错误: {nav_source}")
+        categories = os.environ.get("FUND_CATEGORIES")
+        if categories:
+            names = [name.strip() for name in categories.split(",") if name.strip()]
+            if names and all(name in CATEGORY_WORKERS for name in names):
+                self.config["categories"] = names
+            else:
+                print(f"环境变量 FUND_CATEGORIES 格式错误: {categories}")
+        workers = os.environ.get("CATEGORY_WORKERS")
+        if workers:
+            try:
+                budgets = {}
+                for item in workers.split(","):
+                    name, _, value = item.partition("=")
+                    if name.strip() not in CATEGORY_WORKERS or int(value) < 1:
+                        raise ValueError(item)
+                    budgets[name.strip()] = int(value)
+                self.config["category_workers"] = budgets
+            except ValueError:
+                print(f"环境变量 CATEGORY_WORKERS 格式错误: {workers}")
                     
-        # 钉钉配置直接从环境变量获取，不进入 config 字典（防止被误保存）
-        self.dingtalk_webhook = os.environ.get("DINGTALK_WEBHOOK", "")
-        self.dingtalk_secret = os.environ.get("DINGTALK_SECRET", "")
+        # 通知渠道配置直接从环境变量获取，不进入 config 字典（防止被误保存）
+        self.channels = {key: os.environ.get(env_key, "") for key, env_key in CHANNEL_ENV_KEYS.items()}
+        
+        # 当日已告警基金的集合索引（与 alerted_funds 列表保持一致）
+        self._alerted_index = set(self.config.get("alerted_funds", []))
             
     def save_config(self):
-        """保存配置"""
-        try:
+        """保存配置（先写临时文件再原子替换，避免中途退出损坏配置文件）"""
+        from metrics import metrics
+        
+        with self._lock:
             # 排除敏感信息，不回写到配置文件中
             config_to_save = self.config.copy()
-            sensitive_keys = ["dingtalk_webhook", "dingtalk_secret"]
-            for key in sensitive_keys:
-                if key in config_to_save:
-                    del config_to_save[key]
-            
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config_to_save, f, indent=4, ensure_ascii=False)
+            config_to_save["alerted_funds"] = list(config_to_save.get("alerted_funds", []))
+            self._dirty = False
+        for key in CHANNEL_ENV_KEYS:
+            if key in config_to_save:
+                del config_to_save[key]
+        
+        tmp_file = CONFIG_FILE + ".tmp"
+        try:
+            with metrics.track("config_write"):
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(config_to_save, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_file, CONFIG_FILE)
         except Exception as e:
             print(f"保存配置文件失败: {e}")
             
+    def mark_dirty(self):
+        """标记配置已修改，延迟合并写盘"""
+        with self._lock:
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(CONFIG_FLUSH_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+                
+    def flush(self):
+        """立即写出尚未保存的修改（监控循环结束及程序退出时调用）"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            dirty = self._dirty
+        if dirty and self.persist:
+            self.save_config()
+            
     def get(self, key, default=None):
         """获取配置项"""
-        # 特殊处理钉钉配置，直接从变量获取
-        if key == "dingtalk_webhook":
-            return self.dingtalk_webhook or default
-        if key == "dingtalk_secret":
-            return self.dingtalk_secret or default
+        # 特殊处理通知渠道配置，直接从变量获取
+        if key in CHANNEL_ENV_KEYS:
+            return self.channels.get(key) or default
         return self.config.get(key, default)
         
     def set(self, key, value):
-        """设置配置项并保存"""
-        # 特殊处理钉钉配置，仅保存在内存中，save_config会过滤掉
-        if key == "dingtalk_webhook":
-            self.dingtalk_webhook = value
-        elif key == "dingtalk_secret":
-            self.dingtalk_secret = value
-        else:
+        """设置配置项（延迟写盘）"""
+        # 特殊处理通知渠道配置，仅保存在内存中，save_config会过滤掉
+        if key in CHANNEL_ENV_KEYS:
+            self.channels[key] = value
+            return
+        with self._lock:
+            if self.config.get(key) == value:
+                return
             self.config[key] = value
-        self.save_config()
+            if key == "alerted_funds":
+                self._alerted_index = set(value)
+        self.mark_dirty()
+        
+    def current_date(self):
+        """当前日期 (YYYY-MM-DD)，缓存到当天结束，避免每次检查都格式化日期"""
+        now = time.time()
+        if now >= self._today_expires:
+            today = datetime.now()
+            tomorrow = datetime(today.year, today.month, today.day) + timedelta(days=1)
+            self._today = today.strftime("%Y-%m-%d")
+            self._today_expires = tomorrow.timestamp()
+        return self._today
         
     def check_reset_daily_alerts(self):
         """检查并重置每日告警记录"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        if self.config.get("last_alert_date") != today:
+        today = self.current_date()
+        if self.config.get("last_alert_date") == today:
+            return False
+        with self._lock:
+            if self.config.get("last_alert_date") == today:
+                return False
             self.config["last_alert_date"] = today
             self.config["alerted_funds"] = []
-            self.save_config()
-            return True
-        return False
+            self._alerted_index = set()
+        self.mark_dirty()
+        return True
     
     def is_fund_alerted(self, code):
         """检查基金今日是否已告警"""
         self.check_reset_daily_alerts()
-        return code in self.config.get("alerted_funds", [])
+        return code in self._alerted_index
         
     def mark_fund_alerted(self, code):
         """标记基金今日已告警"""
         self.check_reset_daily_alerts()
-        alerted_funds = self.config.get("alerted_funds", [])
-        if code not in alerted_funds:
-            alerted_funds.append(code)
-            self.config["alerted_funds"] = alerted_funds
-            self.save_config()
+        with self._lock:
+            if code in self._alerted_index:
+                return
+            self._alerted_index.add(code)
+            self.config.setdefault("alerted_funds", []).append(code)
+        self.mark_dirty()
 
 # 全局单例
 config = ConfigManager()
+
+# 程序退出前写出尚未保存的修改
+atexit.register(config.flush)
@@ -0,0 +1,568 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 终端看板模块
+
+--dashboard 在终端中全屏显示基金表（curses），适合在 SSH 会话中长时间运行：
+    - 顶部为本轮状态、告警统计、本轮变化及请求/缓存指标，底部为排序、筛选及按键说明
+    - 基金表可按任一列排序，按状态、分类筛选，按代码或名称搜索；只格式化可见的行
+    - 每帧按单元格与上一帧比较，只重绘内容变化的单元格，数千只基金、亚秒级刷新时终端输出也很少
+本地模式在后台线程中循环执行监控（间隔 DASHBOARD_CYCLE_INTERVAL 秒），程序的文本输出显示在顶部；
+与 --connect 一起使用时从 --serve 实例获取基金表（ETag 重新验证，未变化时服务器返回 304），本机不请求上游接口。
+
+按键:
+    s / S       下一列 / 上一列排序        r       反向排序
+    f           状态筛选（全部/告警/溢价/折价） c       分类筛选
+    /           搜索代码或名称（回车确认，Esc 取消） Esc     清除搜索
+    ↑ ↓ PgUp PgDn Home End  滚动            空格    立即开始下一轮（本地模式）
+    q           退出
+
+用法:
+    python main.py --dashboard
+    python main.py --dashboard --connect http://host:8700
+"""
+
+import io
+import os
+import sys
+import time
+import threading
+from collections import deque, Counter
+from cli import display_width, align_text
+from calculator import signed_premium
+from config import (
+    DASHBOARD_CYCLE_INTERVAL, DASHBOARD_FRAME_INTERVAL, DASHBOARD_LOG_LINES, DASHBOARD_POLL_INTERVAL
+)
+
+ALERT_STATUSES = ('premium_alert', 'discount_alert', 'anomaly_alert')
+
+STATUS_LABELS = {
+    'premium_alert': "溢价告警", 'discount_alert': "折价告警", 'anomaly_alert': "异动告警",
+    'premium': "溢价", 'discount': "折价", 'normal': "正常", 'unknown': "未知"
+}
+
+# 状态排序时的先后（告警在前）
+STATUS_ORDER = {status: i for i, status in enumerate(
+    ('premium_alert', 'discount_alert', 'anomaly_alert', 'premium', 'discount', 'normal', 'unknown'))}
+
+
+def _price(value, estimated=False):
+    return ("≈" if estimated else "") + f"{value:.4f}" if value else "N/A"
+
+
+def _rate(value):
+    return f"{value:.2f}%" if value is not None else "N/A"
+
+
+# 表格列: (字段, 标题, 宽度, 对齐, 格式化, 排序键)；最后一列占用剩余宽度
+COLUMNS = (
+    ('code', "代码", 8, 'left', lambda r: r['code'], lambda r: r['code']),
+    ('name', "名称", 18, 'left', lambda r: r['name'], lambda r: r['name']),
+    ('category', "分类", 6, 'left', lambda r: r['category'], lambda r: r['category']),
+    ('market_price', "场内", 9, 'right', lambda r: _price(r['market_price']), lambda r: r['market_price']),
+    ('nav_price', "净值", 10, 'right', lambda r: _price(r['nav_price'], r['nav_estimated']), lambda r: r['nav_price']),
+    ('premium_rate', "溢价率", 9, 'right', lambda r: _rate(r['premium_rate']),
+     lambda r: signed_premium(r['premium_rate'], r['discount_rate'])),
+    ('discount_rate', "折价率", 9, 'right', lambda r: _rate(r['discount_rate']),
+     lambda r: _negate(signed_premium(r['premium_rate'], r['discount_rate']))),
+    ('zscore', "Z", 7, 'right', lambda r: f"{r['zscore']:.2f}" if r['zscore'] is not None else "-",
+     lambda r: r['zscore']),
+    ('status', "状态", 10, 'left', lambda r: STATUS_LABELS.get(r['status'], "未知"),
+     lambda r: STATUS_ORDER.get(r['status'], len(STATUS_ORDER))),
+    ('fund_state', "交易状态", 0, 'left', lambda r: r['fund_state'], lambda r: r['fund_state']),
+)
+
+# 状态筛选: (名称, 条件)
+STATUS_FILTERS = (
+    ("全部", None),
+    ("告警", lambda status: status in ALERT_STATUSES),
+    ("溢价", lambda status: status in ('premium_alert', 'premium')),
+    ("折价", lambda status: status in ('discount_alert', 'discount')),
+)
+
+CATEGORY_FILTERS = (None, 'lof', 'etf', 'closed', 'reits')
+
+HEADER_LINES = 5  # 状态 3 行 + 程序输出 1 行 + 表头 1 行
+
+
+def _negate(value):
+    return None if value is None else -value
+
+
+def fit_text(text, width, align='left'):
+    """按显示宽度截断并补齐到 width"""
+    text = str(text)
+    if display_width(text) > width:
+        kept, used = [], 0
+        for char in text:
+            used += display_width(char)
+            if used > width:
+                break
+            kept.append(char)
+        text = "".join(kept)
+    return align_text(text, width, align)
+
+
+class OutputTail(io.TextIOBase):
+    """
+    看板运行期间接管 print 输出（curses 占用整个终端），保留最近 DASHBOARD_LOG_LINES 行；
+    \\r 开头的输出覆盖当前行（监控循环的进度行）
+    """
+
+    def __init__(self, limit=DASHBOARD_LOG_LINES):
+        super().__init__()
+        self.lines = deque(maxlen=limit)
+        self.current = ""
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self._lock:
+            parts = text.split("\n")
+            for i, part in enumerate(parts):
+                if "\r" in part:
+                    self.current = part.rsplit("\r", 1)[1]
+                else:
+                    self.current += part
+                if i < len(parts) - 1:
+                    if self.current.strip():
+                        self.lines.append(self.current)
+                    self.current = ""
+        return len(text)
+
+    def latest(self):
+        """当前行（进度）或最近一行完整输出"""
+        with self._lock:
+            if self.current.strip():
+                return self.current.strip()
+            return self.lines[-1].strip() if self.lines else ""
+
+
+class LocalSource:
+    """本地数据源：后台线程循环执行监控，结果写入共享基金表"""
+
+    def __init__(self, interval=DASHBOARD_CYCLE_INTERVAL, profile=False):
+        from api_server import FundTable, load_snapshot_rows
+        from cli import LOFMonitorCLI
+        self.interval = interval
+        self.table = FundTable()
+        rows, saved_at = load_snapshot_rows()
+        if rows:
+            self.table.load(rows, saved_at)
+        self.cli = LOFMonitorCLI(profile=profile, publisher=self.table)
+        self.wake = threading.Event()
+        self.thread = None
+        self.label = "本地"
+
+    @property
+    def version(self):
+        return self.table.version
+
+    def snapshot(self):
+        return self.table.snapshot()
+
+    def changes(self):
+        """本轮变化统计（增量刷新）"""
+        return self.cli.delta.summary() if self.table.cycles else ""
+
+    def refresh_now(self):
+        self.wake.set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """中止进行中的一轮（正在进行的请求完成后退出）"""
+        self.cli.cancel()
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _loop(self):
+        from cli import CycleCancelled
+        while not self.cli.cancelled:
+            started = time.time()
+            try:
+                self.cli.run_monitor_cycle()
+            except CycleCancelled:
+                return
+            except Exception as e:
+                print(f"监控循环出错: {e}")
+                self.table.end_cycle(complete=False)
+            self.wake.wait(max(0.0, self.interval - (time.time() - started)))
+            self.wake.clear()
+
+
+class RemoteSource:
+    """--connect 数据源：定时重新验证 --serve 实例的 /api/funds"""
+
+    def __init__(self, base_url, interval=DASHBOARD_POLL_INTERVAL):
+        from api_server import FundTableClient
+        self.client = FundTableClient(base_url)
+        self.interval = interval
+        self.version = 0
+        self._state = (0, {'state': 'connecting'}, {})
+        self._lock = threading.Lock()
+        self.label = base_url
+
+    def snapshot(self):
+        with self._lock:
+            return self._state
+
+    def changes(self):
+        return ""
+
+    def refresh_now(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def start(self):
+        threading.Thread(target=self._loop, daemon=True).start()
+        return self
+
+    def _loop(self):
+        while True:
+            try:
+                payload, changed = self.client.fetch_funds()
+                if changed:
+                    funds = {row['code']: row for row in payload['funds']}
+                    with self._lock:
+                        self._state = (payload['version'], payload['cycle'], funds)
+                        self.version = payload['version']
+            except Exception as e:
+                print(f"获取基金表失败: {e}")
+            time.sleep(self.interval)
+
+
+class CellRenderer:
+    """
+    按单元格比较前后两帧，只重绘内容或属性变化的单元格
+
+    一帧为 {(y, x): (text, attr)}，text 已补齐到单元格宽度；上一帧有而本帧没有的单元格写空格清除。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.previous = {}
+        self.drawn = 0  # 上一帧重绘的单元格数
+
+    def invalidate(self):
+        """终端尺寸变化等情况下整屏重绘"""
+        self.previous = {}
+        self.window.erase()
+
+    def _put(self, y, x, text, attr):
+        import curses
+        try:
+            self.window.addstr(y, x, text, attr)
+        except curses.error:
+            pass  # 写到屏幕右下角时 curses 会报错，内容已写入
+
+    def draw(self, cells):
+        import curses
+        previous = self.previous
+        drawn = 0
+        for pos, cell in cells.items():
+            if previous.get(pos) != cell:
+                self._put(pos[0], pos[1], cell[0], cell[1])
+                drawn += 1
+        for pos in previous.keys() - cells.keys():
+            self._put(pos[0], pos[1], " " * display_width(previous[pos][0]), 0)
+            drawn += 1
+        self.previous = cells
+        self.drawn = drawn
+        self.window.noutrefresh()
+        curses.doupdate()
+
+
+class Dashboard:
+    """终端看板：读取数据源、维护排序/筛选后的视图并按帧绘制"""
+
+    def __init__(self, source, output):
+        self.source = source
+        self.output = output
+        self.sort_index = 5  # 溢价率
+        self.reverse = True
+        self.status_filter = 0
+        self.category_filter = 0
+        self.search = ""
+        self.search_input = None  # 正在输入的搜索文本，未在输入时为 None
+        self.offset = 0
+        # 视图（按数据版本及排序/筛选条件缓存）
+        self.view_key = None
+        self.view = []
+        self.counts = Counter()
+        self.total = 0
+        self.cycle = {}
+        self.row_cache = {}  # code -> (行, 各单元格文本, 属性)
+        self.layout = []
+        self.size = None
+        self.frame_key = None
+        self.metrics_text = ""
+        self.metrics_second = None
+
+    # ------------------------------------------------------------ 视图
+
+    def _rebuild_view(self):
+        search = self.search_input if self.search_input is not None else self.search
+        key = (self.source.version, self.sort_index, self.reverse, self.status_filter, self.category_filter, search)
+        if key == self.view_key:
+            return
+        self.view_key = key
+        _, self.cycle, funds = self.source.snapshot()
+        rows = funds.values()
+        self.total = len(funds)
+        self.counts = Counter(row['status'] for row in rows)
+        condition = STATUS_FILTERS[self.status_filter][1]
+        category = CATEGORY_FILTERS[self.category_filter]
+        needle = search.strip().lower()
+        if condition or category or needle:
+            rows = [row for row in rows
+                    if (not condition or condition(row['status']))
+                    and (not category or row['category'] == category)
+                    and (not needle or needle in row['code'] or needle in row['name'].lower())]
+        sort_key = COLUMNS[self.sort_index][5]
+        keyed = [(sort_key(row), row) for row in rows]
+        # 空值始终排在最后
+        present = sorted((item for item in keyed if item[0] is not None), key=lambda item: item[0],
+                         reverse=self.reverse)
+        self.view = [row for _, row in present] + [row for value, row in keyed if value is None]
+
+    # ------------------------------------------------------------ 布局与单元格
+
+    def _make_layout(self, cols):
+        """各列的 (x, 宽度)；放不下的列省略，最后一列占用剩余宽度"""
+        layout, x = [], 0
+        limit = cols - 1  # 不写最后一列，避免换行
+        for i, column in enumerate(COLUMNS):
+            width = column[2] or limit - x
+            if width < 4 or x + width > limit:
+                break
+            layout.append((i, x, width))
+            x += width + 1
+        self.layout = layout
+        self.row_cache = {}
+
+    def _row_cells(self, row, colors):
+        cached = self.row_cache.get(row['code'])
+        if cached is not None and (cached[0] is row or cached[0] == row):
+            return cached[1], cached[2]
+        texts = [fit_text(COLUMNS[i][4](row) or "", width, COLUMNS[i][3]) for i, _, width in self.layout]
+        attr = colors.get(row['status'], 0)
+        self.row_cache[row['code']] = (row, texts, attr)
+        return texts, attr
+
+    def _metrics_line(self):
+        """请求及缓存指标（每秒汇总一次）"""
+        second = int(time.time())
+        if second == self.metrics_second:
+            return self.metrics_text
+        self.metrics_second = second
+        from metrics import metrics
+        requests = failures = timeouts = 0
+        p95 = {}
+        hits = Counter()
+        lookups = Counter()
+        for stage in metrics.to_json()['stages']:
+            name = stage['stage']
+            if name in ('list_fetch', 'nav_fetch', 'page_scrape', 'quote_fetch', 'index_fetch'):
+                requests += stage['count']
+                failures += stage['outcomes']['failure']
+                timeouts += stage['outcomes']['timeout']
+                p95[name] = max(p95.get(name, 0), stage['p95_seconds'])
+            hits[name] += stage['cache_hits']
+            lookups[name] += stage['cache_hits'] + stage['cache_misses']
+        parts = [f"请求 {requests}", f"失败 {failures}", f"超时 {timeouts}"]
+        for name, label in (('nav_fetch', "净值"), ('page_scrape', "详情页")):
+            if name in p95:
+                parts.append(f"{label} P95 {p95[name] * 1000:.0f}ms")
+            if lookups[name]:
+                parts.append(f"{label}缓存命中 {hits[name] / lookups[name]:.0%}")
+        self.metrics_text = "  ".join(parts)
+        return self.metrics_text
+
+    def _header_lines(self):
+        cycle = self.cycle or {}
+        state = {'running': "刷新中", 'finished': "已完成", 'failed': "失败", 'snapshot': "快照",
+                 'idle': "等待首轮", 'connecting': "连接中"}.get(cycle.get('state'), cycle.get('state') or "-")
+        when = cycle.get('started') if cycle.get('state') == 'running' else cycle.get('finished')
+        line1 = (f"LOF基金溢价监控 · 终端看板  [{self.source.label}]  本轮: {state}"
+                 + (f" ({when})" if when else "") + f"  {time.strftime('%H:%M:%S')}")
+        counts = self.counts
+        line2 = (f"基金 {self.total}  显示 {len(self.view)}  溢价告警 {counts['premium_alert']}  "
+                 f"折价告警 {counts['discount_alert']}  异动告警 {counts['anomaly_alert']}")
+        changes = self.source.changes()
+        if changes:
+            line2 += f"  |  本轮变化: {changes}"
+        line3 = self._metrics_line() if isinstance(self.source, LocalSource) else "数据来自 --serve 实例"
+        return line1, line2, line3, self.output.latest()
+
+    def _footer_line(self):
+        column = COLUMNS[self.sort_index][1]
+        category = CATEGORY_FILTERS[self.category_filter] or "全部"
+        if self.search_input is not None:
+            return f"搜索: {self.search_input}_   (回车确认，Esc 取消)"
+        return (f"排序: {column} {'降序' if self.reverse else '升序'}  筛选: {STATUS_FILTERS[self.status_filter][0]}  "
+                f"分类: {category}" + (f"  搜索: {self.search}" if self.search else "")
+                + "   [s]排序 [r]反向 [f]筛选 [c]分类 [/]搜索 [空格]刷新 [q]退出")
+
+    def build_frame(self, rows, cols, colors):
+        """生成一帧的单元格"""
+        import curses
+        cells = {}
+        width = cols - 1
+        for y, text in enumerate(self._header_lines()):
+            cells[(y, 0)] = (fit_text(text, width), curses.A_BOLD if y == 0 else 0)
+        for i, x, w in self.layout:
+            title = COLUMNS[i][1]
+            if i == self.sort_index:
+                title += " v" if self.reverse else " ^"
+            cells[(HEADER_LINES - 1, x)] = (fit_text(title, w, COLUMNS[i][3]), curses.A_REVERSE)
+        page = max(0, rows - HEADER_LINES - 1)
+        self.offset = max(0, min(self.offset, len(self.view) - page))
+        for n, row in enumerate(self.view[self.offset:self.offset + page]):
+            texts, attr = self._row_cells(row, colors)
+            y = HEADER_LINES + n
+            for (i, x, w), text in zip(self.layout, texts):
+                cells[(y, x)] = (text, attr)
+        cells[(rows - 1, 0)] = (fit_text(self._footer_line(), width), curses.A_REVERSE)
+        return cells
+
+    # ------------------------------------------------------------ 按键
+
+    def page_size(self):
+        return max(1, self.size[0] - HEADER_LINES - 1) if self.size else 1
+
+    def handle_key(self, key):
+        """
+        处理一次按键
+
+        Returns:
+            bool: 是否退出
+        """
+        import curses
+        if self.search_input is not None:
+            if key in ("\n", "\r", curses.KEY_ENTER):
+                self.search, self.search_input = self.search_input, None
+            elif key == "\x1b":
+                self.search_input = None
+            elif key in ("\b", "\x7f", curses.KEY_BACKSPACE):
+                self.search_input = self.search_input[:-1]
+            elif isinstance(key, str) and key.isprintable():
+                self.search_input += key
+            self.offset = 0
+            return False
+
+        if key in ("q", "Q"):
+            return True
+        if key == "s":
+            self.sort_index = (self.sort_index + 1) % len(COLUMNS)
+        elif key == "S":
+            self.sort_index = (self.sort_index - 1) % len(COLUMNS)
+        elif key == "r":
+            self.reverse = not self.reverse
+        elif key == "f":
+            self.status_filter = (self.status_filter + 1) % len(STATUS_FILTERS)
+            self.offset = 0
+        elif key == "c":
+            self.category_filter = (self.category_filter + 1) % len(CATEGORY_FILTERS)
+            self.offset = 0
+        elif key == "/":
+            self.search_input = self.search
+        elif key == "\x1b":
+            self.search = ""
+        elif key == " ":
+            self.source.refresh_now()
+        elif key == curses.KEY_DOWN:
+            self.offset += 1
+        elif key == curses.KEY_UP:
+            self.offset -= 1
+        elif key == curses.KEY_NPAGE:
+            self.offset += self.page_size()
+        elif key == curses.KEY_PPAGE:
+            self.offset -= self.page_size()
+        elif key == curses.KEY_HOME:
+            self.offset = 0
+        elif key == curses.KEY_END:
+            self.offset = len(self.view)
+        self.offset = max(0, self.offset)
+        return False
+
+    # ------------------------------------------------------------ 主循环
+
+    def run(self, stdscr):
+        import curses
+        curses.curs_set(0)
+        stdscr.timeout(int(DASHBOARD_FRAME_INTERVAL * 1000))
+        colors = {}
+        if curses.has_colors():
+            curses.use_default_colors()
+            for n, (status, color, bold) in enumerate((
+                    ('premium_alert', curses.COLOR_GREEN, True), ('discount_alert', curses.COLOR_RED, True),
+                    ('anomaly_alert', curses.COLOR_YELLOW, True), ('premium', curses.COLOR_GREEN, False),
+                    ('discount', curses.COLOR_RED, False)), start=1):
+                curses.init_pair(n, color, -1)
+                colors[status] = curses.color_pair(n) | (curses.A_BOLD if bold else 0)
+        renderer = CellRenderer(stdscr)
+
+        while True:
+            size = stdscr.getmaxyx()
+            if size != self.size:
+                self.size = size
+                self._make_layout(size[1])
+                renderer.invalidate()
+                self.frame_key = None
+            self._rebuild_view()
+            frame_key = (self.view_key, self.offset, int(time.time()), self.output.latest(),
+                         self.source.changes(), self.search_input)
+            if frame_key != self.frame_key:
+                self.frame_key = frame_key
+                renderer.draw(self.build_frame(size[0], size[1], colors))
+            try:
+                key = stdscr.get_wch()
+            except curses.error:
+                continue  # 超时无按键
+            if key == curses.KEY_RESIZE:
+                continue
+            if self.handle_key(key):
+                return
+
+
+def run_dashboard(server=None, interval=DASHBOARD_CYCLE_INTERVAL, profile=False):
+    """
+    运行终端看板（按 q 退出）
+
+    Args:
+        server: --serve 实例地址；为空时在本进程中循环执行监控
+        interval: 本地模式下两轮监控开始时间的间隔（秒）
+    """
+    import curses
+    import locale
+
+    if not sys.stdout.isatty():
+        print("终端看板需要在交互式终端中运行")
+        return
+    locale.setlocale(locale.LC_ALL, "")  # curses 按本地编码输出中文
+    os.environ.setdefault("ESCDELAY", "25")  # Esc 键无需等待默认的 1 秒
+
+    output = OutputTail()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = output
+    source = None
+    try:
+        source = RemoteSource(server) if server else LocalSource(interval, profile=profile)
+        curses.wrapper(Dashboard(source.start(), output).run)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if source:
+            source.stop()
+        sys.stdout, sys.stderr = stdout, stderr
+        # 退出后打印最近的程序输出，便于查看错误信息
+        for line in list(output.lines)[-10:]:
+            print(line)
@@ -4,11 +4,84 @@ LOF基金溢价监控程序 - 数据获取模块
 """
 
 import os
-import pandas as pd
-import akshare as ak
-import requests
-from bs4 import BeautifulSoup
-from config import LOF_FUNDS_FILE
+from config import CATEGORY_WORKERS, QUOTE_BATCH_SIZE, config
+from snapshot import save_snapshot
+from metrics import metrics, host_of
+from fetch_cache import get_fetch_cache
+
+# 东方财富基金详情页地址（回放模式下指向本地替身服务）
+FUND_PAGE_URL = "https://fund.eastmoney.com/{code}.html"
+
+# akshare 接口实际访问的主机（用于指标统计）
+SINA_LIST_HOST = "vip.stock.finance.sina.com.cn"
+EASTMONEY_NAV_HOST = "fund.eastmoney.com"
+
+# 基金列表字段：成交量单位为份，成交额单位为元
+LIST_COLUMNS = ['market', 'code', 'name', 'market_price', 'volume', 'amount']
+
+EASTMONEY_QUOTE_HOST = "push2.eastmoney.com"
+
+# 新浪行情接口：按代码批量查询（回放模式下指向本地替身服务）
+QUOTE_URL = "https://hq.sinajs.cn/list="
+QUOTE_HEADERS = {"Referer": "https://finance.sina.com.cn"}
+
+# 详情页未修改（条件请求返回 304）
+NOT_MODIFIED = object()
+
+
+def _to_number(value):
+    """转换为 float，缺失或非法值返回 None"""
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return None if number != number else number  # NaN
+
+
+def _split_market(code_with_prefix):
+    """剥离 sz/sh 前缀，返回 (market, code)"""
+    if code_with_prefix.startswith(('sz', 'sh')):
+        return code_with_prefix[:2], code_with_prefix[2:]
+    return '', code_with_prefix
+
+
+def get_sina_category_list(symbol):
+    """
+    获取新浪基金分类（LOF基金 / ETF基金 / 封闭式基金）的列表及最新场内价格（实时数据）
+    
+    Args:
+        symbol: fund_etf_category_sina 的分类名称
+    
+    Returns:
+        DataFrame: 包含 market, code, name, market_price, volume, amount 字段的DataFrame
+    """
+    # akshare/pandas 导入耗时较长，延迟到首次获取数据时加载
+    import pandas as pd
+    
+    try:
+        import akshare as ak
+        
+        with metrics.track("list_fetch", SINA_LIST_HOST):
+            raw_df = ak.fund_etf_category_sina(symbol=symbol)
+        
+        # 处理数据 - 剥离代码前缀，同时保存最新价格
+        result = []
+        for _, row in raw_df.iterrows():
+            market, code = _split_market(row['代码'])
+            result.append({
+                'market': market,
+                'code': code,
+                'name': row['名称'],
+                'market_price': _to_number(row['最新价']),
+                'volume': _to_number(row.get('成交量')),
+                'amount': _to_number(row.get('成交额'))
+            })
+        
+        return pd.DataFrame(result, columns=LIST_COLUMNS)
+        
+    except Exception as e:
+        print(f"获取{symbol}列表失败: {e}")
+        return pd.DataFrame(columns=LIST_COLUMNS)
 
 
 def get_lof_fund_list_with_price():
@@ -18,53 +91,264 @@ def get_lof_fund_list_with_price():
     通过 fund_etf_category_sina 接口同时获取基金列表和最新价格
     
     Returns:
-        DataFrame: 包含 market, code, name, market_price 字段的DataFrame
+        DataFrame: 包含 market, code, name, market_price, volume, amount 字段的DataFrame
+    """
+    return get_sina_category_list("LOF基金")
+
+
+def get_reits_list_with_price():
+    """
+    获取公募REITs列表及最新场内价格（实时数据）
+    
+    Returns:
+        DataFrame: 包含 market, code, name, market_price, volume, amount 字段的DataFrame
     """
-    # print("从akshare获取LOF基金列表及最新价格...")
+    import pandas as pd
+    
     try:
-        raw_df = ak.fund_etf_category_sina(symbol="LOF基金")
+        import akshare as ak
+        
+        with metrics.track("list_fetch", EASTMONEY_QUOTE_HOST):
+            raw_df = ak.reits_realtime_em()
         
-        # 处理数据 - 剥离代码前缀，同时保存最新价格
         result = []
         for _, row in raw_df.iterrows():
-            code_with_prefix = row['代码']
-            # 剥离 sz 或 sh 前缀
-            if code_with_prefix.startswith('sz'):
-                market = 'sz'
-                code = code_with_prefix[2:]
-            elif code_with_prefix.startswith('sh'):
-                market = 'sh'
-                code = code_with_prefix[2:]
-            else:
-                market = ''
-                code = code_with_prefix
-            
-            # 获取最新价格
-            try:
-                market_price = float(row['最新价']) if pd.notna(row['最新价']) else None
-            except (ValueError, TypeError):
-                market_price = None
-            
+            code = str(row['代码']).zfill(6)
+            volume = _to_number(row.get('成交量'))
             result.append({
-                'market': market,
+                'market': 'sh' if code.startswith('5') else 'sz',
                 'code': code,
                 'name': row['名称'],
-                'market_price': market_price
+                'market_price': _to_number(row['最新价']),
+                'volume': volume * 100 if volume is not None else None,  # 东方财富行情成交量单位为手
+                'amount': _to_number(row.get('成交额'))
             })
         
-        df = pd.DataFrame(result)
+        return pd.DataFrame(result, columns=LIST_COLUMNS)
         
-        # 保存基金列表到本地文件
-        #save_df = df[['market', 'code', 'name']].copy()
-        #save_df.to_csv(LOF_FUNDS_FILE, index=False, encoding='utf-8-sig')
-        # print(f"LOF基金列表已保存到 {LOF_FUNDS_FILE}，共 {len(df)} 只基金")
+    except Exception as e:
+        print(f"获取REITs列表失败: {e}")
+        return pd.DataFrame(columns=LIST_COLUMNS)
+
+
+def get_etf_nav_table():
+    """
+    一次请求获取全部场内ETF的最新单位净值（代替逐只请求净值接口）
+    
+    Returns:
+        dict: 基金代码 -> (nav_price, nav_date)，失败返回空字典
+    """
+    try:
+        import akshare as ak
+        
+        with metrics.track("nav_fetch", EASTMONEY_NAV_HOST) as span:
+            df = ak.fund_etf_fund_daily_em()
+            if df is None or df.empty:
+                span.outcome = 'failure'
+                return {}
         
-        return df
+        # 净值列名形如 "2026-02-01-单位净值"，最近日期在前；最近一日缺失时取前一日
+        suffix = "-单位净值"
+        nav_columns = [(col, str(col)[:-len(suffix)]) for col in df.columns if str(col).endswith(suffix)]
+        table = {}
+        for record in df.to_dict(orient="records"):
+            for col, nav_date in nav_columns:
+                nav_price = _to_number(record[col])
+                if nav_price:
+                    table[str(record['基金代码']).zfill(6)] = (nav_price, nav_date)
+                    break
+        return table
         
     except Exception as e:
-        print(f"获取LOF基金列表失败: {e}")
-        return pd.DataFrame(columns=['market', 'code', 'name', 'market_price'])
+        print(f"获取ETF净值失败: {e}")
+        return {}
+
+
+# 品种分类：
+#     list       基金列表及场内价格
+#     nav_table  可选，一次请求获取整类净值的接口，缺失的基金再逐只请求 get_nav_price
+#     state      是否抓取详情页交易状态（申购/赎回状态只对 LOF 的申赎套利有意义）
+# 通过模块级名称调用，录制/回放替换的函数同样生效
+CATEGORIES = {
+    "lof": {"label": "LOF", "list": lambda: get_lof_fund_list_with_price(), "nav_table": None, "state": True},
+    "etf": {"label": "ETF", "list": lambda: get_sina_category_list("ETF基金"),
+            "nav_table": lambda: get_etf_nav_table(), "state": False},
+    "closed": {"label": "封闭式", "list": lambda: get_sina_category_list("封闭式基金"), "nav_table": None, "state": False},
+    "reits": {"label": "REITs", "list": lambda: get_reits_list_with_price(), "nav_table": None, "state": False}
+}
+
+
+def get_fund_list(category):
+    """
+    获取某一分类的基金列表及最新场内价格
+    
+    Returns:
+        DataFrame: LIST_COLUMNS 字段
+    """
+    return CATEGORIES[category]['list']()
+
+
+def _parse_hq(text):
+    """
+    解析新浪行情接口的响应
+    
+    每行格式: var hq_str_sz161005="名称,今开,昨收,最新价,最高,最低,买一,卖一,成交量,成交额,...";
+    
+    Returns:
+        generator: (行情代码, 字段列表)
+    """
+    for line in text.splitlines():
+        if not line.startswith("var hq_str_") or '"' not in line:
+            continue
+        yield line[len("var hq_str_"):line.index("=")], line.split('"')[1].split(",")
+
+
+def get_quotes(fund_df):
+    """
+    按代码批量查询场内行情（实时列表获取失败、或缓存的基金不在实时列表中时使用）
+    
+    Args:
+        fund_df: 含 market, code 列的 DataFrame
+    
+    Returns:
+        dict: 基金代码 -> (market_price, volume, amount)，查询失败的基金不在结果中
+    """
+    import requests
+    
+    symbols = [market + code for market, code in zip(fund_df['market'], fund_df['code']) if market]
+    quotes = {}
+    for start in range(0, len(symbols), QUOTE_BATCH_SIZE):
+        batch = symbols[start:start + QUOTE_BATCH_SIZE]
+        try:
+            with metrics.track("quote_fetch", host_of(QUOTE_URL)) as span:
+                response = requests.get(QUOTE_URL + ",".join(batch), headers=QUOTE_HEADERS, timeout=10)
+                if response.status_code != 200:
+                    span.outcome = 'failure'
+                    continue
+            response.encoding = 'gbk'
+        except Exception as e:
+            print(f"查询场内行情失败: {e}")
+            continue
+        for symbol, fields in _parse_hq(response.text):
+            if len(fields) < 10:
+                continue
+            price = _to_number(fields[3]) or _to_number(fields[2])  # 未成交时沿用昨收
+            quotes[symbol[2:]] = (price, _to_number(fields[8]), _to_number(fields[9]))
+    return quotes
+
+
+def _quote_cached(cached_df):
+    """缓存的基金列表 + 逐只查询的行情 -> LIST_COLUMNS"""
+    quotes = get_quotes(cached_df) if not cached_df.empty else {}
+    df = cached_df[['market', 'code', 'name']].copy()
+    df['market_price'] = [quotes.get(code, (None,))[0] for code in df['code']]
+    df['volume'] = [quotes.get(code, (None, None))[1] for code in df['code']]
+    df['amount'] = [quotes.get(code, (None, None, None))[2] for code in df['code']]
+    return df
+
 
+def get_universe(categories=None):
+    """
+    获取各分类的基金列表并合并（同一代码出现在多个分类时保留先出现的分类）
+    
+    基金成员以 lof_funds.csv 中的缓存为准，每天用实时列表刷新一次；刷新间隔内实时列表只提供价格，
+    实时列表获取失败时使用缓存的基金列表并逐只查询行情（见 universe.py）。
+    
+    Args:
+        categories: 分类列表，默认取配置项 categories
+    
+    Returns:
+        DataFrame: LIST_COLUMNS 字段及 category 列
+    """
+    import pandas as pd
+    import universe
+    
+    cached = universe.load_universe()
+    refreshed = {}  # category -> 实时列表（本轮刷新成员的分类）
+    frames = []
+    for category in categories or config.get("categories") or ["lof"]:
+        if category not in CATEGORIES:
+            print(f"未知的基金分类: {category}")
+            continue
+        label = CATEGORIES[category]['label']
+        live = get_fund_list(category)
+        cached_df = cached[cached['category'] == category]
+        if live.empty:
+            if cached_df.empty:
+                continue
+            print(f"{label}基金列表获取失败，使用缓存的 {len(cached_df)} 只基金并逐只查询行情")
+            df = _quote_cached(cached_df)
+        elif universe.refresh_due(cached_df):
+            df = refreshed[category] = live
+        else:
+            # 只更新价格：成员以缓存为准，实时列表中缺少的基金逐只查询
+            prices = live.drop_duplicates('code').set_index('code')[['market_price', 'volume', 'amount']]
+            known = cached_df['code'].isin(prices.index)
+            parts = [cached_df[known][['market', 'code', 'name']].join(prices, on='code')]
+            if not known.all():
+                parts.append(_quote_cached(cached_df[~known]))
+            df = pd.concat(parts).sort_index().reset_index(drop=True)[LIST_COLUMNS]
+        frames.append(df.assign(category=category))
+    
+    if refreshed:
+        for category, live in refreshed.items():
+            previous = cached[cached['category'] == category]
+            if not previous.empty:
+                universe.report_diff(CATEGORIES[category]['label'], *universe.diff_universe(previous, live))
+        kept = cached[~cached['category'].isin(list(refreshed))]
+        universe.save_universe(pd.concat([kept] + [universe.stamp(live, category) for category, live in refreshed.items()],
+                                         ignore_index=True))
+    
+    if not frames:
+        return pd.DataFrame(columns=LIST_COLUMNS + ['category'])
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    return pd.concat(frames, ignore_index=True).drop_duplicates('code').reset_index(drop=True)
+
+
+def category_budgets():
+    """各分类的并发请求数（配置项 category_workers 覆盖默认值）"""
+    budgets = dict(CATEGORY_WORKERS)
+    for category, workers in (config.get("category_workers") or {}).items():
+        if category in budgets:
+            budgets[category] = max(1, int(workers))
+    return budgets
+
+
+def get_index_quotes(codes):
+    """
+    获取指数的实时行情（一次请求，用于估算净值）
+    
+    Args:
+        codes: 指数代码列表 (如 sh000300)
+    
+    Returns:
+        dict: 指数代码 -> (最新价, 昨收, 行情日期 'YYYY-MM-DD')，失败返回空字典
+    """
+    import requests
+    
+    if not codes:
+        return {}
+    try:
+        with metrics.track("index_fetch", host_of(QUOTE_URL)) as span:
+            response = requests.get(QUOTE_URL + ",".join(codes), headers=QUOTE_HEADERS, timeout=10)
+            if response.status_code != 200:
+                span.outcome = 'failure'
+                return {}
+        response.encoding = 'gbk'
+    except Exception as e:
+        print(f"获取指数行情失败: {e}")
+        return {}
+    
+    # 指数行情第 31 个字段为行情日期（最近一个交易日，休市时不变）
+    quotes = {}
+    for symbol, fields in _parse_hq(response.text):
+        if len(fields) < 31:
+            continue
+        last, prev_close = _to_number(fields[3]), _to_number(fields[2])
+        if last and prev_close and fields[30]:
+            quotes[symbol] = (last, prev_close, fields[30])
+    return quotes
 
 
 def get_nav_price(code):
@@ -81,7 +365,12 @@ def get_nav_price(code):
             失败返回 (None, None)
     """
     try:
-        df = ak.fund_open_fund_info_em(symbol=code, indicator="单位净值走势")
+        import akshare as ak
+        
+        with metrics.track("nav_fetch", EASTMONEY_NAV_HOST) as span:
+            df = ak.fund_open_fund_info_em(symbol=code, indicator="单位净值走势")
+            if df is None or df.empty:
+                span.outcome = 'failure'
         
         if df is not None and not df.empty:
             # 使用iloc按位置获取，避免编码问题导致的列名匹配失败
@@ -104,86 +393,217 @@ def get_nav_price(code):
         return None, None
 
 
-def get_all_fund_data(progress_callback=None, data_callback=None):
+def _fetch_fund_detail(code, nav, fetch_state):
     """
-    获取所有LOF基金的完整数据（场内价格和场外净值）
+    获取单只基金的场外净值及交易状态（在分类的线程池中执行）
+    
+    Args:
+        nav: 整类净值表中已有的 (nav_price, nav_date)，None 表示需要单独请求（先查抓取缓存）
+        fetch_state: 是否抓取详情页交易状态
+    """
+    if nav is None:
+        cache = get_fetch_cache()
+        nav = cache.get_nav(code)
+        metrics.record_cache("nav_fetch", nav is not None)
+        if nav is None:
+            nav = get_nav_price(code)
+            cache.put_nav(code, *nav)
+    nav_price, nav_date = nav
+    fund_state = parse_fund_state(code) if fetch_state else ""
+    return nav_price, nav_date, fund_state
+
+
+def get_all_fund_data(progress_callback=None, data_callback=None, list_callback=None, shard=None, categories=None):
+    """
+    获取所有基金的完整数据（场内价格和场外净值）
+    
+    各分类的基金提交到该分类自己的线程池（并发数见 category_budgets），
+    回调仍在调用线程中按完成顺序依次执行，调用方无需考虑线程安全。
     
     Args:
         progress_callback: 可选的进度回调函数 (current, total, name) -> None
         data_callback: 可选的数据回调函数 (fund_data) -> None
+        list_callback: 可选的列表回调函数 (fund_df) -> None，基金列表获取后、逐只获取净值前调用
+        shard: 可选的分片 (index, count)，只获取属于该分片的基金，且不保存快照（由 merge 合并后保存）
+        categories: 可选的分类列表，默认取配置项 categories
     
     Returns:
-        list: 包含所有基金数据的列表
+        list: 包含所有基金数据的列表（与基金列表顺序一致）
     """
-    # 批量获取基金列表和场内价格
-    fund_df = get_lof_fund_list_with_price()
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    
+    # 批量获取各分类的基金列表和场内价格
+    fund_df = get_universe(categories)
+    
+    if shard:
+        from sharding import select_shard
+        fund_df = select_shard(fund_df, shard)
     
     if fund_df.empty:
         return []
     
-    result = []
-    total = len(fund_df)
+    if list_callback:
+        list_callback(fund_df)
+    
+    # 估算净值：与场内价格同一时刻获取全部指数行情，一步更新所有基金的估值系数
+    iopv_engine = None
+    if config.get("nav_source") == "estimated":
+        from iopv import get_iopv_engine
+        iopv_engine = get_iopv_engine()
+        if iopv_engine:
+            iopv_engine.update(get_index_quotes(iopv_engine.index_codes))
+    
+    rows = fund_df.to_dict(orient="records")
+    result = [None] * len(rows)
+    total = len(rows)
     
     # 获取当前时间作为场内价格时间（因为是实时接口）
     import datetime
     market_time = datetime.datetime.now().strftime('%H:%M:%S')
     
-    for idx, row in fund_df.iterrows():
-        code = row['code']
-        name = row['name']
-        market_price = row['market_price']
-        
-        # 获取场外净值
-        nav_price, nav_date = get_nav_price(code)
-        
-        # 获取基金状态
-        fund_state = parse_fund_state(code)
-        
-        fund_data = {
-            'code': code,
-            'name': name,
-            'market': row['market'],
-            'market_price': market_price,
-            'market_time': market_time,  # 新增: 场内价格时间
-            'nav_price': nav_price,
-            'nav_date': nav_date,         # 新增: 净值日期
-            'fund_state': fund_state      # 新增: 基金状态
-        }
-        
-        # 回调进度
-        if progress_callback:
-            progress_callback(idx + 1, total, name, fund_data)
-        
-        # 实时回调每个基金数据
-        if data_callback:
-            data_callback(fund_data)
+    budgets = category_budgets()
+    pools = {}
+    futures = {}
+    try:
+        # 按分类提交：先提交的分类在后台抓取时，再请求下一分类的整类净值表
+        for category in dict.fromkeys(row['category'] for row in rows):
+            spec = CATEGORIES[category]
+            pool = pools[category] = ThreadPoolExecutor(max_workers=budgets[category],
+                                                        thread_name_prefix=f"fetch-{category}")
+            nav_table = spec['nav_table']() if spec['nav_table'] else {}
+            for i, row in enumerate(rows):
+                if row['category'] == category:
+                    future = pool.submit(_fetch_fund_detail, row['code'], nav_table.get(row['code']), spec['state'])
+                    futures[future] = i
         
-        result.append(fund_data)
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            row = rows[i]
+            code = row['code']
+            nav_price, nav_date, fund_state = future.result()
+            
+            fund_data = {
+                'code': code,
+                'name': row['name'],
+                'market': row['market'],
+                'category': row['category'],
+                'market_price': _to_number(row['market_price']),
+                'market_time': market_time,  # 新增: 场内价格时间
+                'volume': _to_number(row.get('volume')),
+                'amount': _to_number(row.get('amount')),
+                'nav_price': nav_price,
+                'nav_date': nav_date,         # 新增: 净值日期
+                'est_nav': iopv_engine.estimate(code, nav_price, nav_date) if iopv_engine else None,
+                'fund_state': fund_state      # 新增: 基金状态
+            }
+            
+            # 回调进度
+            if progress_callback:
+                progress_callback(done, total, row['name'], fund_data)
+            
+            # 实时回调每个基金数据
+            if data_callback:
+                data_callback(fund_data)
+            
+            result[i] = fund_data
+    finally:
+        # 回调异常时不再等待尚未开始的请求
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    # 保存本轮完整数据快照，供下次启动时预加载
+    if not shard:
+        save_snapshot(result)
     
     return result
 
 
-def parse_fund_state(code):
-    url = "https://fund.eastmoney.com/" + code +".html"
-    ret = ""
+def fetch_fund_page(code, conditional=False):
+    """
+    获取东方财富基金详情页HTML
+
+    Args:
+        code: 基金代码
+        conditional: 带上抓取缓存中的验证器发送条件请求
+
+    Returns:
+        str: 页面HTML；条件请求且页面未修改时返回 NOT_MODIFIED；失败返回 None
+    """
+    import requests
     
-    try:
-        response = requests.get(url, timeout=10)
+    url = FUND_PAGE_URL.format(code=code)
+    cache = get_fetch_cache()
+    headers = cache.validator_headers(url) if conditional else {}
+    with metrics.track("page_scrape", host_of(url)) as span:
+        response = requests.get(url, headers=headers, timeout=10)
+        if response.status_code == 304 and headers:
+            return NOT_MODIFIED
         response.encoding = response.apparent_encoding 
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            target_div = None
-            items = soup.find_all("div", class_="staticItem")
-            for item in items:
-                if "交易状态" in item.text:
-                    target_div = item
-                    break 
-            if target_div:
-                raw_text = target_div.get_text(strip=True)
-                clean_text = raw_text.replace('\xa0', ' ')
-                
-                ret = clean_text.replace("交易状态：", "")
+            cache.put_validator(url, response.headers)
+            return response.text
+        span.outcome = 'failure'
+    return None
+
+
+def extract_fund_state(html):
+    """
+    从基金详情页HTML中解析交易状态
+
+    Args:
+        html: 页面HTML
+
+    Returns:
+        str: 交易状态文本（如 "开放申购 开放赎回"），未找到返回空字符串
+    """
+    from bs4 import BeautifulSoup
+    
+    ret = ""
+    with metrics.track("page_parse") as span:
+        soup = BeautifulSoup(html, 'html.parser')
+        target_div = None
+        items = soup.find_all("div", class_="staticItem")
+        for item in items:
+            if "交易状态" in item.text:
+                target_div = item
+                break 
+        if target_div:
+            raw_text = target_div.get_text(strip=True)
+            clean_text = raw_text.replace('\xa0', ' ')
+            
+            ret = clean_text.replace("交易状态：", "")
+        else:
+            span.outcome = 'failure'
+    return ret
+
+
+def parse_fund_state(code):
+    """
+    获取基金交易状态
+
+    Args:
+        code: 基金代码
+
+    Returns:
+        str: 交易状态文本，失败返回空字符串
+    """
+    cache = get_fetch_cache()
+    ret = cache.get_state(code)
+    metrics.record_cache("page_scrape", ret is not None)
+    if ret is not None:
+        return ret
+    
+    ret = ""
+    stale = cache.stale_state(code)
+    try:
+        html = fetch_fund_page(code, conditional=stale is not None)
+        if html is NOT_MODIFIED:
+            ret = stale
+            cache.put_state(code, ret)
+        elif html:
+            ret = extract_fund_state(html)
+            cache.put_state(code, ret)
     except Exception as e:
         pass
     
-    return ret
\ No newline at end of file
+    return ret
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 变化检测模块
+
+连续刷新时，两轮之间绝大多数基金的场内价格和净值都没有变化。DeltaEngine 位于 data_fetcher
+与界面/终端之间，按基金代码保存上一轮的输入及计算结果，每只新到的基金先比较输入：
+    price   场内价格、成交量或成交额变化
+    nav     净值、净值日期或估算净值变化
+    state   交易状态文本变化
+    added   首次出现（或名称、分类变化）
+    status  计算后的状态发生转换（如 normal -> premium_alert），由 commit 返回
+    removed 本轮完整刷新后不再出现的基金，由 end_cycle 返回
+输入均未变化的基金直接沿用上一轮的结果，不再重新计算、告警或重绘；判定参数（阈值、净值来源、
+规则文件）变化时全部基金重新计算。未变化的基金也不重复计入滚动统计，同一观测值反复计入会压低方差。
+"""
+
+import os
+from collections import namedtuple, Counter
+from config import RULES_FILE
+
+PRICE_CHANGED = 'price'
+NAV_CHANGED = 'nav'
+STATE_CHANGED = 'state'
+ADDED = 'added'
+STATUS_CHANGED = 'status'
+REMOVED = 'removed'
+
+CHANGE_LABELS = {
+    PRICE_CHANGED: "价格", NAV_CHANGED: "净值", STATE_CHANGED: "交易状态",
+    STATUS_CHANGED: "状态转换", ADDED: "新增", REMOVED: "移除"
+}
+
+# 一只基金的变化：kinds 为变化类型集合（空集合表示未变化），previous 为上一轮的计算结果
+FundDelta = namedtuple('FundDelta', ['code', 'kinds', 'previous'])
+
+# 一次状态转换
+StatusChange = namedtuple('StatusChange', ['code', 'old', 'new'])
+
+
+def _inputs(fund):
+    """按变化类型分组的输入值"""
+    return {
+        ADDED: (fund.get('name'), fund.get('category') or 'lof'),
+        PRICE_CHANGED: (fund.get('market_price'), fund.get('volume'), fund.get('amount')),
+        NAV_CHANGED: (fund.get('nav_price'), fund.get('nav_date'), fund.get('est_nav')),
+        STATE_CHANGED: (fund.get('fund_state') or '',)
+    }
+
+
+def evaluation_context(premium_threshold, discount_threshold, anomaly_zscore, nav_source, rules_path=RULES_FILE):
+    """判定参数（全局阈值、净值来源、规则文件修改时间），与上一轮不同时全部基金重新计算"""
+    try:
+        rules_mtime = os.path.getmtime(rules_path)
+    except OSError:
+        rules_mtime = None
+    return premium_threshold, discount_threshold, anomaly_zscore, nav_source, rules_mtime
+
+
+class DeltaEngine:
+    """按基金代码保存上一轮的输入及计算结果，只让输入变化的基金进入计算"""
+
+    def __init__(self):
+        self.inputs = {}  # code -> _inputs(fund)
+        self.results = {}  # code -> 上一轮的计算结果（由调用方决定内容）
+        self.statuses = {}  # code -> 上一轮的状态
+        self.context = None
+        self.seen = set()
+        self.counts = Counter()
+
+    def reset(self):
+        """丢弃全部记录，下一轮所有基金按新增处理"""
+        self.inputs.clear()
+        self.results.clear()
+        self.statuses.clear()
+
+    def begin_cycle(self, context=None):
+        """
+        开始一轮
+
+        Args:
+            context: 判定参数（见 evaluation_context），与上一轮不同时全部基金重新计算
+        """
+        if context != self.context:
+            self.reset()
+            self.context = context
+        self.seen = set()
+        self.counts = Counter()
+
+    def diff(self, fund):
+        """
+        比较一只基金与上一轮的输入
+
+        Returns:
+            FundDelta: kinds 为空表示输入未变化，可直接沿用 previous
+        """
+        code = fund['code']
+        self.seen.add(code)
+        current = _inputs(fund)
+        last = self.inputs.get(code)
+        if last is None or last[ADDED] != current[ADDED] or code not in self.results:
+            kinds = frozenset((ADDED,))
+        else:
+            kinds = frozenset(kind for kind, values in current.items() if values != last[kind])
+        self.inputs[code] = current
+        if kinds:
+            self.counts.update(kinds)
+        else:
+            self.counts['unchanged'] += 1
+        return FundDelta(code, kinds, self.results.get(code))
+
+    def commit(self, code, result, status):
+        """
+        记录重新计算后的结果
+
+        Returns:
+            StatusChange: 状态相对上一轮发生转换时返回，否则为 None（首次出现的基金不算转换）
+        """
+        self.results[code] = result
+        old = self.statuses.get(code)
+        self.statuses[code] = status
+        if old is not None and old != status:
+            self.counts[STATUS_CHANGED] += 1
+            return StatusChange(code, old, status)
+        return None
+
+    def end_cycle(self, complete=True):
+        """
+        结束一轮
+
+        Args:
+            complete: 本轮是否完整获取了基金列表（失败的一轮不移除任何基金）
+
+        Returns:
+            list: 本轮未出现、已移除的基金代码
+        """
+        if not complete:
+            return []
+        removed = [code for code in self.inputs if code not in self.seen]
+        for code in removed:
+            self.inputs.pop(code, None)
+            self.results.pop(code, None)
+            self.statuses.pop(code, None)
+        self.counts[REMOVED] += len(removed)
+        return removed
+
+    def summary(self):
+        """本轮变化统计，如 "价格 12 / 净值 3 / 状态转换 1，未变化 820" """
+        parts = [f"{label} {self.counts[kind]}" for kind, label in CHANGE_LABELS.items() if self.counts[kind]]
+        return (" / ".join(parts) or "无变化") + f"，未变化 {self.counts['unchanged']}"
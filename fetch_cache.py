@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 抓取缓存模块
+
+缓存逐只请求的上游数据，长期运行（界面、--serve）与每次全新启动的 --run-once 命中率一致：
+    nav         场外净值及净值日期：当日净值发布前一直有效（见 nav_expiry）
+    state       详情页交易状态：FUND_STATE_TTL 内有效，过期后带验证器条件请求，304 时直接沿用
+    validators  详情页的 HTTP 验证器 (ETag / Last-Modified)
+（基金列表的缓存见 universe.py）
+
+缓存保存为单个紧凑的缓存包 (cache_bundle.bin)：
+    8 字节标识 + 1 字节版本 + 32 字节 SHA-256 + gzip 压缩的 JSON
+读取时校验标识、版本及摘要，创建时间超过 CACHE_BUNDLE_MAX_AGE 的缓存包整体丢弃，过期条目在加载时清理。
+GitHub Actions 中在作业开始时恢复、结束时保存该文件即可（见 .github/workflows/monitor.yml）。
+
+用法:
+    python main.py cache show                  # 缓存条目数及命中情况
+    python main.py cache export cache.bin      # 导出缓存包
+    python main.py cache import cache.bin      # 导入缓存包（与现有缓存合并，较新的条目优先）
+    python main.py cache clear
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from config import (
+    CACHE_BUNDLE_FILE, NAV_REFRESH_HOUR, NAV_PENDING_TTL, FUND_STATE_TTL, CACHE_STALE_MAX_AGE,
+    CACHE_BUNDLE_MAX_AGE
+)
+
+BUNDLE_MAGIC = b"LOFCACHE"
+BUNDLE_VERSION = 1
+
+# 缓存包路径（回放模式下指向临时文件，避免与真实缓存混用）
+BUNDLE_PATH = CACHE_BUNDLE_FILE
+
+
+class BundleError(ValueError):
+    """缓存包损坏、版本不符或已过期"""
+
+
+def nav_expiry(fetched_at, nav_date):
+    """
+    净值缓存的失效时间
+
+    当日 NAV_REFRESH_HOUR 之前获取的净值一直有效到该时刻；发布时段内获取的，
+    已是当日净值则有效到次日该时刻，否则（尚未发布，或 QDII 等滞后的基金）NAV_PENDING_TTL 后重新获取。
+
+    Returns:
+        float: 失效时间戳
+    """
+    fetched = datetime.fromtimestamp(fetched_at)
+    boundary = fetched.replace(hour=NAV_REFRESH_HOUR, minute=0, second=0, microsecond=0)
+    if fetched < boundary:
+        return boundary.timestamp()
+    if nav_date and nav_date >= fetched.strftime("%Y-%m-%d"):
+        return (boundary + timedelta(days=1)).timestamp()
+    return fetched_at + NAV_PENDING_TTL
+
+
+class FetchCache:
+    """逐只抓取数据的缓存（线程安全，各分类的抓取线程并发读写）"""
+
+    def __init__(self):
+        self.navs = {}  # code -> [nav_price, nav_date, fetched_at]
+        self.states = {}  # code -> [fund_state, fetched_at]
+        self.validators = {}  # url -> [etag, last_modified, stored_at]
+        self.created = time.time()
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------ 净值
+
+    def get_nav(self, code, now=None):
+        """未失效的缓存净值 (nav_price, nav_date)，没有返回 None"""
+        entry = self.navs.get(code)
+        if entry is None or (now or time.time()) >= nav_expiry(entry[2], entry[1]):
+            return None
+        return entry[0], entry[1]
+
+    def put_nav(self, code, nav_price, nav_date):
+        if nav_price is None:
+            return
+        with self._lock:
+            self.navs[code] = [nav_price, nav_date, time.time()]
+            self.dirty = True
+
+    # ------------------------------------------------------------ 交易状态
+
+    def get_state(self, code, now=None):
+        """未过期的交易状态，没有返回 None"""
+        entry = self.states.get(code)
+        if entry is None or (now or time.time()) - entry[1] >= FUND_STATE_TTL:
+            return None
+        return entry[0]
+
+    def stale_state(self, code):
+        """已过期但仍可用于重新验证的交易状态"""
+        entry = self.states.get(code)
+        return entry[0] if entry else None
+
+    def put_state(self, code, fund_state):
+        with self._lock:
+            self.states[code] = [fund_state, time.time()]
+            self.dirty = True
+
+    # ------------------------------------------------------------ HTTP 验证器
+
+    def validator_headers(self, url):
+        """条件请求头 (If-None-Match / If-Modified-Since)"""
+        entry = self.validators.get(url)
+        headers = {}
+        if entry:
+            if entry[0]:
+                headers["If-None-Match"] = entry[0]
+            if entry[1]:
+                headers["If-Modified-Since"] = entry[1]
+        return headers
+
+    def put_validator(self, url, response_headers):
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        with self._lock:
+            if etag or last_modified:
+                self.validators[url] = [etag, last_modified, time.time()]
+            else:
+                self.validators.pop(url, None)
+            self.dirty = True
+
+    # ------------------------------------------------------------ 缓存包
+
+    def prune(self, now=None):
+        """清理已失效且不再用于重新验证的条目"""
+        now = now or time.time()
+        with self._lock:
+            self.navs = {code: e for code, e in self.navs.items() if now < nav_expiry(e[2], e[1])}
+            self.states = {code: e for code, e in self.states.items() if now - e[1] < CACHE_STALE_MAX_AGE}
+            self.validators = {url: e for url, e in self.validators.items() if now - e[2] < CACHE_STALE_MAX_AGE}
+
+    def to_payload(self):
+        with self._lock:
+            return {
+                'created': time.time(),
+                'navs': dict(self.navs),
+                'states': dict(self.states),
+                'validators': dict(self.validators)
+            }
+
+    def merge_payload(self, payload):
+        """合并另一份缓存（同一条目保留较新的）"""
+        with self._lock:
+            for name, stamp in (('navs', 2), ('states', 1), ('validators', 2)):
+                entries = getattr(self, name)
+                for key, entry in payload.get(name, {}).items():
+                    current = entries.get(key)
+                    if current is None or entry[stamp] > current[stamp]:
+                        entries[key] = list(entry)
+            self.dirty = True
+
+    def summary(self):
+        now = time.time()
+        fresh_navs = sum(1 for e in self.navs.values() if now < nav_expiry(e[2], e[1]))
+        fresh_states = sum(1 for e in self.states.values() if now - e[1] < FUND_STATE_TTL)
+        return {
+            'navs': len(self.navs), 'fresh_navs': fresh_navs,
+            'states': len(self.states), 'fresh_states': fresh_states,
+            'validators': len(self.validators)
+        }
+
+
+def encode_bundle(payload):
+    """缓存数据 -> 缓存包字节"""
+    body = gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode('utf-8'),
+                         compresslevel=9)
+    return BUNDLE_MAGIC + bytes([BUNDLE_VERSION]) + hashlib.sha256(body).digest() + body
+
+
+def decode_bundle(data, now=None):
+    """
+    缓存包字节 -> 缓存数据
+
+    Raises:
+        BundleError: 标识、版本或摘要不符，或缓存包已过期
+    """
+    header = len(BUNDLE_MAGIC) + 1 + 32
+    if len(data) < header or not data.startswith(BUNDLE_MAGIC):
+        raise BundleError("不是缓存包文件")
+    if data[len(BUNDLE_MAGIC)] != BUNDLE_VERSION:
+        raise BundleError(f"缓存包版本不符: {data[len(BUNDLE_MAGIC)]}")
+    digest, body = data[len(BUNDLE_MAGIC) + 1:header], data[header:]
+    if hashlib.sha256(body).digest() != digest:
+        raise BundleError("缓存包校验失败（文件损坏或不完整）")
+    payload = json.loads(gzip.decompress(body).decode('utf-8'))
+    age = (now or time.time()) - payload.get('created', 0)
+    if age > CACHE_BUNDLE_MAX_AGE:
+        raise BundleError(f"缓存包已过期（创建于 {age / 86400:.1f} 天前）")
+    return payload
+
+
+def export_bundle(cache, path):
+    """写出缓存包（临时文件 + 原子替换）"""
+    cache.prune()
+    data = encode_bundle(cache.to_payload())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def import_bundle(cache, path):
+    """
+    读取缓存包并合并到缓存
+
+    Returns:
+        bool: 是否成功导入；文件损坏或过期时打印原因并返回 False
+    """
+    try:
+        with open(path, 'rb') as f:
+            payload = decode_bundle(f.read())
+    except (OSError, BundleError, ValueError) as e:
+        print(f"读取缓存包失败: {e}，忽略缓存")
+        return False
+    cache.merge_payload(payload)
+    cache.prune()
+    return True
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fetch_cache():
+    """获取全局抓取缓存（首次调用时从缓存包加载）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FetchCache()
+            if os.path.exists(BUNDLE_PATH):
+                import_bundle(_cache, BUNDLE_PATH)
+                _cache.dirty = False
+        return _cache
+
+
+def reset_fetch_cache():
+    """丢弃全局抓取缓存，之后的抓取从空缓存开始（不读取缓存包）"""
+    global _cache
+    with _cache_lock:
+        _cache = FetchCache()
+        return _cache
+
+
+def save_fetch_cache():
+    """有修改时保存全局抓取缓存（监控循环结束时调用）"""
+    if _cache is not None and _cache.dirty:
+        try:
+            export_bundle(_cache, BUNDLE_PATH)
+            _cache.dirty = False
+        except Exception as e:
+            print(f"保存缓存包失败: {e}")
+
+
+def run_cache_command(args):
+    """执行 cache 子命令"""
+    if args.action == "clear":
+        reset_fetch_cache()
+        if os.path.exists(BUNDLE_PATH):
+            os.remove(BUNDLE_PATH)
+        print("缓存已清空")
+        return
+
+    cache = get_fetch_cache()
+    if args.action == "export":
+        size = export_bundle(cache, args.path)
+        print(f"缓存包已导出到 {args.path} ({size / 1024:.1f} KB)")
+    elif args.action == "import":
+        if import_bundle(cache, args.path):
+            export_bundle(cache, BUNDLE_PATH)
+            print(f"已导入 {args.path}")
+    summary = cache.summary()
+    print(f"净值: {summary['navs']} (有效 {summary['fresh_navs']})  "
+          f"交易状态: {summary['states']} (有效 {summary['fresh_states']})  "
+          f"验证器: {summary['validators']}")
+
+
+def add_cache_parser(subparsers):
+    """注册 cache 子命令参数"""
+    p = subparsers.add_parser("cache", help="Show, export or import the fetch cache bundle")
+    p.add_argument("action", choices=["show", "export", "import", "clear"], help="操作")
+    p.add_argument("path", nargs="?", default=CACHE_BUNDLE_FILE, help=f"缓存包路径 (默认 {CACHE_BUNDLE_FILE})")
+    return p
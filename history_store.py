@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 历史数据存储模块
+
+每轮监控结束后，将完整的基金数据表（价格、净值、溢价率、状态等）按天分区保存在 history/ 中：
+    - 当天：以列式块追加写入 YYYY-MM-DD.cols（只追加不改写），每块一轮，块内基金代码有序
+        - 数值列使用 array('d') 紧凑存储，缺失值记为 NaN
+        - 字符串列（净值日期、状态、基金状态）字典编码为 取值表 + 下标数组
+    - 往日：写入新一天的数据时整理为 YYYY-MM-DD.day：全天的行按 (基金代码, 时间) 排序，
+      每列一段连续数组，文件头保存 基金代码 -> 行区间 的索引及字符串列的取值表
+按天扫描只读取对应日期的文件；按基金扫描往日只读取文件头和该基金所在的行区间，无需反序列化全天数据。
+
+用法:
+    python main.py series --code 162719 --days 7          # 单只基金的溢价率历史
+    python main.py series --code 162719 --csv out.csv     # 导出为 CSV 便于作图
+    python main.py series --date 2026-02-01               # 某天各轮监控概况
+"""
+
+import os
+import math
+import pickle
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from datetime import datetime, timedelta
+from config import HISTORY_DIR
+from metrics import metrics
+from calculator import signed_premium
+
+# 存储目录（回放模式下指向临时目录，避免替身服务的数据混入真实历史）
+HISTORY_PATH = HISTORY_DIR
+
+BLOCK_VERSION = 1
+DAY_VERSION = 1
+
+# 数值列 / 字典编码的字符串列
+FLOAT_COLUMNS = ('market_price', 'nav_price', 'premium')
+TEXT_COLUMNS = ('nav_date', 'status', 'fund_state')
+
+# 整理后的日文件中各列的顺序及类型（字符串列保存取值表下标）
+DAY_COLUMNS = (('ts', 'd'),) + tuple((col, 'd') for col in FLOAT_COLUMNS) + tuple((col, 'H') for col in TEXT_COLUMNS)
+
+
+def _journal_path(date, root=None):
+    return os.path.join(root or HISTORY_PATH, f"{date}.cols")
+
+
+def _day_path(date, root=None):
+    return os.path.join(root or HISTORY_PATH, f"{date}.day")
+
+
+def _encode_text(values):
+    """字典编码：返回 (取值表, 下标数组)"""
+    table = {}
+    indices = array('H', (table.setdefault(v or "", len(table)) for v in values))
+    return list(table), indices
+
+
+def _to_float(value):
+    return float(value) if value is not None else math.nan
+
+
+def _from_float(value):
+    return None if math.isnan(value) else value
+
+
+def append_cycle(rows, timestamp=None, root=None):
+    """
+    追加一轮监控的完整数据表（开始新的一天时顺带整理往日的数据）
+
+    Args:
+        rows: 基金数据列表，每项包含 code、market_price、nav_price、nav_date、
+              premium_rate、discount_rate、status、fund_state
+        timestamp: 本轮时间 (datetime)，默认当前时间
+        root: 存储目录，默认 HISTORY_PATH
+
+    Returns:
+        bool: 是否写入成功
+    """
+    if not rows:
+        return False
+    timestamp = timestamp or datetime.now()
+    root = root or HISTORY_PATH
+    date = timestamp.strftime("%Y-%m-%d")
+    rows = sorted(rows, key=lambda row: row['code'])
+
+    block = {
+        'version': BLOCK_VERSION,
+        'ts': timestamp.timestamp(),
+        'codes': [row['code'] for row in rows],
+        'market_price': array('d', (_to_float(row.get('market_price')) for row in rows)),
+        'nav_price': array('d', (_to_float(row.get('nav_price')) for row in rows)),
+        'premium': array('d', (_to_float(signed_premium(row.get('premium_rate'), row.get('discount_rate')))
+                               for row in rows)),
+    }
+    for col in TEXT_COLUMNS:
+        block[col] = _encode_text(row.get(col) for row in rows)
+
+    try:
+        with metrics.track("history_write"):
+            os.makedirs(root, exist_ok=True)
+            data = pickle.dumps(block, protocol=pickle.HIGHEST_PROTOCOL)
+            # 一次 write 写入整块，中途退出最多留下一个不完整的尾块，读取时跳过
+            with open(_journal_path(date, root), 'ab') as f:
+                f.write(data)
+    except Exception as e:
+        print(f"写入历史数据失败: {e}")
+        return False
+
+    for day in _journal_days(root):
+        if day != date:
+            compact_day(day, root)
+    return True
+
+
+def _iter_journal(date, root=None):
+    """按写入顺序逐块读取某一天尚未整理的数据"""
+    path = _journal_path(date, root)
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            except Exception:
+                # 不完整的尾块（写入时被中断）
+                return
+            if block.get('version') == BLOCK_VERSION:
+                yield block
+
+
+def _read_header(f):
+    """读取日文件头，返回 (文件头, 列数据起始位置)；版本不符返回 (None, None)"""
+    header = pickle.load(f)
+    if header.get('version') != DAY_VERSION:
+        return None, None
+    return header, f.tell()
+
+
+def _read_rows(f, header, base, start, end):
+    """读取日文件中 [start, end) 行的各列"""
+    columns = {}
+    offset = base
+    for col, typecode in DAY_COLUMNS:
+        values = array(typecode)
+        f.seek(offset + start * values.itemsize)
+        values.frombytes(f.read((end - start) * values.itemsize))
+        columns[col] = values
+        offset += header['rows'] * values.itemsize
+    return columns
+
+
+def _iter_day(date, root=None):
+    """由整理后的日文件还原每轮的列式块（按时间顺序）"""
+    path = _day_path(date, root)
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        header, base = _read_header(f)
+        if header is None:
+            return
+        columns = _read_rows(f, header, base, 0, header['rows'])
+    codes = [None] * header['rows']
+    for code, (start, end) in header['index'].items():
+        codes[start:end] = [code] * (end - start)
+    ts = columns['ts']
+    # 行按 (基金代码, 时间) 排序，按时间稳定排序后同一轮内的代码仍有序
+    order = sorted(range(len(ts)), key=ts.__getitem__)
+    for stamp, group in groupby(order, key=ts.__getitem__):
+        group = list(group)
+        block = {'version': BLOCK_VERSION, 'ts': stamp, 'codes': [codes[k] for k in group]}
+        for col in FLOAT_COLUMNS:
+            block[col] = array('d', (columns[col][k] for k in group))
+        for col in TEXT_COLUMNS:
+            block[col] = (header['text'][col], array('H', (columns[col][k] for k in group)))
+        yield block
+
+
+def iter_blocks(date, root=None):
+    """按时间顺序逐块读取某一天的数据"""
+    yield from _iter_day(date, root)
+    yield from _iter_journal(date, root)
+
+
+def compact_day(date, root=None):
+    """
+    将某一天的列式块整理为按基金连续存储的日文件（临时文件 + 原子替换），随后删除块文件
+
+    Returns:
+        bool: 是否整理成功
+    """
+    blocks = list(iter_blocks(date, root))
+    if not blocks:
+        return False
+    entries = sorted(((code, block['ts'], block, i) for block in blocks for i, code in enumerate(block['codes'])),
+                     key=lambda entry: entry[:2])
+    index = {}
+    columns = {col: array(typecode) for col, typecode in DAY_COLUMNS}
+    tables = {col: {} for col in TEXT_COLUMNS}
+    for row, (code, ts, block, i) in enumerate(entries):
+        index.setdefault(code, [row, row])[1] = row + 1
+        columns['ts'].append(ts)
+        for col in FLOAT_COLUMNS:
+            columns[col].append(block[col][i])
+        for col in TEXT_COLUMNS:
+            values, indices = block[col]
+            columns[col].append(tables[col].setdefault(values[indices[i]], len(tables[col])))
+
+    header = {
+        'version': DAY_VERSION,
+        'rows': len(entries),
+        'index': {code: tuple(span) for code, span in index.items()},
+        'text': {col: list(table) for col, table in tables.items()},
+    }
+    path = _day_path(date, root)
+    tmp_path = path + ".tmp"
+    try:
+        with metrics.track("history_compact"):
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                for col, _ in DAY_COLUMNS:
+                    columns[col].tofile(f)
+            os.replace(tmp_path, path)
+            if os.path.exists(_journal_path(date, root)):
+                os.remove(_journal_path(date, root))
+        return True
+    except Exception as e:
+        print(f"整理历史数据失败 {date}: {e}")
+        return False
+
+
+def _journal_days(root=None):
+    """尚未整理的日期列表"""
+    root = root or HISTORY_PATH
+    if not os.path.isdir(root):
+        return []
+    return sorted(name[:-5] for name in os.listdir(root) if name.endswith(".cols"))
+
+
+def list_days(root=None):
+    """已存储的日期列表（升序）"""
+    root = root or HISTORY_PATH
+    if not os.path.isdir(root):
+        return []
+    return sorted({os.path.splitext(name)[0] for name in os.listdir(root) if name.endswith((".cols", ".day"))})
+
+
+def _row(block, i):
+    record = {'time': datetime.fromtimestamp(block['ts']), 'code': block['codes'][i]}
+    for col in FLOAT_COLUMNS:
+        record[col] = _from_float(block[col][i])
+    for col in TEXT_COLUMNS:
+        values, indices = block[col]
+        record[col] = values[indices[i]]
+    return record
+
+
+def scan_day(date, root=None):
+    """
+    读取某一天的全部记录
+
+    Returns:
+        list: 记录字典列表，按时间、基金代码排序
+    """
+    return [_row(block, i) for block in iter_blocks(date, root) for i in range(len(block['codes']))]
+
+
+def _scan_day_file(date, code, lo_ts, hi_ts, root=None):
+    """从整理后的日文件中只读取一只基金的行区间"""
+    path = _day_path(date, root)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        header, base = _read_header(f)
+        if header is None or code not in header['index']:
+            return []
+        columns = _read_rows(f, header, base, *header['index'][code])
+
+    records = []
+    for k, ts in enumerate(columns['ts']):
+        if not lo_ts <= ts <= hi_ts:
+            continue
+        record = {'time': datetime.fromtimestamp(ts), 'code': code}
+        for col in FLOAT_COLUMNS:
+            record[col] = _from_float(columns[col][k])
+        for col in TEXT_COLUMNS:
+            record[col] = header['text'][col][columns[col][k]]
+        records.append(record)
+    return records
+
+
+def scan_fund(code, since=None, until=None, root=None):
+    """
+    读取单只基金在时间范围内的历史
+
+    Args:
+        code: 基金代码
+        since, until: 时间范围 (datetime)，None 表示不限
+
+    Returns:
+        list: 记录字典列表，按时间升序
+    """
+    start = since.strftime("%Y-%m-%d") if since else ""
+    end = until.strftime("%Y-%m-%d") if until else "9999"
+    lo_ts = since.timestamp() if since else float('-inf')
+    hi_ts = until.timestamp() if until else float('inf')
+
+    records = []
+    for date in list_days(root):
+        if not start <= date <= end:
+            continue
+        records.extend(_scan_day_file(date, code, lo_ts, hi_ts, root))
+        for block in _iter_journal(date, root):
+            if not lo_ts <= block['ts'] <= hi_ts:
+                continue
+            codes = block['codes']
+            i = bisect_left(codes, code)
+            if i < len(codes) and codes[i] == code:
+                records.append(_row(block, i))
+    return records
+
+
+def _fmt(value, digits):
+    return f"{value:.{digits}f}" if value is not None else "N/A"
+
+
+def run_series_command(args):
+    """执行 series 子命令"""
+    if args.date:
+        blocks = list(iter_blocks(args.date))
+        if not blocks:
+            print(f"{args.date} 没有历史数据")
+            return
+        print(f"[{args.date}] 共 {len(blocks)} 轮监控")
+        for block in blocks:
+            values, indices = block['status']
+            alerts = sum(1 for i in indices if values[i].endswith("_alert"))
+            premiums = [p for p in block['premium'] if not math.isnan(p)]
+            top = max(premiums) if premiums else None
+            bottom = min(premiums) if premiums else None
+            print(f"{datetime.fromtimestamp(block['ts']):%H:%M:%S}  基金 {len(block['codes']):>5}  "
+                  f"告警 {alerts:>4}  最高溢价 {_fmt(top, 2):>8}%  最大折价 {_fmt(bottom, 2):>8}%")
+        return
+
+    if not args.code:
+        days = list_days()
+        print(f"已存储 {len(days)} 天: {days[0]} ~ {days[-1]}" if days else "没有历史数据")
+        return
+
+    until = datetime.strptime(args.until, "%Y-%m-%d") + timedelta(days=1, seconds=-1) if args.until else None
+    if args.since:
+        since = datetime.strptime(args.since, "%Y-%m-%d")
+    elif args.days:
+        since = (until or datetime.now()) - timedelta(days=args.days)
+    else:
+        since = None
+    records = scan_fund(args.code, since, until)
+    if not records:
+        print(f"基金 {args.code} 没有历史数据")
+        return
+
+    if args.csv:
+        import csv
+        with open(args.csv, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['time', 'code', *FLOAT_COLUMNS, *TEXT_COLUMNS])
+            for r in records:
+                writer.writerow([f"{r['time']:%Y-%m-%d %H:%M:%S}", r['code'],
+                                 *(r[c] for c in FLOAT_COLUMNS), *(r[c] for c in TEXT_COLUMNS)])
+        print(f"已导出 {len(records)} 条记录到 {args.csv}")
+        return
+
+    print(f"[{args.code}] 共 {len(records)} 条记录")
+    print(f"{'时间':<21}{'场内':>9}{'净值':>9}{'溢价率':>9}  {'净值日期':<12}{'状态':<16}基金状态")
+    for r in records:
+        print(f"{r['time']:%Y-%m-%d %H:%M:%S}  {_fmt(r['market_price'], 4):>9}{_fmt(r['nav_price'], 4):>9}"
+              f"{_fmt(r['premium'], 2):>9}  {r['nav_date']:<12}{r['status']:<16}{r['fund_state']}")
+
+
+def add_series_parser(subparsers):
+    """注册 series 子命令参数"""
+    p = subparsers.add_parser("series", help="Query per-cycle fund history (premium time series)")
+    p.add_argument("--code", help="基金代码")
+    p.add_argument("--date", help="查看某天各轮监控概况 YYYY-MM-DD")
+    p.add_argument("--days", type=int, default=7, help="最近N天 (默认7，0表示全部)")
+    p.add_argument("--since", help="开始日期 YYYY-MM-DD")
+    p.add_argument("--until", help="结束日期 YYYY-MM-DD")
+    p.add_argument("--csv", help="导出为 CSV 文件")
+    return p
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 估算净值 (IOPV) 模块
+
+盘中场内价格是实时的，官方净值却是上一交易日的，直接相除得到的溢价率会偏差当天的市场涨跌。
+对跟踪指数的股票型 LOF，按 估算净值 = 官方净值 × (1 + beta × 基准当日涨跌幅) 实时估算：
+    - iopv_map.json 记录每只基金的基准（单个指数或指数篮子）及 beta
+    - 每轮一次请求获取全部指数行情，所有基金的估值系数一步向量化计算，逐只估算只是数组查找
+    - 只在官方净值恰为行情日期的上一交易日时估算；净值已是行情当天（收盘后公布）、更旧（如节后首日）
+      或基金未映射时不估算，使用官方净值
+
+映射文件格式:
+    {"funds": {"161725": {"index": "sz399997", "beta": 0.95, "r2": 0.97},
+               "160119": {"basket": {"sh000300": 0.6, "sh000905": 0.4}, "beta": 1.0}}}
+手工添加的条目可设置 "manual": true，重新校准时保留。
+
+用法:
+    python main.py iopv calibrate --days 120     # 用历史净值与指数日线为每只基金拟合基准及 beta
+    python main.py iopv show --code 161725       # 查看映射
+"""
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from collections import Counter
+from config import IOPV_MAP_FILE, IOPV_MIN_R2
+from metrics import metrics
+
+# 校准时参与拟合的候选指数（新浪行情代码 -> 名称）
+CANDIDATE_INDICES = {
+    "sh000300": "沪深300",
+    "sh000905": "中证500",
+    "sh000852": "中证1000",
+    "sh000016": "上证50",
+    "sz399001": "深证成指",
+    "sz399006": "创业板指",
+    "sh000688": "科创50",
+    "sh000922": "中证红利",
+    "sh000932": "中证消费",
+    "sz399997": "中证白酒",
+    "sz399989": "中证医疗",
+    "sz399975": "证券公司",
+    "sz399986": "中证银行",
+    "sz399967": "中证军工",
+    "sz399971": "中证传媒",
+    "sz399998": "中证煤炭",
+    "sz399808": "中证新能",
+    "sh000827": "中证环保",
+}
+
+# akshare 历史数据接口访问的主机（用于指标统计）
+SINA_INDEX_HOST = "finance.sina.com.cn"
+EASTMONEY_NAV_HOST = "fund.eastmoney.com"
+
+# 校准时下载历史数据的并发数
+FETCH_WORKERS = 8
+
+
+class IOPVEngine:
+    """按指数行情估算基金净值"""
+
+    def __init__(self, mapping):
+        """
+        Args:
+            mapping: 基金代码 -> {'index': 指数代码 或 'basket': {指数代码: 权重}, 'beta': beta}
+        """
+        import numpy as np
+        self.codes = {code: i for i, code in enumerate(mapping)}
+        baskets = [entry['basket'] if entry.get('basket') else {entry['index']: 1.0}
+                   for entry in mapping.values()]
+        self.index_codes = sorted({index for basket in baskets for index in basket})
+        column = {index: j for j, index in enumerate(self.index_codes)}
+        # 基金 × 指数 的权重矩阵，基准涨跌幅 = 权重矩阵 · 指数涨跌幅
+        self.weights = np.zeros((len(baskets), len(self.index_codes)))
+        for i, basket in enumerate(baskets):
+            for index, weight in basket.items():
+                self.weights[i, column[index]] = float(weight)
+        self.beta = np.array([float(entry.get('beta', 1.0)) for entry in mapping.values()])
+        self.factor = np.full(len(baskets), np.nan)
+        self.quote_date = None
+        self.nav_date = None
+
+    def update(self, quotes):
+        """
+        用一次指数行情更新全部基金的估值系数
+
+        行情日期取指数行情自身的交易日期（多数指数的日期），日期与之不同的指数（停牌、未更新）视为缺少行情。
+
+        Args:
+            quotes: 指数代码 -> (最新价, 昨收, 行情日期 'YYYY-MM-DD')，见 data_fetcher.get_index_quotes
+        """
+        import numpy as np
+        quotes = {index: quotes[index] for index in self.index_codes if index in quotes}
+        dates = Counter(quote[2] for quote in quotes.values() if quote[2])
+        self.quote_date = dates.most_common(1)[0][0] if dates else None
+        self.nav_date = previous_trading_day(self.quote_date) if self.quote_date else None
+        current = {index: quote for index, quote in quotes.items() if quote[2] == self.quote_date}
+        last = np.array([current.get(index, (np.nan, np.nan))[0] for index in self.index_codes], dtype=float)
+        prev_close = np.array([current.get(index, (np.nan, np.nan))[1] for index in self.index_codes], dtype=float)
+        returns = last / prev_close - 1
+        # 篮子中任一指数缺少行情时该基金不估算：NaN 与 0 权重相乘仍为 NaN，先置零再单独标记
+        missing = np.isnan(returns)
+        benchmark = self.weights @ np.where(missing, 0.0, returns)
+        benchmark[(self.weights[:, missing] != 0).any(axis=1)] = np.nan
+        self.factor = 1 + self.beta * benchmark
+
+    def estimate(self, code, nav_price, nav_date):
+        """
+        单只基金的估算净值
+
+        Args:
+            code: 基金代码
+            nav_price: 官方净值
+            nav_date: 官方净值日期 'YYYY-MM-DD'
+
+        Returns:
+            float: 估算净值；未映射、无行情或官方净值无需/无法估算时返回 None
+        """
+        i = self.codes.get(code)
+        if i is None or not nav_price or not nav_date or self.nav_date is None:
+            return None
+        factor = self.factor[i]
+        if factor != factor:  # NaN
+            return None
+        # 行情涨跌幅相对的是上一交易日收盘，只有该日的官方净值才能按此估算：
+        # 当天收盘后公布的净值已是最新，更旧的净值缺少中间交易日的涨跌
+        if nav_date != self.nav_date:
+            return None
+        return round(nav_price * float(factor), 4)
+
+
+def previous_trading_day(date):
+    """
+    上一交易日（按工作日计算，不含节假日：节后首日的上一交易日在节前，官方净值不匹配时不估算）
+
+    Args:
+        date: 'YYYY-MM-DD'
+
+    Returns:
+        str: 'YYYY-MM-DD'
+    """
+    day = datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
+def load_mapping(path=IOPV_MAP_FILE):
+    """读取映射文件，不存在或格式错误时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('funds', {})
+    except (ValueError, AttributeError) as e:
+        print(f"读取估值映射失败: {e}")
+        return {}
+
+
+def save_mapping(mapping, path=IOPV_MAP_FILE):
+    """保存映射文件（临时文件 + 原子替换）"""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'calibrated': datetime.now().strftime("%Y-%m-%d"), 'funds': mapping},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存估值映射失败: {e}")
+
+
+_engine = None
+_engine_mtime = None
+_engine_lock = threading.Lock()
+
+
+def get_iopv_engine():
+    """
+    获取全局估值引擎（映射文件变化时重新加载）
+
+    Returns:
+        IOPVEngine: 估值引擎；没有映射时返回 None
+    """
+    global _engine, _engine_mtime
+    mtime = os.path.getmtime(IOPV_MAP_FILE) if os.path.exists(IOPV_MAP_FILE) else None
+    with _engine_lock:
+        if mtime != _engine_mtime:
+            mapping = load_mapping()
+            try:
+                _engine = IOPVEngine(mapping) if mapping else None
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"估值映射格式错误: {e}，使用官方净值")
+                _engine = None
+            _engine_mtime = mtime
+        return _engine
+
+
+# ------------------------------------------------------------ 校准
+
+def fetch_index_returns(symbol):
+    """
+    指数日线涨跌幅
+
+    Returns:
+        dict: 'YYYY-MM-DD' -> 日涨跌幅（小数），失败返回空字典
+    """
+    import pandas as pd
+    import akshare as ak
+    try:
+        with metrics.track("iopv_calibrate", SINA_INDEX_HOST) as span:
+            df = ak.stock_zh_index_daily(symbol=symbol)
+            if df is None or df.empty:
+                span.outcome = 'failure'
+                return {}
+    except Exception:
+        return {}
+    closes = pd.Series(pd.to_numeric(df['close'], errors='coerce').values,
+                       index=pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d'))
+    return closes.pct_change().dropna().to_dict()
+
+
+def fetch_nav_returns(code):
+    """
+    基金单位净值日增长率（已考虑分红）
+
+    Returns:
+        dict: 'YYYY-MM-DD' -> 日增长率（小数），失败返回空字典
+    """
+    import pandas as pd
+    import akshare as ak
+    try:
+        with metrics.track("iopv_calibrate", EASTMONEY_NAV_HOST) as span:
+            df = ak.fund_open_fund_info_em(symbol=code, indicator="单位净值走势")
+            if df is None or df.empty:
+                span.outcome = 'failure'
+                return {}
+    except Exception:
+        return {}
+    # 按位置取列：净值日期, 单位净值, 日增长率 (%)
+    dates = pd.to_datetime(df.iloc[:, 0]).dt.strftime('%Y-%m-%d')
+    returns = pd.to_numeric(df.iloc[:, 2], errors='coerce') / 100
+    return {d: r for d, r in zip(dates, returns) if r == r}
+
+
+def fit_benchmarks(fund_returns, index_returns):
+    """
+    为每只基金在候选指数中选择拟合优度最高的一个，并给出 beta
+
+    对全部 基金 × 指数 组合一次性计算带缺失值掩码的协方差/方差（矩阵乘法）。
+
+    Args:
+        fund_returns: 基金日收益率矩阵 T × F（缺失为 NaN）
+        index_returns: 指数日收益率矩阵 T × I（缺失为 NaN）
+
+    Returns:
+        tuple: (best, beta, r2, samples) 每只基金的最佳指数下标、beta、R²、共同样本数，长度均为 F
+    """
+    import numpy as np
+    fy = ~np.isnan(fund_returns)
+    fx = ~np.isnan(index_returns)
+    y = np.where(fy, fund_returns, 0.0)
+    x = np.where(fx, index_returns, 0.0)
+    mx, my = fx.astype(float), fy.astype(float)
+
+    # 每个 (指数, 基金) 组合只统计两者都有数据的日期
+    n = mx.T @ my
+    sx, sy = x.T @ my, mx.T @ y
+    sxx, syy = (x * x).T @ my, mx.T @ (y * y)
+    sxy = x.T @ y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        beta = cov / var_x
+        r2 = cov * cov / (var_x * var_y)
+    r2 = np.where((n >= 20) & (var_x > 0) & (var_y > 0), r2, -1.0)  # I × F
+
+    best = r2.argmax(axis=0)
+    cols = np.arange(r2.shape[1])
+    return best, beta[best, cols], r2[best, cols], n[best, cols].astype(int)
+
+
+def calibrate(days=120, min_r2=IOPV_MIN_R2, progress_callback=None):
+    """
+    用最近 days 天的净值与指数日线重新拟合全部基金的基准及 beta
+
+    Args:
+        days: 拟合使用的天数
+        min_r2: 拟合优度下限，低于该值的基金（债券型、QDII 等）不映射
+        progress_callback: 进度回调 (done, total)
+
+    Returns:
+        dict: 新的映射（已保留手工条目）
+    """
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    from universe import universe_codes
+
+    codes = universe_codes("lof")
+    indices = list(CANDIDATE_INDICES)
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    lock = threading.Lock()
+    done = [0]
+    total = len(codes) + len(indices)
+
+    def fetch(task):
+        kind, key = task
+        series = fetch_index_returns(key) if kind == 'index' else fetch_nav_returns(key)
+        with lock:
+            done[0] += 1
+            if progress_callback:
+                progress_callback(done[0], total)
+        return {d: r for d, r in series.items() if d >= since}
+
+    tasks = [('index', index) for index in indices] + [('fund', code) for code in codes]
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        series = list(executor.map(fetch, tasks))
+    index_series, fund_series = series[:len(indices)], series[len(indices):]
+
+    dates = sorted({d for s in index_series for d in s})
+    if not dates:
+        print("获取指数历史数据失败")
+        return load_mapping()
+    row = {d: t for t, d in enumerate(dates)}
+
+    def matrix(series_list):
+        m = np.full((len(dates), len(series_list)), np.nan)
+        for j, s in enumerate(series_list):
+            for d, r in s.items():
+                t = row.get(d)
+                if t is not None:
+                    m[t, j] = r
+        return m
+
+    best, beta, r2, samples = fit_benchmarks(matrix(fund_series), matrix(index_series))
+
+    mapping = {code: entry for code, entry in load_mapping().items() if entry.get('manual')}
+    for j, code in enumerate(codes):
+        if code in mapping or r2[j] < min_r2:
+            continue
+        mapping[code] = {'index': indices[best[j]], 'beta': round(float(beta[j]), 4),
+                         'r2': round(float(r2[j]), 4), 'samples': int(samples[j])}
+    return mapping
+
+
+# ------------------------------------------------------------ 命令行
+
+def run_iopv_command(args):
+    """执行 iopv 子命令"""
+    if args.action == "calibrate":
+        def progress(done, total):
+            if done % 20 == 0 or done == total:
+                print(f"\r下载历史数据: {done}/{total}", end="", flush=True)
+        mapping = calibrate(args.days, args.min_r2, progress)
+        print()
+        save_mapping(mapping)
+        manual = sum(1 for entry in mapping.values() if entry.get('manual'))
+        print(f"已映射 {len(mapping)} 只基金（手工 {manual}），保存到 {IOPV_MAP_FILE}")
+        return
+
+    mapping = load_mapping()
+    if not mapping:
+        print("没有估值映射，先运行: python main.py iopv calibrate")
+        return
+    items = [(args.code, mapping[args.code])] if args.code in mapping else []
+    if args.code and not items:
+        print(f"基金 {args.code} 没有估值映射，使用官方净值")
+        return
+    if not args.code:
+        items = sorted(mapping.items())
+    from cli import align_text
+    print(align_text('代码', 10) + align_text('基准', 30) + align_text('beta', 8, 'right') + align_text('R²', 8, 'right'))
+    for code, entry in items:
+        if entry.get('basket'):
+            benchmark = "+".join(f"{index}×{weight}" for index, weight in entry['basket'].items())
+        else:
+            benchmark = f"{entry['index']} {CANDIDATE_INDICES.get(entry['index'], '')}"
+        r2 = f"{entry['r2']:.3f}" if entry.get('r2') is not None else "手工"
+        print(align_text(code, 10) + align_text(benchmark, 30) +
+              align_text(f"{entry.get('beta', 1.0):.3f}", 8, 'right') + align_text(r2, 8, 'right'))
+
+
+def add_iopv_parser(subparsers):
+    """注册 iopv 子命令参数"""
+    p = subparsers.add_parser("iopv", help="Calibrate / show benchmark mapping for estimated NAV")
+    p.add_argument("action", choices=["calibrate", "show"], help="calibrate 重新拟合映射，show 查看映射")
+    p.add_argument("--code", help="基金代码 (show)")
+    p.add_argument("--days", type=int, default=120, help="拟合使用的天数 (默认120)")
+    p.add_argument("--min-r2", type=float, default=IOPV_MIN_R2, help=f"拟合优度下限 (默认{IOPV_MIN_R2})")
+    return p
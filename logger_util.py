@@ -1,58 +1,254 @@
 # -*- coding: utf-8 -*-
 """
 LOF基金溢价监控程序 - 日志模块
+
+告警日志同时写两份：
+    alerts.log    人类可读的文本行（格式保持不变）
+    alerts.jsonl  结构化 JSON Lines，便于程序分析
+写入先进入内存缓冲，按条数或时间批量落盘；文件超过大小上限时压缩归档到 logs/ 目录。
+告警历史索引 (alert_history) 常驻写入器内存，每次落盘后只解析新追加的行，并在写入锁内保存。
 """
 
 import os
+import gzip
+import json
+import atexit
+import shutil
+import threading
 from datetime import datetime
-from config import ALERTS_LOG_FILE
+from config import (
+    ALERTS_LOG_FILE, ALERTS_JSONL_FILE, ALERTS_ARCHIVE_DIR,
+    ALERTS_LOG_MAX_BYTES, ALERTS_LOG_BUFFER_LINES, ALERTS_LOG_FLUSH_INTERVAL
+)
+
+# 反向读取日志时每次读取的块大小
+TAIL_BLOCK_SIZE = 8192
+
+# 告警日志路径（回放模式下由 set_alert_paths 指向临时目录）
+LOG_PATH = ALERTS_LOG_FILE
+JSONL_PATH = ALERTS_JSONL_FILE
+ARCHIVE_PATH = ALERTS_ARCHIVE_DIR
+
+
+class AlertLogWriter:
+    """带缓冲与滚动归档的告警日志写入器"""
+
+    def __init__(self, log_file=None, jsonl_file=None, archive_dir=None, max_bytes=ALERTS_LOG_MAX_BYTES,
+                 buffer_lines=ALERTS_LOG_BUFFER_LINES, flush_interval=ALERTS_LOG_FLUSH_INTERVAL):
+        self.log_file = log_file or LOG_PATH
+        self.jsonl_file = jsonl_file or JSONL_PATH
+        self.archive_dir = archive_dir or ARCHIVE_PATH
+        self.max_bytes = max_bytes
+        self.buffer_lines = buffer_lines
+        self.flush_interval = flush_interval
+        self._text_buffer = []
+        self._json_buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._index = None  # 告警历史索引，首次落盘时加载
+
+    def write(self, log_line, record):
+        """写入一条告警（文本行 + 结构化记录）"""
+        with self._lock:
+            self._text_buffer.append(log_line)
+            self._json_buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+            pending = len(self._text_buffer)
+            if pending < self.buffer_lines and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if pending >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        """将缓冲区写入文件"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._text_buffer:
+                return
+            text = "".join(self._text_buffer)
+            jsonl = "".join(self._json_buffer)
+            self._text_buffer = []
+            self._json_buffer = []
+
+            try:
+                self._rotate_if_needed(len(text.encode('utf-8')))
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(text)
+                with open(self.jsonl_file, 'a', encoding='utf-8') as f:
+                    f.write(jsonl)
+            except Exception as e:
+                print(f"写入日志失败: {e}")
+                return
+
+            # 增量更新告警历史索引（只解析本次追加的行）
+            if self.log_file == LOG_PATH:
+                self._update_index()
+
+    def _update_index(self):
+        """将新追加的日志行加入内存中的索引并保存（持有写入锁时调用）"""
+        try:
+            from alert_history import load_index, save_index
+            if self._index is None:
+                self._index = load_index()
+            if self._index.update(self.log_file, self.archive_dir):
+                save_index(self._index)
+        except Exception as e:
+            print(f"更新告警索引失败: {e}")
+
+    def _rotate_if_needed(self, incoming):
+        """当前日志加上待写入内容超过上限时，压缩归档现有日志"""
+        if not self.max_bytes or not os.path.exists(self.log_file):
+            return
+        if os.path.getsize(self.log_file) + incoming <= self.max_bytes:
+            return
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        for path in (self.log_file, self.jsonl_file):
+            if not os.path.exists(path):
+                continue
+            base, ext = os.path.splitext(os.path.basename(path))
+            archive = os.path.join(self.archive_dir, f"{base}-{stamp}{ext}.gz")
+            with open(path, 'rb') as src, gzip.open(archive, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+
+
+class AlertCapture:
+    """收集告警日志条目而不写文件（分片运行时使用，由 merge 统一追加到日志）"""
+
+    def __init__(self):
+        self.entries = []  # [(文本行, 结构化记录)]
+        self._lock = threading.Lock()
+
+    def write(self, log_line, record):
+        with self._lock:
+            self.entries.append((log_line, record))
+
+    def flush(self):
+        pass
+
+
+_writer = AlertLogWriter()
+
+
+def set_alert_paths(log_file, jsonl_file, archive_dir):
+    """此后的告警日志写入指定路径（回放模式使用）"""
+    global _writer, LOG_PATH, JSONL_PATH, ARCHIVE_PATH
+    _writer.flush()
+    LOG_PATH, JSONL_PATH, ARCHIVE_PATH = log_file, jsonl_file, archive_dir
+    _writer = AlertLogWriter()
+
+
+def capture_alerts():
+    """
+    此后的告警日志只收集到内存
 
+    Returns:
+        AlertCapture: 收集器，entries 为收集到的条目
+    """
+    global _writer
+    _writer.flush()
+    _writer = AlertCapture()
+    return _writer
+
+
+def append_alert_entries(entries):
+    """将收集到的告警条目写入日志（merge 时调用）"""
+    for log_line, record in entries:
+        _writer.write(log_line, record)
+    _writer.flush()
 
-def log_alert(fund_code, fund_name, alert_type, rate, threshold):
+
+def log_alert(fund_code, fund_name, alert_type, rate, threshold, zscore=None):
     """
     记录告警日志
-    
+
     Args:
         fund_code: 基金代码
         fund_name: 基金名称
-        alert_type: 告警类型 ('premium' 或 'discount')
-        rate: 当前比率
-        threshold: 阈值
+        alert_type: 告警类型 ('premium'、'discount' 或 'anomaly')
+        rate: 当前比率（异动告警为带符号溢价率）
+        threshold: 阈值（异动告警为 z 分数阈值）
+        zscore: 异动告警的 z 分数
+
+    Returns:
+        dict: 写入 alerts.jsonl 的结构化记录
     """
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
+
     if alert_type == 'premium':
         message = f"[溢价告警] {fund_name}({fund_code}) 溢价率: {rate:.2f}% (阈值: {threshold}%)"
+    elif alert_type == 'anomaly':
+        message = f"[异动告警] {fund_name}({fund_code}) 溢价率: {rate:.2f}% (Z值: {zscore:.2f})"
     else:
         message = f"[折价告警] {fund_name}({fund_code}) 折价率: {rate:.2f}% (阈值: {threshold}%)"
-    
+
     log_line = f"[{timestamp}] {message}\n"
-    
-    try:
-        with open(ALERTS_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(log_line)
-        # print(f"告警已记录: {message}")
-    except Exception as e:
-        print(f"写入日志失败: {e}")
+    record = {
+        "time": timestamp,
+        "code": fund_code,
+        "name": fund_name,
+        "type": alert_type,
+        "rate": round(rate, 2),
+        "threshold": threshold
+    }
+    if zscore is not None:
+        record["zscore"] = round(zscore, 2)
+    _writer.write(log_line, record)
+    return record
+
+
+def flush_alerts():
+    """立即写出缓冲中的告警日志（监控循环结束时调用）"""
+    _writer.flush()
+
+
+atexit.register(flush_alerts)  # 按当前的写入器刷新（set_alert_paths / capture_alerts 会替换写入器）
+
+
+def tail_lines(path, limit):
+    """
+    从文件末尾反向按块读取最后 limit 行，耗时与文件大小无关
+
+    Returns:
+        list: 文本行列表（保持文件中的顺序）
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        # 多读一行，保证第一行完整
+        while position > 0 and data.count(b"\n") <= limit:
+            read_size = min(TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    lines = data.decode('utf-8', errors='replace').splitlines(keepends=True)
+    if position > 0:
+        lines = lines[1:]  # 首行可能被块边界截断
+    return lines[-limit:]
 
 
 def get_recent_alerts(limit=100):
     """
     获取最近的告警记录
-    
+
     Args:
         limit: 返回的最大记录数
-        
+
     Returns:
         list: 告警记录列表
     """
-    if not os.path.exists(ALERTS_LOG_FILE):
+    _writer.flush()
+    if not os.path.exists(LOG_PATH):
         return []
-    
+
     try:
-        with open(ALERTS_LOG_FILE, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        return lines[-limit:][::-1]  # 返回最新的记录，倒序排列
+        return tail_lines(LOG_PATH, limit)[::-1]  # 返回最新的记录，倒序排列
     except Exception as e:
         print(f"读取日志失败: {e}")
         return []
@@ -3,24 +3,131 @@
 LOF基金溢价监控程序 - 主入口
 """
 
+import sys
 import argparse
-from cli import LOFMonitorCLI
-from ui import run_app
 
 def main():
     parser = argparse.ArgumentParser(description="LOF基金溢价监控系统")
     parser.add_argument("-t", "--terminal", action="store_true", help="Run in terminal mode (CLI)")
     parser.add_argument("--run-once", action="store_true", help="Run once and exit")
+    parser.add_argument("--record", metavar="FILE", help="Record upstream responses to FILE (gzip JSON)")
+    parser.add_argument("--replay", metavar="URL", help="Fetch from a local stand-in server started by replay.py")
+    parser.add_argument("--profile", action="store_true", help="Profile each monitor cycle / UI load (CPU, allocations, folded stacks)")
+    parser.add_argument("--shard", metavar="I/N", help="With --run-once: only process shard I of N (merge results with 'merge')")
+    parser.add_argument("--serve", metavar="[HOST:]PORT", nargs="?", const="",
+                        help="Run the monitor loop and serve the latest results over a local HTTP JSON API (default 127.0.0.1:8700)")
+    parser.add_argument("--connect", metavar="URL", help="Run the UI (or --dashboard) as a thin client of a --serve instance")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="Full-screen live terminal dashboard (sortable, filterable; works over SSH)")
+    parser.add_argument("--output", metavar="KIND[:PATH]", action="append", default=[],
+                        help="With --run-once: stream one record per fund to ndjson[:PATH] (default stdout), "
+                             "csv:PATH or sqlite:PATH; may be repeated")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    from alert_history import add_history_parser
+    from history_store import add_series_parser
+    from backtest import add_backtest_parser
+    from iopv import add_iopv_parser
+    from sharding import add_merge_parser, parse_shard
+    from fetch_cache import add_cache_parser
+    add_history_parser(subparsers)
+    add_series_parser(subparsers)
+    add_backtest_parser(subparsers)
+    add_iopv_parser(subparsers)
+    add_merge_parser(subparsers)
+    add_cache_parser(subparsers)
     args = parser.parse_args()
+    
+    shard = None
+    if args.shard:
+        if not args.run_once:
+            parser.error("--shard 只能与 --run-once 一起使用")
+        if args.replay:
+            # 分片结果由 merge 写入真实的共享状态，回放的合成数据不能混入
+            parser.error("--shard 不能与 --replay 一起使用")
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    sink_specs = []
+    if args.output:
+        if not args.run_once:
+            parser.error("--output 只能与 --run-once 一起使用")
+        from sinks import parse_sink
+        try:
+            sink_specs = [parse_sink(text) for text in args.output]
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.command == "history":
+        from alert_history import run_history_command
+        run_history_command(args)
+        return
+    if args.command == "series":
+        from history_store import run_series_command
+        run_series_command(args)
+        return
+    if args.command == "backtest":
+        from backtest import run_backtest_command
+        run_backtest_command(args)
+        return
+    if args.command == "iopv":
+        from iopv import run_iopv_command
+        run_iopv_command(args)
+        return
+    if args.command == "merge":
+        from sharding import run_merge_command
+        run_merge_command(args)
+        return
+    if args.command == "cache":
+        from fetch_cache import run_cache_command
+        run_cache_command(args)
+        return
 
-    if args.terminal or args.run_once:
-        cli = LOFMonitorCLI()
-        if args.run_once:
-            cli.run_monitor_cycle()
+    if args.replay:
+        from replay import install_replay
+        from config import config
+        config.set("dingtalk_webhook", install_replay(args.replay))
+    recorder = None
+    if args.record:
+        from replay import Recorder
+        recorder = Recorder()
+        recorder.install()
+
+    try:
+        # 按需导入：终端模式不加载 tkinter，界面模式不加载终端模块
+        if args.serve is not None:
+            from api_server import run_server
+            run_server(args.serve, profile=args.profile)
+        elif args.dashboard:
+            from dashboard import run_dashboard
+            run_dashboard(server=args.connect, profile=args.profile)
+        elif args.terminal or args.run_once:
+            from cli import LOFMonitorCLI
+            sinks = []
+            if sink_specs:
+                from sinks import open_sinks
+                sinks = open_sinks(sink_specs)
+                if any(path == "-" for _, path in sink_specs):
+                    # 标准输出留给结果记录，终端文本改写到标准错误
+                    sys.stdout = sys.stderr
+            cli = LOFMonitorCLI(profile=args.profile, shard=shard, sinks=sinks)
+            try:
+                if args.run_once:
+                    cli.run_monitor_cycle()
+                else:
+                    cli.start()
+            finally:
+                for sink in sinks:
+                    sink.close()
         else:
-            cli.start()
-    else:
-        run_app()
+            from ui import run_app
+            run_app(profile=args.profile, server=args.connect)
+    finally:
+        # 终端菜单通过 sys.exit 退出，录制数据在此统一保存
+        if recorder:
+            recorder.save(args.record)
 
 if __name__ == "__main__":
     main()
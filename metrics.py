@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 运行指标模块
+
+按 阶段(stage) × 主机(host) 记录耗时直方图、成功/失败/超时次数及缓存命中率，
+支持打印汇总并导出为 Prometheus 文本格式和 JSON。
+
+阶段约定:
+    list_fetch      基金列表及场内价格 (Sina)
+    nav_fetch       场外净值 (东方财富)
+    page_scrape     基金详情页下载
+    page_parse      基金详情页解析
+    compute         溢价/折价计算及状态判断
+    notify          告警通知发送
+    config_write    配置文件写入
+    snapshot_write  数据快照写入
+    history_write   历史数据写入
+    history_compact 往日历史数据整理
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from config import METRICS_JSON_FILE, METRICS_PROM_FILE
+
+# 直方图桶上界（秒）
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OUTCOMES = ('success', 'failure', 'timeout')
+
+
+class StageStats:
+    """单个 阶段×主机 的统计数据"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # 最后一个为 +Inf
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def count(self):
+        return sum(self.outcomes.values())
+
+    def observe(self, seconds, outcome):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def quantile(self, q):
+        """根据直方图估算分位数（返回所在桶的上界）"""
+        total = sum(self.bucket_counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(self.bucket_counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max_seconds
+        return self.max_seconds
+
+    def cache_hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+
+class Span:
+    """track() 返回的计时句柄，可在代码块内修改结果"""
+
+    def __init__(self):
+        self.outcome = 'success'
+
+
+class MetricsRegistry:
+    """全局指标注册表（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.started_at = time.time()
+
+    def _stats(self, stage, host):
+        key = (stage, host or "")
+        stats = self.stages.get(key)
+        if stats is None:
+            stats = self.stages[key] = StageStats()
+        return stats
+
+    def observe(self, stage, seconds, outcome='success', host=""):
+        """记录一次阶段耗时"""
+        with self._lock:
+            self._stats(stage, host).observe(seconds, outcome)
+
+    def record_cache(self, stage, hit, host=""):
+        """记录一次缓存查询结果"""
+        with self._lock:
+            stats = self._stats(stage, host)
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    @contextmanager
+    def track(self, stage, host=""):
+        """
+        计时代码块。异常会被记录为失败（超时类异常记录为超时）后继续抛出；
+        代码块内可设置 span.outcome = 'failure' 标记业务层面的失败。
+        """
+        span = Span()
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.outcome = 'timeout' if is_timeout(e) else 'failure'
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, span.outcome, host)
+
+    def to_json(self):
+        """导出为可 JSON 序列化的字典"""
+        with self._lock:
+            stages = []
+            for (stage, host), s in sorted(self.stages.items()):
+                stages.append({
+                    'stage': stage,
+                    'host': host,
+                    'count': s.count,
+                    'outcomes': dict(s.outcomes),
+                    'total_seconds': round(s.total_seconds, 6),
+                    'max_seconds': round(s.max_seconds, 6),
+                    'p50_seconds': s.quantile(0.5),
+                    'p95_seconds': s.quantile(0.95),
+                    'buckets': {str(b): n for b, n in zip(BUCKETS + ('+Inf',), s.bucket_counts)},
+                    'cache_hits': s.cache_hits,
+                    'cache_misses': s.cache_misses,
+                    'cache_hit_rate': s.cache_hit_rate()
+                })
+            return {'started_at': self.started_at, 'exported_at': time.time(), 'stages': stages}
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式"""
+        lines = [
+            "# HELP lof_stage_duration_seconds Monitor cycle stage latency.",
+            "# TYPE lof_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            items = sorted(self.stages.items())
+            for (stage, host), s in items:
+                labels = f'stage="{stage}",host="{host}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ('+Inf',), s.bucket_counts):
+                    cumulative += n
+                    lines.append(f'lof_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'lof_stage_duration_seconds_sum{{{labels}}} {s.total_seconds:.6f}')
+                lines.append(f'lof_stage_duration_seconds_count{{{labels}}} {s.count}')
+
+            lines.append("# HELP lof_stage_requests_total Monitor cycle stage results by outcome.")
+            lines.append("# TYPE lof_stage_requests_total counter")
+            for (stage, host), s in items:
+                for outcome, n in s.outcomes.items():
+                    lines.append(f'lof_stage_requests_total{{stage="{stage}",host="{host}",outcome="{outcome}"}} {n}')
+
+            lines.append("# HELP lof_cache_requests_total Cache lookups by result.")
+            lines.append("# TYPE lof_cache_requests_total counter")
+            for (stage, host), s in items:
+                if s.cache_hits or s.cache_misses:
+                    lines.append(f'lof_cache_requests_total{{stage="{stage}",host="{host}",result="hit"}} {s.cache_hits}')
+                    lines.append(f'lof_cache_requests_total{{stage="{stage}",host="{host}",result="miss"}} {s.cache_misses}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """生成可读的汇总文本"""
+        lines = [f"{'阶段':<16}{'主机':<32}{'次数':>6}{'成功':>6}{'失败':>6}{'超时':>6}"
+                 f"{'平均ms':>10}{'P95ms':>10}{'最大ms':>10}{'缓存命中':>10}"]
+        with self._lock:
+            for (stage, host), s in sorted(self.stages.items()):
+                count = s.count
+                avg_ms = s.total_seconds / count * 1000 if count else 0.0
+                hit_rate = s.cache_hit_rate()
+                lines.append(
+                    f"{stage:<16}{host or '-':<32}{count:>6}{s.outcomes['success']:>6}"
+                    f"{s.outcomes['failure']:>6}{s.outcomes['timeout']:>6}"
+                    f"{avg_ms:>10.1f}{s.quantile(0.95) * 1000:>10.1f}{s.max_seconds * 1000:>10.1f}"
+                    f"{'-' if hit_rate is None else f'{hit_rate:.0%}':>10}"
+                )
+        return "\n".join(lines)
+
+    def export(self, json_path=METRICS_JSON_FILE, prom_path=METRICS_PROM_FILE):
+        """写出 JSON 与 Prometheus 文本文件"""
+        try:
+            if json_path:
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.to_json(), f, indent=4, ensure_ascii=False)
+            if prom_path:
+                with open(prom_path, 'w', encoding='utf-8') as f:
+                    f.write(self.to_prometheus())
+        except Exception as e:
+            print(f"导出运行指标失败: {e}")
+
+
+def is_timeout(exc):
+    """判断异常是否为超时（兼容 requests/urllib3/socket 的超时异常）"""
+    return isinstance(exc, TimeoutError) or "Timeout" in type(exc).__name__
+
+
+def host_of(url):
+    """提取URL中的主机名"""
+    from urllib.parse import urlparse
+    return urlparse(url).netloc
+
+
+# 全局单例
+metrics = MetricsRegistry()
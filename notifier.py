@@ -1,16 +1,29 @@
 # -*- coding: utf-8 -*-
 """
-LOF基金溢价监控程序 - 钉钉通知模块
+LOF基金溢价监控程序 - 通知模块
+
+支持钉钉、企业微信、飞书及通用 JSON Webhook 四种通知渠道，
+配置了多个渠道时同一条告警并发发送到全部渠道。
 """
 
-from config import config
-import requests
+from config import (
+    config, OUTBOX_FILE, DINGTALK_RATE_LIMIT, DINGTALK_RATE_WINDOW, WECOM_RATE_LIMIT,
+    FEISHU_RATE_LIMIT, WEBHOOK_RATE_LIMIT, NOTIFY_TIMEOUT,
+    NOTIFY_MAX_ATTEMPTS, NOTIFY_BACKOFF_BASE, NOTIFY_BACKOFF_MAX, DIGEST_MAX_CHARS
+)
+from metrics import metrics, host_of
+import os
 import json
 import time
 import hmac
-import hashlib
+import heapq
+import queue
 import base64
+import hashlib
+import threading
 import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 def generate_sign(secret):
@@ -56,6 +69,8 @@ def send_dingtalk_alert(webhook_url, secret, message, title="LOF基金告警", f
         return False
     
     try:
+        import requests
+        
         # 构造请求URL
         if secret:
             timestamp, sign = generate_sign(secret)
@@ -73,9 +88,12 @@ def send_dingtalk_alert(webhook_url, secret, message, title="LOF基金告警", f
         }
         
         headers = {'Content-Type': 'application/json'}
-        response = requests.post(url, headers=headers, data=json.dumps(data), timeout=10)
+        with metrics.track("notify", host_of(webhook_url)) as span:
+            response = requests.post(url, headers=headers, data=json.dumps(data), timeout=10)
+            result = response.json()
+            if result.get('errcode') != 0:
+                span.outcome = 'failure'
         
-        result = response.json()
         if result.get('errcode') == 0:
             # print("钉钉消息发送成功")
             # 标记已告警
@@ -91,7 +109,8 @@ def send_dingtalk_alert(webhook_url, secret, message, title="LOF基金告警", f
         return False
 
 
-def format_alert_message(fund_code, fund_name, alert_type, rate, market_price, nav_price, fund_state=""):
+def format_alert_message(fund_code, fund_name, alert_type, rate, market_price, nav_price, fund_state="",
+                         zscore=None, nav_estimated=False):
     """
     格式化告警消息
     
@@ -102,6 +121,8 @@ def format_alert_message(fund_code, fund_name, alert_type, rate, market_price, n
         rate: 比率
         market_price: 场内价格
         nav_price: 场外净值
+        zscore: 异动告警的 z 分数
+        nav_estimated: nav_price 是否为按指数行情估算的净值
         
     Returns:
         str: 格式化的Markdown消息
@@ -109,6 +130,9 @@ def format_alert_message(fund_code, fund_name, alert_type, rate, market_price, n
     if alert_type == 'premium':
         alert_title = "🔴 溢价告警"
         rate_text = f"溢价率: **{rate:.2f}%**"
+    elif alert_type == 'anomaly':
+        alert_title = "🟡 异动告警"
+        rate_text = f"溢价率: **{rate:.2f}%** (Z值 {zscore:.2f})"
     else:
         alert_title = "🟢 折价告警"
         rate_text = f"折价率: **{rate:.2f}%**"
@@ -123,7 +147,7 @@ def format_alert_message(fund_code, fund_name, alert_type, rate, market_price, n
 
 **场内价格:** {market_price:.4f}
 
-**场外净值:** {nav_price:.4f}
+**{"估算净值" if nav_estimated else "场外净值"}:** {nav_price:.4f}
 
 **{rate_text}**
 
@@ -131,3 +155,562 @@ def format_alert_message(fund_code, fund_name, alert_type, rate, market_price, n
 *LOF基金溢价监控系统*
 """
     return message
+
+
+class NotifierBackend:
+    """
+    通知渠道基类
+
+    子类实现 send(message, title)，返回是否发送成功。
+    每个渠道独立限流：rate_window 秒内最多发送 rate_limit 条。
+    """
+
+    name = ""
+    rate_limit = WEBHOOK_RATE_LIMIT
+    rate_window = DINGTALK_RATE_WINDOW
+
+    def __init__(self, webhook_url, secret=""):
+        self.webhook_url = webhook_url
+        self.secret = secret
+        self._sent_times = deque()  # 最近一个限流窗口内的发送时间
+        self._rate_lock = threading.Lock()
+
+    def wait_rate_limit(self):
+        """超过限流条数时等待"""
+        with self._rate_lock:
+            while True:
+                now = time.time()
+                while self._sent_times and now - self._sent_times[0] >= self.rate_window:
+                    self._sent_times.popleft()
+                if len(self._sent_times) < self.rate_limit:
+                    self._sent_times.append(now)
+                    return
+                time.sleep(self.rate_window - (now - self._sent_times[0]))
+
+    def send(self, message, title="LOF基金告警"):
+        raise NotImplementedError
+
+    def post_json(self, url, payload, is_success):
+        """
+        POST JSON 并按渠道规则判断结果
+
+        Args:
+            url: 请求地址（可能带签名参数）
+            payload: 请求体
+            is_success: 函数 (response) -> bool
+
+        Returns:
+            bool: 是否发送成功
+        """
+        try:
+            import requests
+
+            with metrics.track("notify", host_of(self.webhook_url)) as span:
+                response = requests.post(url, json=payload, timeout=NOTIFY_TIMEOUT)
+                ok = is_success(response)
+                if not ok:
+                    span.outcome = 'failure'
+            if not ok:
+                print(f"{self.name}消息发送失败: {response.status_code} {response.text[:200]}")
+            return ok
+        except Exception as e:
+            print(f"发送{self.name}消息异常: {e}")
+            return False
+
+
+class DingTalkBackend(NotifierBackend):
+    """钉钉自定义机器人（Markdown 消息，可选加签）"""
+
+    name = "钉钉"
+    rate_limit = DINGTALK_RATE_LIMIT
+
+    def send(self, message, title="LOF基金告警"):
+        return send_dingtalk_alert(self.webhook_url, self.secret, message, title=title)
+
+
+class WeComBackend(NotifierBackend):
+    """企业微信群机器人（Markdown 消息）"""
+
+    name = "企业微信"
+    rate_limit = WECOM_RATE_LIMIT
+
+    def send(self, message, title="LOF基金告警"):
+        payload = {
+            "msgtype": "markdown",
+            "markdown": {"content": message}
+        }
+        return self.post_json(self.webhook_url, payload,
+                              lambda r: r.json().get('errcode') == 0)
+
+
+class FeishuBackend(NotifierBackend):
+    """飞书自定义机器人（消息卡片内嵌 Markdown，可选签名校验）"""
+
+    name = "飞书"
+    rate_limit = FEISHU_RATE_LIMIT
+
+    def send(self, message, title="LOF基金告警"):
+        payload = {
+            "msg_type": "interactive",
+            "card": {
+                "header": {"title": {"tag": "plain_text", "content": title}},
+                "elements": [{"tag": "markdown", "content": message}]
+            }
+        }
+        if self.secret:
+            # 飞书签名：以 "timestamp\nsecret" 为密钥对空串做 HmacSHA256
+            timestamp = str(int(time.time()))
+            string_to_sign = f"{timestamp}\n{self.secret}".encode('utf-8')
+            hmac_code = hmac.new(string_to_sign, digestmod=hashlib.sha256).digest()
+            payload["timestamp"] = timestamp
+            payload["sign"] = base64.b64encode(hmac_code).decode('utf-8')
+        return self.post_json(self.webhook_url, payload,
+                              lambda r: r.json().get('code', r.json().get('StatusCode')) == 0)
+
+
+class WebhookBackend(NotifierBackend):
+    """通用 JSON Webhook：POST {"title", "text", "source"}，HTTP 2xx 视为成功"""
+
+    name = "Webhook"
+
+    def send(self, message, title="LOF基金告警"):
+        payload = {"title": title, "text": message, "source": "LOFMonitor"}
+        return self.post_json(self.webhook_url, payload, lambda r: r.ok)
+
+
+# 渠道类型 -> (Webhook 配置项, 密钥配置项)
+BACKEND_TYPES = (
+    (DingTalkBackend, "dingtalk_webhook", "dingtalk_secret"),
+    (WeComBackend, "wecom_webhook", None),
+    (FeishuBackend, "feishu_webhook", "feishu_secret"),
+    (WebhookBackend, "alert_webhook_url", None),
+)
+
+_backends = {}  # (类型, URL, 密钥) -> 渠道实例（保留各自的限流状态）
+
+
+def get_backends():
+    """
+    获取当前已配置的通知渠道
+
+    Returns:
+        list: NotifierBackend 实例列表，未配置任何渠道时为空
+    """
+    backends = []
+    for backend_cls, url_key, secret_key in BACKEND_TYPES:
+        url = config.get(url_key)
+        if not url:
+            continue
+        secret = config.get(secret_key, "") if secret_key else ""
+        key = (backend_cls, url, secret)
+        if key not in _backends:
+            _backends[key] = backend_cls(url, secret)
+        backends.append(_backends[key])
+    return backends
+
+
+class AlertDispatcher:
+    """
+    后台告警发送器
+
+    告警先写入本地发件箱 (outbox.json) 再交给后台线程发送，调用方不会被HTTP请求阻塞。
+    每条告警并发发送到全部已配置的渠道，总耗时取决于最慢的渠道而非各渠道之和；
+    失败的渠道按指数退避单独重试，遵守各渠道的条数限制。
+    至少一个渠道确认发送成功后才标记基金今日已告警。
+    程序中途退出时未发送的告警保留在发件箱中，下次启动继续发送；非当天创建的告警已过时，直接丢弃。
+    """
+
+    def __init__(self, outbox_file=OUTBOX_FILE):
+        self.outbox_file = outbox_file
+        self.pending = {}  # id -> 告警条目
+        self._queue = queue.Queue()
+        self._retry_heap = []  # (下次发送时间, id)
+        self._pool = ThreadPoolExecutor(max_workers=len(BACKEND_TYPES), thread_name_prefix="notify")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._seq = 0
+        # 未配置通知渠道时保留发件箱原样，待配置后首次提交前再加载
+        self._outbox_loaded = False
+        if get_backends():
+            with self._lock:
+                self._load_outbox()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------ 发件箱
+
+    @staticmethod
+    def _expired(entry):
+        """非当天创建的告警已过时（价格早已变化，当日去重也已重置），不再发送"""
+        return not entry.get('created', '').startswith(time.strftime("%Y-%m-%d"))
+
+    def _load_outbox(self):
+        """将发件箱中的告警加入发送队列（调用方持有锁；只加载一次，须在首次保存内存中的条目前调用）"""
+        if self._outbox_loaded:
+            return
+        self._outbox_loaded = True
+        if not os.path.exists(self.outbox_file):
+            return
+        try:
+            with open(self.outbox_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"读取告警发件箱失败: {e}")
+            return
+        expired = [entry for entry in entries if self._expired(entry)]
+        for entry in entries:
+            if self._expired(entry):
+                continue
+            # 兼容单基金格式的旧发件箱
+            if 'fund_codes' not in entry:
+                code = entry.pop('fund_code', None)
+                entry['fund_codes'] = [code] if code else []
+            entry.setdefault('delivered', [])
+            # 重新编号：加载前内存中可能已有条目
+            self._seq += 1
+            entry['id'] = self._seq
+            self.pending[entry['id']] = entry
+            self._queue.put(entry['id'])
+        if expired:
+            print(f"丢弃发件箱中 {len(expired)} 条非当天的告警")
+            self._save_outbox()
+
+    def _save_outbox(self, entries=None):
+        """持久化发件箱（调用方持有锁），entries 默认为内存中的待发送条目"""
+        if entries is None:
+            entries = list(self.pending.values())
+        tmp_file = self.outbox_file + ".tmp"
+        try:
+            if not entries:
+                if os.path.exists(self.outbox_file):
+                    os.remove(self.outbox_file)
+                return
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_file, self.outbox_file)
+        except Exception as e:
+            print(f"保存告警发件箱失败: {e}")
+
+    # ------------------------------------------------------------ 提交
+
+    def is_pending(self, fund_code):
+        """基金是否已有告警在发送队列中"""
+        with self._lock:
+            return any(fund_code in e['fund_codes'] for e in self.pending.values())
+
+    def submit(self, message, fund_code=None, title="LOF基金告警", fund_codes=None):
+        """
+        提交告警（立即返回）
+
+        Args:
+            message: Markdown 消息内容
+            fund_code: 基金代码（用于每日去重，发送成功后才标记）
+            title: 消息标题
+            fund_codes: 汇总消息包含的基金代码列表（发送成功后全部标记）
+
+        Returns:
+            bool: 已进入发送队列（或相关基金均已在队列中）返回 True；未配置通知渠道返回 False
+        """
+        if not get_backends():
+            print("未配置任何通知渠道，跳过发送")
+            return False
+
+        codes = list(fund_codes or ([fund_code] if fund_code else []))
+        if codes and all(config.is_fund_alerted(code) for code in codes):
+            return True
+
+        with self._lock:
+            self._load_outbox()
+            if codes and all(any(code in e['fund_codes'] for e in self.pending.values()) for code in codes):
+                return True
+            self._seq += 1
+            entry = {
+                'id': self._seq,
+                'fund_codes': codes,
+                'title': title,
+                'message': message,
+                'delivered': [],  # 已发送成功的渠道
+                'attempts': 0,
+                'created': time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self.pending[entry['id']] = entry
+            self._save_outbox()
+        self._queue.put(entry['id'])
+        return True
+
+    def adopt(self, entries):
+        """
+        接收其他发件箱中未发送完成的条目（保留已成功的渠道，merge 时调用）
+
+        Returns:
+            int: 接收的条目数
+        """
+        if not entries:
+            return 0
+        with self._lock:
+            if not get_backends():
+                # 未配置通知渠道时发件箱未加载到内存：直接追加到文件，待配置后再发送
+                existing = []
+                if os.path.exists(self.outbox_file):
+                    try:
+                        with open(self.outbox_file, 'r', encoding='utf-8') as f:
+                            existing = json.load(f)
+                    except Exception as e:
+                        print(f"读取告警发件箱失败: {e}")
+                        return 0
+                seq = max([e.get('id', 0) for e in existing] + [0])
+                existing.extend(dict(entry, id=seq + i) for i, entry in enumerate(entries, 1))
+                self._save_outbox(existing)
+                return len(entries)
+            self._load_outbox()
+            for entry in entries:
+                self._seq += 1
+                entry = dict(entry, id=self._seq)
+                self.pending[entry['id']] = entry
+                self._queue.put(entry['id'])
+            self._save_outbox()
+        return len(entries)
+
+    def drain(self, timeout=None):
+        """
+        等待发件箱清空（单次运行模式退出前调用）
+
+        Returns:
+            bool: 是否全部发送完成
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    print(f"仍有 {len(self.pending)} 条告警未发送，已保留在发件箱中")
+                    return False
+                self._idle.wait(remaining if remaining is not None else 1.0)
+        return True
+
+    # ------------------------------------------------------------ 发送线程
+
+    @staticmethod
+    def _send_one(backend, entry):
+        backend.wait_rate_limit()
+        try:
+            return backend.send(entry['message'], title=entry['title'])
+        except Exception as e:
+            print(f"发送{backend.name}消息异常: {e}")
+            return False
+
+    def _send_all(self, backends, entry):
+        """并发发送到各渠道，返回发送成功的渠道名称列表"""
+        if len(backends) == 1:
+            results = [self._send_one(backends[0], entry)]
+        else:
+            futures = [self._pool.submit(self._send_one, backend, entry) for backend in backends]
+            results = [future.result() for future in futures]
+        return [backend.name for backend, ok in zip(backends, results) if ok]
+
+    def _next_entry_id(self):
+        """取下一条待发送告警：优先新提交的，其次到期的重试"""
+        timeout = None
+        if self._retry_heap:
+            due, entry_id = self._retry_heap[0]
+            timeout = due - time.time()
+            if timeout <= 0:
+                heapq.heappop(self._retry_heap)
+                return entry_id
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        while True:
+            entry_id = self._next_entry_id()
+            if entry_id is None:
+                continue
+            with self._lock:
+                entry = self.pending.get(entry_id)
+            if entry is None:
+                continue
+
+            # 跨日仍未发出的告警（长期运行时）不再发送
+            if self._expired(entry):
+                print(f"告警已过时，不再发送: {','.join(entry['fund_codes']) or entry['title']}")
+                self._finish(entry_id)
+                continue
+
+            # 去重：其他途径已发送成功（已部分发送的告警继续补发剩余渠道）
+            codes = entry['fund_codes']
+            if not entry['delivered'] and codes and all(config.is_fund_alerted(code) for code in codes):
+                self._finish(entry_id)
+                continue
+
+            backends = [b for b in get_backends() if b.name not in entry['delivered']]
+            if not backends:
+                self._finish(entry_id)
+                continue
+            delivered = self._send_all(backends, entry)
+            # 条目同时被 _save_outbox 在锁内序列化，修改也须持有锁
+            with self._lock:
+                entry['delivered'].extend(delivered)
+                any_delivered = bool(entry['delivered'])
+                if len(delivered) < len(backends):
+                    entry['attempts'] += 1
+                attempts = entry['attempts']
+            if any_delivered:
+                for code in codes:
+                    config.mark_fund_alerted(code)
+            if len(delivered) == len(backends):
+                self._finish(entry_id)
+                continue
+
+            if attempts >= NOTIFY_MAX_ATTEMPTS:
+                failed = [b.name for b in backends if b.name not in delivered]
+                print(f"告警发送失败次数过多，已放弃: {','.join(codes) or entry['title']} ({','.join(failed)})")
+                self._finish(entry_id)
+                continue
+            delay = min(NOTIFY_BACKOFF_MAX, NOTIFY_BACKOFF_BASE ** attempts)
+            with self._lock:
+                self._save_outbox()
+            heapq.heappush(self._retry_heap, (time.time() + delay, entry_id))
+
+    def _finish(self, entry_id):
+        with self._idle:
+            self.pending.pop(entry_id, None)
+            self._save_outbox()
+            self._idle.notify_all()
+
+
+# 发件箱路径（回放模式下指向临时目录，发往替身服务的告警不留在真实发件箱）
+OUTBOX_PATH = OUTBOX_FILE
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher(outbox_file=None):
+    """获取全局告警发送器（首次调用时启动后台线程，outbox_file 只在首次调用时生效，默认 OUTBOX_PATH）"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher(outbox_file or OUTBOX_PATH)
+        return _dispatcher
+
+
+class AlertDigest:
+    """
+    告警汇总
+
+    汇总模式下，一轮监控（或界面的一次数据加载）中的告警先在内存中收集，
+    结束时按比率从高到低合并为少量 Markdown 表格消息，每条不超过 DIGEST_MAX_CHARS 字符，
+    避免行情剧烈波动时逐只发送触发钉钉每分钟20条的限制。
+    比率达到 digest_critical_rate 的告警会立即连同已收集的告警一起提前发送。
+    """
+
+    TABLE_HEADER = ("| 基金 | 代码 | 类型 | 比率 | 场内 | 净值 | 状态 |\n"
+                    "| --- | --- | --- | --- | --- | --- | --- |\n")
+    FOOTER = "\n---\n*LOF基金溢价监控系统*\n"
+
+    def __init__(self, dispatcher=None, critical_rate=None, max_chars=DIGEST_MAX_CHARS):
+        self.dispatcher = dispatcher or get_dispatcher()
+        if critical_rate is None:
+            critical_rate = config.get("digest_critical_rate") or 0
+        self.critical_rate = critical_rate
+        self.max_chars = max_chars
+        self.items = {}  # code -> 告警信息
+        self._lock = threading.Lock()
+
+    def add(self, fund_code, fund_name, alert_type, rate, market_price, nav_price, fund_state="", zscore=None,
+            nav_estimated=False):
+        """
+        收集一条告警
+
+        Returns:
+            bool: 已收集（或已在发送队列中）返回 True；未配置通知渠道返回 False
+        """
+        if not get_backends():
+            return False
+        if config.is_fund_alerted(fund_code) or self.dispatcher.is_pending(fund_code):
+            return True
+
+        with self._lock:
+            self.items[fund_code] = {
+                'code': fund_code,
+                'name': fund_name,
+                'type': alert_type,
+                'rate': rate,
+                'market_price': market_price,
+                'nav_price': nav_price,
+                'fund_state': fund_state or "",
+                'zscore': zscore,
+                'nav_estimated': nav_estimated
+            }
+        if self.critical_rate and rate is not None and abs(rate) >= self.critical_rate:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        将已收集的告警合并为汇总消息提交发送
+
+        Returns:
+            int: 提交的消息条数
+        """
+        with self._lock:
+            items = sorted(self.items.values(), key=lambda item: abs(item['rate'] or 0), reverse=True)
+            self.items = {}
+        if not items:
+            return 0
+
+        messages = self.build_messages(items)
+        for message, codes in messages:
+            self.dispatcher.submit(message, title=f"LOF基金告警汇总 ({len(items)}只)", fund_codes=codes)
+        return len(messages)
+
+    def build_messages(self, items):
+        """
+        将告警列表拆分为不超过长度上限的 Markdown 表格
+
+        Returns:
+            list: [(message, fund_codes)]
+        """
+        chunks = []
+        rows, codes, size = [], [], 0
+        budget = self.max_chars - len(self.TABLE_HEADER) - len(self.FOOTER) - 40  # 40: 标题行
+        for item in items:
+            row = self.format_row(item)
+            if rows and size + len(row) > budget:
+                chunks.append((rows, codes))
+                rows, codes, size = [], [], 0
+            rows.append(row)
+            codes.append(item['code'])
+            size += len(row)
+        chunks.append((rows, codes))
+
+        messages = []
+        for i, (rows, codes) in enumerate(chunks, 1):
+            part = f" {i}/{len(chunks)}" if len(chunks) > 1 else ""
+            message = (f"## ⚠️ LOF基金告警汇总 ({len(items)}只){part}\n\n"
+                       + self.TABLE_HEADER + "".join(rows) + self.FOOTER)
+            messages.append((message, codes))
+        return messages
+
+    @staticmethod
+    def format_row(item):
+        kind = {'premium': "🔴 溢价", 'discount': "🟢 折价"}.get(item['type'], "🟡 异动")
+        if item.get('zscore') is not None:
+            kind += f" Z{item['zscore']:+.1f}"
+        market = f"{item['market_price']:.4f}" if item['market_price'] else "N/A"
+        nav = f"{item['nav_price']:.4f}" if item['nav_price'] else "N/A"
+        if item.get('nav_estimated'):
+            nav = "≈" + nav
+        name = item['name'].replace("|", "/")
+        state = item['fund_state'].replace("|", "/")
+        return (f"| {name} | {item['code']} | {kind} | **{item['rate']:.2f}%** "
+                f"| {market} | {nav} | {state} |\n")
+
+
+def create_alert_digest():
+    """配置为汇总模式时返回新的告警汇总器，否则返回 None（逐只发送）"""
+    if config.get("alert_mode") == "digest":
+        return AlertDigest()
+    return None
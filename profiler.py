@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 性能剖析模块
+
+--profile 模式下包裹一轮监控（终端单次运行或界面加载），同时进行:
+    1. cProfile CPU 剖析，输出按累计/自身耗时排序的报告
+    2. tracemalloc 内存分配跟踪，输出分配最多的代码行
+    3. 栈采样，输出 flamegraph.pl / speedscope 兼容的折叠栈 (folded stacks)
+并将耗时归类为 akshare/DataFrame、BeautifulSoup 解析、网络IO、线程等待、本项目代码及其他。
+抓取及解析在各分类的 fetch-* 线程池中执行，剖析期间新启动的线程同样被剖析（每个线程一个
+cProfile，结束时合并）及采样，折叠栈以线程名（去掉池内序号）开头。
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+from config import PROFILE_DIR
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 栈采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+# Python 3.12 起 cProfile 基于 sys.monitoring，单个剖析器即覆盖全部线程，且同时只能启用一个
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+# 耗时归类规则：按顺序匹配文件路径片段
+CATEGORY_RULES = (
+    ("akshare/DataFrame", ("akshare", "pandas", "numpy", "py_mini_racer")),
+    ("BeautifulSoup", ("bs4", "soupsieve", "html/parser", "_markupbase", "html\\parser")),
+    ("网络IO", ("requests", "urllib3", "socket", "ssl", "http/client", "http\\client",
+                "charset_normalizer", "chardet")),
+    ("线程等待", ("threading", "concurrent/futures", "concurrent\\futures", "queue")),
+)
+CATEGORY_OWN = "本项目代码"
+CATEGORY_OTHER = "其他"
+
+
+def classify(filename):
+    """根据源文件路径归类"""
+    path = filename.replace("\\", "/")
+    for category, keywords in CATEGORY_RULES:
+        for keyword in keywords:
+            if f"/{keyword}/" in path or f"/{keyword}." in path or path.endswith(f"/{keyword}"):
+                return category
+    if path.startswith(BASE_DIR.replace("\\", "/")) and "site-packages" not in path:
+        return CATEGORY_OWN
+    return CATEGORY_OTHER
+
+
+def _thread_label(thread):
+    """线程名去掉线程池内的序号 (fetch-lof_3 -> fetch-lof)，同一线程池的栈合并显示"""
+    prefix, _, index = thread.name.rpartition("_")
+    return prefix if prefix and index.isdigit() else thread.name
+
+
+class StackSampler:
+    """后台线程定时采样目标线程（调用线程及剖析期间启动的线程）的调用栈"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.threads = {thread_id: "main"}  # 线程 id -> 折叠栈前缀
+        self.interval = interval
+        self.stacks = {}  # 折叠栈 -> 采样次数
+        self.leaf_categories = {}  # 栈顶所属分类 -> 采样次数
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def add_thread(self, thread):
+        self.threads[thread.ident] = _thread_label(thread)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, label in list(self.threads.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                leaf = frame
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                names.append(label)
+                folded = ";".join(reversed(names))
+                self.stacks[folded] = self.stacks.get(folded, 0) + 1
+                category = classify(leaf.f_code.co_filename)
+                self.leaf_categories[category] = self.leaf_categories.get(category, 0) + 1
+
+
+class ThreadProfilers:
+    """
+    剖析期间新启动的线程：各自启用一个 cProfile 并登记到栈采样
+
+    通过 threading.setprofile 在新线程执行的第一个事件中安装（随后被该线程的 cProfile 替换）。
+    """
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def _hook(self, frame, event, arg):
+        sys.setprofile(None)
+        thread = threading.current_thread()
+        with self._lock:
+            self.sampler.add_thread(thread)
+        if PER_THREAD_PROFILERS:
+            profiler = cProfile.Profile()
+            with self._lock:
+                self.profilers.append(profiler)
+            profiler.enable()
+
+    def install(self):
+        threading.setprofile(self._hook)
+
+    def uninstall(self):
+        threading.setprofile(None)
+
+
+@contextmanager
+def profile_session(name="cycle", output_dir=PROFILE_DIR):
+    """
+    剖析代码块并写出报告
+
+    Args:
+        name: 报告文件名前缀
+        output_dir: 报告目录
+    """
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    workers = ThreadProfilers(sampler)
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(25)
+
+    sampler.start()
+    workers.install()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        workers.uninstall()
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if started_tracemalloc:
+            tracemalloc.stop()
+        try:
+            # 主线程已停止剖析，在此收集工作线程的结果（线程池在一轮结束时已关闭）
+            stats = pstats.Stats(profiler)
+            for worker in workers.profilers:
+                stats.add(worker)
+            write_reports(name, output_dir, stats, sampler, snapshot, peak, elapsed)
+        except Exception as e:
+            print(f"写入性能剖析报告失败: {e}")
+
+
+def category_times(stats):
+    """
+    按分类汇总 cProfile 的自身耗时 (tottime)
+
+    内置函数（如正则匹配、str 方法）没有源文件，按调用方所属分类分摊。
+    """
+    totals = {}
+    for (filename, _, _), (_, _, tottime, _, callers) in stats.stats.items():
+        if filename == "~" and callers:
+            for (caller_file, _, _), edge in callers.items():
+                category = classify(caller_file) if caller_file != "~" else CATEGORY_OTHER
+                totals[category] = totals.get(category, 0.0) + edge[2]
+            continue
+        category = classify(filename)
+        totals[category] = totals.get(category, 0.0) + tottime
+    return totals
+
+
+def write_reports(name, output_dir, stats, sampler, snapshot, peak, elapsed):
+    """写出全部剖析报告（stats 为合并了全部线程的 pstats.Stats）"""
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+
+    # 原始数据，可用 snakeviz 等工具查看
+    stats.dump_stats(prefix + ".pstats")
+
+    # CPU 报告
+    with open(prefix + "-cpu.txt", 'w', encoding='utf-8') as f:
+        stats.stream = f
+        f.write(f"墙钟耗时: {elapsed:.3f}s\n\n===== 按累计耗时排序 =====\n")
+        stats.sort_stats("cumulative").print_stats(60)
+        f.write("\n===== 按自身耗时排序 =====\n")
+        stats.sort_stats("tottime").print_stats(60)
+
+    # 耗时归类
+    cpu_totals = category_times(stats)
+    cpu_sum = sum(cpu_totals.values()) or 1.0
+    sample_sum = sum(sampler.leaf_categories.values()) or 1
+    lines = [f"墙钟耗时: {elapsed:.3f}s  采样数: {sum(sampler.leaf_categories.values())}",
+             "",
+             f"{'分类':<20}{'CPU(s)':>10}{'CPU占比':>10}{'采样占比':>10}"]
+    categories = sorted(set(cpu_totals) | set(sampler.leaf_categories),
+                        key=lambda c: cpu_totals.get(c, 0.0), reverse=True)
+    for category in categories:
+        cpu = cpu_totals.get(category, 0.0)
+        lines.append(f"{category:<20}{cpu:>10.3f}{cpu / cpu_sum:>10.1%}"
+                     f"{sampler.leaf_categories.get(category, 0) / sample_sum:>10.1%}")
+    summary = "\n".join(lines)
+    with open(prefix + "-categories.txt", 'w', encoding='utf-8') as f:
+        f.write(summary + "\n")
+
+    # 内存分配报告
+    with open(prefix + "-alloc.txt", 'w', encoding='utf-8') as f:
+        f.write(f"峰值内存: {peak / 1024 / 1024:.1f} MiB\n\n===== 按代码行 =====\n")
+        for stat in snapshot.statistics("lineno")[:40]:
+            f.write(f"{stat}\n")
+        f.write("\n===== 按调用栈 (前10) =====\n")
+        for stat in snapshot.statistics("traceback")[:10]:
+            f.write(f"\n{stat.count} 块, {stat.size / 1024:.1f} KiB\n")
+            for line in stat.traceback.format(limit=10):
+                f.write(line + "\n")
+
+    # 折叠栈（flamegraph.pl / speedscope / inferno 均可直接读取）
+    with open(prefix + ".folded", 'w', encoding='utf-8') as f:
+        for stack, count in sorted(sampler.stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+    print(f"\n[性能剖析] 报告已写入 {prefix}*")
+    print(summary)
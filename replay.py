@@ -0,0 +1,618 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 录制/回放模块
+
+录制模式：在真实运行中记录 get_fund_list（各分类基金列表）、get_nav_price、get_index_quotes、
+基金详情页 (parse_fund_state) 及 send_dingtalk_alert 的返回数据。
+回放模式：启动本地HTTP替身服务（可配置延迟、错误率及合成基金数量），
+将数据获取与钉钉通知指向替身服务，用于无网络环境下可重复地测量整轮吞吐与延迟。
+
+用法:
+    python main.py --run-once --record recording.json.gz          # 录制一次真实运行
+    python replay.py serve --recording recording.json.gz          # 启动替身服务
+    python main.py --run-once --replay http://127.0.0.1:8765      # 针对替身服务运行
+    python replay.py bench --funds 5000 --latency-ms 5 --error-rate 0.01
+    python replay.py serve --funds 400 --mix etf=1000,closed=40,reits=60    # 多分类合成数据
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8765
+
+# 合成页面中的交易状态取值
+SYNTHETIC_STATES = ["开放申购 开放赎回", "暂停申购 开放赎回", "限大额 开放赎回", "场内交易"]
+
+
+# ---------------------------------------------------------------- 录制
+
+class Recorder:
+    """录制数据获取与通知函数的返回值"""
+
+    def __init__(self):
+        self.data = {
+            "recorded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "fund_list": [],
+            "nav": {},
+            "index": {},
+            "pages": {},
+            "alerts": []
+        }
+        self._lock = threading.Lock()
+
+    def install(self):
+        """替换 data_fetcher / notifier 中的函数为录制包装"""
+        import data_fetcher
+        import notifier
+        import fetch_cache
+
+        # 缓存命中的净值及详情页不会经过录制包装：录制从空缓存开始，且不读写真实的缓存包
+        fetch_cache.BUNDLE_PATH = os.path.join(tempfile.gettempdir(), "lof_record_cache.bin")
+        if os.path.exists(fetch_cache.BUNDLE_PATH):
+            os.remove(fetch_cache.BUNDLE_PATH)
+        fetch_cache.reset_fetch_cache()
+
+        orig_list = data_fetcher.get_fund_list
+        orig_nav = data_fetcher.get_nav_price
+        orig_index = data_fetcher.get_index_quotes
+        orig_nav_table = data_fetcher.get_etf_nav_table
+        orig_page = data_fetcher.fetch_fund_page
+        orig_send = notifier.send_dingtalk_alert
+
+        def get_fund_list(category):
+            df = orig_list(category)
+            with self._lock:
+                self.data["fund_list"].extend(dict(record, category=category)
+                                              for record in df.to_dict(orient="records"))
+            return df
+
+        def get_nav_price(code):
+            nav_price, nav_date = orig_nav(code)
+            with self._lock:
+                self.data["nav"][code] = [nav_price, nav_date]
+            return nav_price, nav_date
+
+        def get_etf_nav_table():
+            table = orig_nav_table()
+            with self._lock:
+                self.data["nav"].update({code: list(nav) for code, nav in table.items()})
+            return table
+
+        def get_index_quotes(codes):
+            quotes = orig_index(codes)
+            with self._lock:
+                self.data["index"].update({code: list(quote) for code, quote in quotes.items()})
+            return quotes
+
+        def fetch_fund_page(code, conditional=False):
+            # 录制时不发送条件请求，保证每个页面都录下完整内容
+            html = orig_page(code)
+            with self._lock:
+                self.data["pages"][code] = html
+            return html
+
+        def send_dingtalk_alert(webhook_url, secret, message, title="LOF基金告警", fund_code=None):
+            ok = orig_send(webhook_url, secret, message, title=title, fund_code=fund_code)
+            with self._lock:
+                self.data["alerts"].append({
+                    "fund_code": fund_code, "title": title, "message": message, "success": ok
+                })
+            return ok
+
+        data_fetcher.get_fund_list = get_fund_list
+        data_fetcher.get_nav_price = get_nav_price
+        data_fetcher.get_etf_nav_table = get_etf_nav_table
+        data_fetcher.get_index_quotes = get_index_quotes
+        data_fetcher.fetch_fund_page = fetch_fund_page
+        notifier.send_dingtalk_alert = send_dingtalk_alert
+
+    def save(self, path):
+        """保存录制数据（gzip压缩的JSON）"""
+        with self._lock:
+            payload = json.dumps(self.data, ensure_ascii=False).encode('utf-8')
+        with gzip.open(path, 'wb') as f:
+            f.write(payload)
+        print(f"录制数据已保存到 {path}: {len(self.data['fund_list'])} 只基金, "
+              f"{len(self.data['pages'])} 个页面, {len(self.data['alerts'])} 条告警")
+
+
+def load_recording(path):
+    """加载录制数据"""
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+# ---------------------------------------------------------------- 合成数据
+
+# 合成的其他分类：(代码起始值, 名称前缀, 常态溢价率范围 %)
+SYNTHETIC_CATEGORIES = {
+    "etf": (510000, "合成ETF", 0.5),
+    "closed": (500000, "合成封基", 8.0),
+    "reits": (180000, "合成REIT", 5.0)
+}
+
+
+def parse_mix(text):
+    """解析 'etf=1000,reits=60' -> {'etf': 1000, 'reits': 60}"""
+    mix = {}
+    for item in (text or "").split(","):
+        if item.strip():
+            name, _, count = item.partition("=")
+            if name.strip() not in SYNTHETIC_CATEGORIES:
+                raise ValueError(f"未知的合成分类: {name}")
+            mix[name.strip()] = int(count)
+    return mix
+
+
+def build_synthetic_universe(size, seed=0, page_kb=40, mix=None):
+    """
+    生成合成基金数据（格式与录制数据一致）
+
+    Args:
+        size: LOF 基金数量
+        seed: 随机种子（保证可重复）
+        page_kb: 每个详情页的填充大小 (KB)，用于模拟真实页面的解析开销
+        mix: 其他分类的基金数量，如 {'etf': 1000}（这些分类不抓取详情页）
+
+    Returns:
+        dict: 录制数据格式
+    """
+    rng = random.Random(seed)
+    volume_rng = random.Random(seed + 1)  # 独立的随机序列，不影响其他字段的取值
+    # 行情日期为最近一个工作日，净值日期为其上一交易日，使估算净值生效
+    from iopv import CANDIDATE_INDICES, previous_trading_day
+    quote_date = datetime.now()
+    while quote_date.weekday() >= 5:
+        quote_date -= timedelta(days=1)
+    quote_date = quote_date.strftime("%Y-%m-%d")
+    nav_date = previous_trading_day(quote_date)
+    filler = "<div class=\"infoOfFund\"><p>合成填充内容</p></div>\n" * max(1, page_kb * 1024 // 60)
+
+    data = {"recorded_at": "synthetic", "fund_list": [], "nav": {}, "index": {}, "pages": {}, "alerts": []}
+    for i in range(size):
+        code = f"{160000 + i:06d}"
+        nav = round(rng.uniform(0.5, 3.0), 4)
+        # 大部分基金溢价在 ±3% 以内，少量出现大幅溢价/折价以触发告警
+        if rng.random() < 0.02:
+            rate = rng.uniform(-40, 40)
+        else:
+            rate = rng.uniform(-3, 3)
+        market_price = round(nav * (1 + rate / 100), 3)
+        # 成交量（份）：多数基金成交清淡
+        volume = float(int(volume_rng.paretovariate(1.2) * 1000) * 100)
+        data["fund_list"].append({
+            "market": "sz" if i % 2 else "sh",
+            "code": code,
+            "name": f"合成LOF{i}",
+            "market_price": market_price,
+            "volume": volume,
+            "amount": round(volume * market_price, 2),
+            "category": "lof"
+        })
+        data["nav"][code] = [nav, nav_date]
+        state = rng.choice(SYNTHETIC_STATES).replace(" ", "&nbsp;")
+        data["pages"][code] = (
+            "<html><head><meta charset=\"utf-8\"></head><body>\n" + filler +
+            f"<div class=\"staticItem\"><span>交易状态：</span>{state}</div>\n</body></html>"
+        )
+
+    # 其他分类使用独立的随机序列，LOF 部分的数据与不混合时一致
+    mix_rng = random.Random(seed + 3)
+    for category, count in (mix or {}).items():
+        base, prefix, spread = SYNTHETIC_CATEGORIES[category]
+        for i in range(count):
+            code = f"{base + i:06d}"
+            nav = round(mix_rng.uniform(0.5, 5.0), 4)
+            rate = mix_rng.uniform(-40, 40) if mix_rng.random() < 0.01 else mix_rng.uniform(-spread, spread)
+            market_price = round(nav * (1 + rate / 100), 3)
+            volume = float(int(mix_rng.paretovariate(1.2) * 10000) * 100)
+            data["fund_list"].append({
+                "market": "sh" if code.startswith("5") else "sz",
+                "code": code,
+                "name": f"{prefix}{i}",
+                "market_price": market_price,
+                "volume": volume,
+                "amount": round(volume * market_price, 2),
+                "category": category
+            })
+            data["nav"][code] = [nav, nav_date]
+
+    # 候选基准指数的行情：当日涨跌幅在 ±3% 以内
+    index_rng = random.Random(seed + 2)
+    for index in CANDIDATE_INDICES:
+        prev_close = round(index_rng.uniform(1000, 6000), 2)
+        data["index"][index] = [round(prev_close * (1 + index_rng.uniform(-0.03, 0.03)), 2), prev_close, quote_date]
+    return data
+
+
+# ---------------------------------------------------------------- 替身服务
+
+class StandInServer:
+    """
+    本地HTTP替身服务
+
+    路由:
+        GET  /list          基金列表及场内价格 (JSON)，?category= 指定分类（默认 lof）
+        GET  /nav/<code>    场外净值及日期 (JSON)
+        GET  /navs          某一分类全部基金的净值 (JSON)，?category= 指定分类
+        GET  /index         指数行情 (JSON)
+        GET  /hq?list=      按代码查询行情（新浪行情接口格式）
+        GET  /<code>.html   基金详情页 (HTML)
+        POST /robot/send    钉钉机器人 (固定返回 errcode=0)
+    """
+
+    def __init__(self, data, host="127.0.0.1", port=DEFAULT_PORT, latency_ms=0.0, error_rate=0.0, seed=0):
+        self.data = data
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self.alerts = []
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _should_fail(self):
+        """模拟上游延迟并按错误率决定是否返回错误"""
+        with self._lock:
+            self.request_count += 1
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.error_count += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return fail
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # 静默访问日志
+
+            def _send(self, status, body, content_type="application/json; charset=utf-8", headers=None):
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path
+                category = parse_qs(url.query).get("category", ["lof"])[0]
+                if server._should_fail():
+                    return self._send(500, json.dumps({"error": "injected"}))
+
+                if path == "/list":
+                    funds = [f for f in server.data["fund_list"] if f.get("category", "lof") == category]
+                    return self._send(200, json.dumps(funds, ensure_ascii=False))
+                if path == "/navs":
+                    navs = {f["code"]: server.data["nav"][f["code"]] for f in server.data["fund_list"]
+                            if f.get("category", "lof") == category and f["code"] in server.data["nav"]}
+                    return self._send(200, json.dumps(navs))
+                if path.startswith("/nav/"):
+                    nav = server.data["nav"].get(path[len("/nav/"):])
+                    if nav is None:
+                        return self._send(404, "{}")
+                    return self._send(200, json.dumps({"nav_price": nav[0], "nav_date": nav[1]}))
+                if path == "/index":
+                    # 旧录制的指数行情没有行情日期，以录制日期代替
+                    recorded = server.data.get("recorded_at", "")[:10]
+                    index = {code: quote if len(quote) > 2 else list(quote) + [recorded]
+                             for code, quote in server.data.get("index", {}).items()}
+                    return self._send(200, json.dumps(index))
+                if path == "/hq":
+                    # 新浪行情接口格式：名称,今开,昨收,最新价,最高,最低,买一,卖一,成交量,成交额
+                    symbols = parse_qs(url.query).get("list", [""])[0].split(",")
+                    funds = {f.get("market", "") + f["code"]: f for f in server.data["fund_list"]}
+                    lines = []
+                    for symbol in symbols:
+                        fund = funds.get(symbol)
+                        if fund:
+                            price = fund.get("market_price") or 0
+                            fields = [fund["name"]] + [price] * 7 + [fund.get("volume") or 0, fund.get("amount") or 0]
+                            lines.append(f'var hq_str_{symbol}="{",".join(map(str, fields))}";')
+                        else:
+                            lines.append(f'var hq_str_{symbol}="";')
+                    return self._send(200, "\n".join(lines).encode('gbk'), "text/plain; charset=gbk")
+                if path.endswith(".html"):
+                    page = server.data["pages"].get(path.strip("/")[:-len(".html")])
+                    if page is None:
+                        return self._send(404, "")
+                    etag = '"%s"' % hashlib.md5(page.encode('utf-8')).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    return self._send(200, page, "text/html; charset=utf-8", {"ETag": etag})
+                self._send(404, "{}")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if server._should_fail():
+                    return self._send(500, json.dumps({"errcode": 500, "errmsg": "injected"}))
+                if urlparse(self.path).path == "/robot/send":
+                    with server._lock:
+                        server.alerts.append(json.loads(body or b"{}"))
+                    return self._send(200, json.dumps({"errcode": 0, "errmsg": "ok"}))
+                self._send(404, "{}")
+
+        return Handler
+
+
+# ---------------------------------------------------------------- 回放
+
+def install_replay(base_url, snapshot_path=None):
+    """
+    将数据获取与钉钉通知指向替身服务，状态文件（告警日志、发件箱、滚动统计、历史数据、缓存等）指向临时目录
+
+    Args:
+        base_url: 替身服务地址，如 http://127.0.0.1:8765
+        snapshot_path: 回放时的快照写入路径（默认写入临时目录，避免覆盖真实快照）
+
+    Returns:
+        str: 指向替身服务的钉钉 Webhook URL
+    """
+    import requests
+    import pandas as pd
+    import data_fetcher
+    import snapshot
+    import fetch_cache
+    import universe
+    import logger_util
+    import alert_history
+    import notifier
+    import rolling_stats
+    import history_store
+    from metrics import metrics, host_of
+    from config import (
+        config, ALERTS_LOG_FILE, ALERTS_JSONL_FILE, ALERTS_ARCHIVE_DIR, ALERT_INDEX_FILE, OUTBOX_FILE,
+        ROLLING_STATS_FILE, HISTORY_DIR
+    )
+
+    base_url = base_url.rstrip("/")
+    host = host_of(base_url)
+    session = requests.Session()
+
+    def get_fund_list(category):
+        try:
+            with metrics.track("list_fetch", host):
+                response = session.get(f"{base_url}/list", params={"category": category}, timeout=10)
+                response.raise_for_status()
+            return pd.DataFrame(response.json(), columns=data_fetcher.LIST_COLUMNS)
+        except Exception as e:
+            print(f"获取{data_fetcher.CATEGORIES[category]['label']}基金列表失败: {e}")
+            return pd.DataFrame(columns=data_fetcher.LIST_COLUMNS)
+
+    def get_etf_nav_table():
+        try:
+            with metrics.track("nav_fetch", host):
+                response = session.get(f"{base_url}/navs", params={"category": "etf"}, timeout=10)
+                response.raise_for_status()
+            return {code: tuple(nav) for code, nav in response.json().items()}
+        except Exception as e:
+            print(f"获取ETF净值失败: {e}")
+            return {}
+
+    def get_nav_price(code):
+        try:
+            with metrics.track("nav_fetch", host) as span:
+                response = session.get(f"{base_url}/nav/{code}", timeout=10)
+                if response.status_code != 200:
+                    span.outcome = 'failure'
+                    return None, None
+            result = response.json()
+            return result["nav_price"], result["nav_date"]
+        except Exception:
+            return None, None
+
+    def get_index_quotes(codes):
+        try:
+            with metrics.track("index_fetch", host):
+                response = session.get(f"{base_url}/index", timeout=10)
+                response.raise_for_status()
+            return {code: tuple(quote) for code, quote in response.json().items() if code in codes}
+        except Exception as e:
+            print(f"获取指数行情失败: {e}")
+            return {}
+
+    if snapshot_path is None:
+        snapshot_path = os.path.join(tempfile.gettempdir(), "lof_replay_snapshot.pkl")
+    # 告警日志及索引、发件箱、滚动统计、历史数据写入每次回放重新创建的临时目录，当日去重记录只保留在内存中：
+    # 合成基金的代码与真实基金重叠，不能影响真实基金的告警及提交到仓库的状态文件
+    state_dir = os.path.join(tempfile.gettempdir(), "lof_replay_state")
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.makedirs(state_dir)
+    config.persist = False
+    logger_util.set_alert_paths(os.path.join(state_dir, ALERTS_LOG_FILE), os.path.join(state_dir, ALERTS_JSONL_FILE),
+                                os.path.join(state_dir, ALERTS_ARCHIVE_DIR))
+    alert_history.INDEX_PATH = os.path.join(state_dir, ALERT_INDEX_FILE)
+    notifier.OUTBOX_PATH = os.path.join(state_dir, OUTBOX_FILE)
+    rolling_stats.STATS_PATH = os.path.join(state_dir, ROLLING_STATS_FILE)
+    history_store.HISTORY_PATH = os.path.join(state_dir, HISTORY_DIR)
+    # 抓取缓存同样放在该目录：每次回放从空缓存开始，上一次回放的（可能是另一份数据的）净值及交易状态不会被沿用；
+    # 同一进程内的连续多轮（--serve、--dashboard）仍可命中缓存
+    fetch_cache.BUNDLE_PATH = os.path.join(state_dir, os.path.basename(fetch_cache.BUNDLE_PATH))
+    fetch_cache.reset_fetch_cache()
+    # 基金列表缓存每次回放都从替身服务的实时列表重新建立（不同的合成数据之间基金成员不同）
+    universe.UNIVERSE_PATH = os.path.join(tempfile.gettempdir(), "lof_replay_funds.csv")
+    if os.path.exists(universe.UNIVERSE_PATH):
+        os.remove(universe.UNIVERSE_PATH)
+
+    data_fetcher.get_fund_list = get_fund_list
+    data_fetcher.get_etf_nav_table = get_etf_nav_table
+    data_fetcher.get_nav_price = get_nav_price
+    data_fetcher.get_index_quotes = get_index_quotes
+    data_fetcher.FUND_PAGE_URL = base_url + "/{code}.html"
+    data_fetcher.QUOTE_URL = base_url + "/hq?list="
+    data_fetcher.save_snapshot = lambda fund_list: snapshot.save_snapshot(fund_list, snapshot_path)
+
+    return f"{base_url}/robot/send?access_token=replay"
+
+
+def percentile(values, pct):
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_bench(base_url, premium_threshold=10.0, discount_threshold=10.0, categories=None):
+    """
+    针对替身服务执行一轮完整的 获取 -> 计算 -> 通知 流程并统计耗时
+
+    注意：不经过 ConfigManager 去重、不写 alerts.log，避免污染真实状态。
+
+    Args:
+        categories: 获取的分类列表，默认取配置项 categories
+
+    Returns:
+        dict: 吞吐与延迟统计
+    """
+    webhook = install_replay(base_url)
+
+    import data_fetcher
+    from fetch_cache import reset_fetch_cache
+    from calculator import calculate_premium_discount, get_status
+    from notifier import send_dingtalk_alert, format_alert_message
+
+    latencies = []
+    alert_latencies = []
+    counters = {"funds": 0, "nav_missing": 0, "state_missing": 0, "alerts": 0, "alerts_failed": 0}
+    last = [time.perf_counter()]
+
+    def on_fund(fund):
+        now = time.perf_counter()
+        latencies.append((now - last[0]) * 1000)
+        counters["funds"] += 1
+        if fund['nav_price'] is None:
+            counters["nav_missing"] += 1
+        if not fund['fund_state']:
+            counters["state_missing"] += 1
+
+        premium_rate, discount_rate = calculate_premium_discount(fund['market_price'], fund['nav_price'])
+        status = get_status(premium_rate, discount_rate, premium_threshold, discount_threshold)
+        if status in ('premium_alert', 'discount_alert'):
+            alert_type = 'premium' if status == 'premium_alert' else 'discount'
+            rate = premium_rate if alert_type == 'premium' else discount_rate
+            msg = format_alert_message(fund['code'], fund['name'], alert_type, rate,
+                                       fund['market_price'], fund['nav_price'], fund['fund_state'])
+            t0 = time.perf_counter()
+            counters["alerts"] += 1
+            if not send_dingtalk_alert(webhook, "", msg):
+                counters["alerts_failed"] += 1
+            alert_latencies.append((time.perf_counter() - t0) * 1000)
+        last[0] = time.perf_counter()
+
+    # 测量的是冷启动抓取，不使用之前回放留下的抓取缓存
+    reset_fetch_cache()
+    start = time.perf_counter()
+    data_fetcher.get_all_fund_data(data_callback=on_fund, categories=categories)
+    elapsed = time.perf_counter() - start
+
+    return {
+        **counters,
+        "elapsed_s": round(elapsed, 3),
+        "funds_per_s": round(counters["funds"] / elapsed, 2) if elapsed else 0.0,
+        "fund_latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0.0
+        },
+        "alert_latency_ms": {
+            "p50": round(percentile(alert_latencies, 50), 3),
+            "p95": round(percentile(alert_latencies, 95), 3)
+        }
+    }
+
+
+def _load_data(args):
+    if args.recording:
+        return load_recording(args.recording)
+    return build_synthetic_universe(args.funds, seed=args.seed, page_kb=args.page_kb, mix=parse_mix(args.mix))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LOF基金监控 录制/回放工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("serve", "启动本地替身服务"), ("bench", "启动替身服务并测量一轮完整流程")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--recording", help="录制数据文件（不指定则使用合成数据）")
+        p.add_argument("--funds", type=int, default=400, help="合成 LOF 基金数量")
+        p.add_argument("--mix", help="其他分类的合成基金数量，如 etf=1000,closed=40,reits=60")
+        p.add_argument("--seed", type=int, default=0, help="合成数据随机种子")
+        p.add_argument("--page-kb", type=int, default=40, help="合成详情页大小 (KB)")
+        p.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的模拟延迟 (ms)")
+        p.add_argument("--error-rate", type=float, default=0.0, help="请求错误率 (0-1)")
+        p.add_argument("--port", type=int, default=DEFAULT_PORT if name == "serve" else 0, help="监听端口")
+        if name == "bench":
+            p.add_argument("--json", dest="json_path", help="结果输出到 JSON 文件")
+    args = parser.parse_args()
+
+    server = StandInServer(_load_data(args), port=args.port, latency_ms=args.latency_ms,
+                           error_rate=args.error_rate, seed=args.seed)
+
+    if args.command == "serve":
+        print(f"替身服务已启动: {server.base_url} ({len(server.data['fund_list'])} 只基金)")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    server.start()
+    try:
+        result = run_bench(server.base_url, categories=["lof"] + list(parse_mix(args.mix)))
+    finally:
+        server.stop()
+    result["requests"] = server.request_count
+    result["injected_errors"] = server.error_count
+
+    print(json.dumps(result, indent=4, ensure_ascii=False))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
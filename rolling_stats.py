@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 溢价率滚动统计模块
+
+为每只基金增量维护溢价率（折价记为负值）的统计量，每个观测值 O(1) 更新：
+    - Welford 算法：全部样本的均值与方差
+    - EWMA：指数加权均值与方差，跟随近期水平变化
+新观测值相对更新前 EWMA 的 z 分数用于异动检测：长期溢价的债券型 LOF 不会持续告警，
+平时贴水很小的基金出现异常波动时则能及时发现。统计状态保存在 rolling_stats.pkl，跨运行累积。
+"""
+
+import os
+import math
+import pickle
+import threading
+from config import ROLLING_STATS_FILE, EWMA_ALPHA, ANOMALY_MIN_SAMPLES, ANOMALY_MIN_STD
+
+STATS_VERSION = 1
+
+# 统计状态文件路径（回放模式下指向临时目录，替身服务的合成数据不计入真实统计）
+STATS_PATH = ROLLING_STATS_FILE
+
+# 每只基金的状态列表下标
+N, MEAN, M2, EWMA, EWVAR = range(5)
+
+
+class RollingStats:
+    """每只基金溢价率的增量统计"""
+
+    def __init__(self, alpha=EWMA_ALPHA):
+        self.alpha = alpha
+        self.funds = {}  # code -> [n, mean, m2, ewma, ewvar]
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def update(self, code, value):
+        """
+        加入一个观测值
+
+        Args:
+            code: 基金代码
+            value: 带符号溢价率 (%)，None 表示无法计算，直接忽略
+
+        Returns:
+            float: 该值相对更新前 EWMA 的 z 分数；样本不足时返回 None
+        """
+        if value is None:
+            return None
+        with self._lock:
+            self.dirty = True
+            state = self.funds.get(code)
+            if state is None:
+                self.funds[code] = [1, value, 0.0, value, 0.0]
+                return None
+
+            zscore = None
+            if state[N] >= ANOMALY_MIN_SAMPLES:
+                std = max(math.sqrt(state[EWVAR]), ANOMALY_MIN_STD)
+                zscore = (value - state[EWMA]) / std
+
+            # Welford
+            state[N] += 1
+            delta = value - state[MEAN]
+            state[MEAN] += delta / state[N]
+            state[M2] += delta * (value - state[MEAN])
+
+            # 指数加权均值/方差
+            diff = value - state[EWMA]
+            incr = self.alpha * diff
+            state[EWMA] += incr
+            state[EWVAR] = (1 - self.alpha) * (state[EWVAR] + diff * incr)
+            return zscore
+
+    def get(self, code):
+        """
+        单只基金的统计量
+
+        Returns:
+            dict: count, mean, std, ewma, ewstd；无数据返回 None
+        """
+        state = self.funds.get(code)
+        if state is None:
+            return None
+        n = state[N]
+        return {
+            'count': n,
+            'mean': state[MEAN],
+            'std': math.sqrt(state[M2] / (n - 1)) if n > 1 else 0.0,
+            'ewma': state[EWMA],
+            'ewstd': math.sqrt(state[EWVAR])
+        }
+
+
+def load_stats(path=None):
+    """加载统计状态，不存在或版本/参数不符时返回空统计"""
+    path = path or STATS_PATH
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+            if payload.get('version') == STATS_VERSION and payload.get('alpha') == EWMA_ALPHA:
+                stats = RollingStats()
+                stats.funds = payload['funds']
+                return stats
+        except Exception as e:
+            print(f"读取滚动统计失败: {e}，将重新累积")
+    return RollingStats()
+
+
+def save_stats(stats, path=None):
+    """保存统计状态（临时文件 + 原子替换），无变化时跳过"""
+    if not stats.dirty:
+        return
+    path = path or STATS_PATH
+    tmp_path = path + ".tmp"
+    try:
+        with stats._lock:
+            data = pickle.dumps({'version': STATS_VERSION, 'alpha': stats.alpha, 'funds': stats.funds},
+                                protocol=pickle.HIGHEST_PROTOCOL)
+            stats.dirty = False
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存滚动统计失败: {e}")
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_rolling_stats():
+    """获取全局滚动统计（首次调用时从文件加载）"""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = load_stats()
+        return _stats
+
+
+def save_rolling_stats():
+    """保存全局滚动统计（监控循环结束时调用）"""
+    if _stats is not None:
+        save_stats(_stats)
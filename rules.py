@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 告警规则模块
+
+rules.json 为不同基金/分组设置各自的告警阈值及排除条件（格式见 rules.example.json）：
+
+    groups  有序的基金分组，每只基金归入第一个匹配的分组；没有匹配条件的分组匹配全部基金
+            匹配条件: name_regex（名称正则）、codes（代码列表）、category（品种分类，字符串或列表）
+    rules   按顺序生效的规则，后面的规则覆盖前面的设置
+            选择条件（可组合，均需满足）: group、codes、name_regex、state_regex（交易状态正则）、
+                                          category（lof / etf / closed / reits，字符串或列表）
+            动作: premium_threshold、discount_threshold、anomaly_zscore、
+                  exclude（不告警）、min_volume / min_amount（成交量/成交额低于该值时不告警）
+
+规则只编译一次。每轮获取基金列表后，按列对整张基金表向量化计算各规则的命中掩码；
+交易状态的取值很少，每种状态只计算一次各基金的有效阈值，之后逐只基金判定只是数组下标查找。
+"""
+
+import os
+import re
+import json
+from config import RULES_FILE
+
+RULE_ACTIONS = ('premium_threshold', 'discount_threshold', 'anomaly_zscore')
+RULE_SELECTORS = ('group', 'codes', 'name_regex', 'state_regex', 'category')
+RULE_KEYS = set(RULE_ACTIONS) | set(RULE_SELECTORS) | {'exclude', 'min_volume', 'min_amount', 'comment'}
+
+STATUS_CHOICES = ('premium_alert', 'discount_alert', 'anomaly_alert', 'premium', 'discount')
+
+
+class RuleError(ValueError):
+    """规则文件格式错误"""
+
+
+def _category_set(value):
+    """category 条件：字符串或列表 -> 集合，未设置返回 None"""
+    if not value:
+        return None
+    return {value} if isinstance(value, str) else set(value)
+
+
+def _compile_regex(pattern, where):
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise RuleError(f"{where} 正则表达式错误: {e}")
+
+
+class RuleEngine:
+    """编译后的告警规则"""
+
+    def __init__(self, spec):
+        self.groups = []  # [(名称, 名称正则, 代码集合, 分类集合)]
+        for name, matcher in (spec.get('groups') or {}).items():
+            regex = _compile_regex(matcher['name_regex'], f"分组 {name}") if matcher.get('name_regex') else None
+            codes = set(str(c) for c in matcher.get('codes', []))
+            self.groups.append((name, regex, codes, _category_set(matcher.get('category'))))
+        group_names = [g[0] for g in self.groups]
+
+        self.rules = []
+        for i, rule in enumerate(spec.get('rules') or [], 1):
+            unknown = set(rule) - RULE_KEYS
+            if unknown:
+                raise RuleError(f"第 {i} 条规则包含未知字段: {', '.join(sorted(unknown))}")
+            if rule.get('group') and rule['group'] not in group_names:
+                raise RuleError(f"第 {i} 条规则引用了未定义的分组: {rule['group']}")
+            self.rules.append({
+                'group': group_names.index(rule['group']) if rule.get('group') else None,
+                'codes': set(str(c) for c in rule['codes']) if rule.get('codes') else None,
+                'name_regex': _compile_regex(rule['name_regex'], f"第 {i} 条规则") if rule.get('name_regex') else None,
+                'state_regex': _compile_regex(rule['state_regex'], f"第 {i} 条规则") if rule.get('state_regex') else None,
+                'category': _category_set(rule.get('category')),
+                'actions': {key: float(rule[key]) for key in RULE_ACTIONS if key in rule},
+                'exclude': bool(rule.get('exclude')),
+                'min_volume': rule.get('min_volume'),
+                'min_amount': rule.get('min_amount')
+            })
+
+        self._regex_cache = {}  # (正则, 文本) -> 是否匹配，基金名称每轮基本不变
+        self.table = None  # 本轮基金列表编译得到的 RuleTable，供逐只判定使用
+
+    # ------------------------------------------------------------ 编译到基金表
+
+    def _regex_mask(self, regex, values):
+        """对字符串列做正则匹配：只对不重复的取值求值并缓存"""
+        import numpy as np
+        uniques, inverse = np.unique(values, return_inverse=True)
+        hits = np.empty(len(uniques), dtype=bool)
+        for i, value in enumerate(uniques):
+            key = (regex.pattern, value)
+            hit = self._regex_cache.get(key)
+            if hit is None:
+                hit = self._regex_cache[key] = bool(regex.search(value))
+            hits[i] = hit
+        return hits[inverse.reshape(-1)]
+
+    def compile_table(self, codes, names, volumes, amounts, premium_threshold, discount_threshold,
+                      anomaly_zscore=0, categories=None):
+        """
+        按列对整张基金表计算各规则与交易状态无关的部分
+
+        Args:
+            codes, names: 基金代码/名称序列
+            volumes, amounts: 成交量/成交额序列，缺失为 None
+            categories: 品种分类序列，缺失（如旧快照）视为 lof
+            premium_threshold, discount_threshold, anomaly_zscore: 全局默认值
+
+        Returns:
+            RuleTable: 编译结果
+        """
+        import numpy as np
+        codes = np.asarray([str(c) for c in codes], dtype=object)
+        names = np.asarray([n or "" for n in names], dtype=object)
+        volumes = np.asarray([np.nan if v is None else v for v in volumes], dtype=float)
+        amounts = np.asarray([np.nan if v is None else v for v in amounts], dtype=float)
+        n = len(codes)
+        categories = np.asarray([c or "lof" for c in categories] if categories is not None else ["lof"] * n,
+                                dtype=object)
+
+        def in_categories(allowed):
+            return np.fromiter((c in allowed for c in categories), dtype=bool, count=n)
+
+        # 分组：第一个匹配的分组
+        group = np.full(n, -1)
+        for gi, (_, regex, group_codes, group_categories) in enumerate(self.groups):
+            mask = group == -1
+            if regex is not None:
+                mask &= self._regex_mask(regex, names)
+            if group_codes:
+                mask &= np.fromiter((c in group_codes for c in codes), dtype=bool, count=n)
+            if group_categories:
+                mask &= in_categories(group_categories)
+            group[mask] = gi
+
+        # 各规则的命中掩码（不含交易状态条件）及低成交掩码
+        select = np.ones((len(self.rules), n), dtype=bool)
+        low = np.zeros((len(self.rules), n), dtype=bool)
+        for ri, rule in enumerate(self.rules):
+            mask = select[ri]
+            if rule['group'] is not None:
+                mask &= group == rule['group']
+            if rule['codes'] is not None:
+                mask &= np.fromiter((c in rule['codes'] for c in codes), dtype=bool, count=n)
+            if rule['name_regex'] is not None:
+                mask &= self._regex_mask(rule['name_regex'], names)
+            if rule['category'] is not None:
+                mask &= in_categories(rule['category'])
+            # 成交数据缺失时 NaN 比较结果为 False，即不因成交量排除
+            if rule['min_volume'] is not None:
+                low[ri] |= volumes < rule['min_volume']
+            if rule['min_amount'] is not None:
+                low[ri] |= amounts < rule['min_amount']
+
+        defaults = (premium_threshold, discount_threshold, anomaly_zscore or 0)
+        return RuleTable(self.rules, codes, group, select, low, defaults)
+
+    def prepare(self, fund_df, premium_threshold, discount_threshold, anomaly_zscore=0):
+        """
+        编译本轮基金列表（get_universe 返回的 DataFrame），之后可逐只调用 lookup
+
+        作为 get_all_fund_data 的 list_callback 使用。
+        """
+        def column(name):
+            if name not in fund_df:
+                return [None] * len(fund_df)
+            return [None if v != v else v for v in fund_df[name]]  # NaN -> None
+
+        self.table = self.compile_table(fund_df['code'], fund_df['name'], column('volume'), column('amount'),
+                                        premium_threshold, discount_threshold, anomaly_zscore, column('category'))
+
+    def lookup(self, code, fund_state=""):
+        """
+        单只基金的有效阈值（逐只获取数据时使用，O(1) 数组查找）
+
+        Returns:
+            tuple: (premium_threshold, discount_threshold, anomaly_zscore)；排除的基金阈值为 inf；
+                   尚未编译基金列表时返回 None
+        """
+        if self.table is None:
+            return None
+        return self.table.lookup(code, fund_state)
+
+    def evaluate(self, rows, premium_threshold, discount_threshold, anomaly_zscore=0):
+        """
+        对整张基金表向量化判定状态（语义同 calculator.get_status）
+
+        Args:
+            rows: 基金数据列表，每项包含 code、name、category、volume、amount、fund_state、
+                  premium_rate、discount_rate、zscore（可选）
+
+        Returns:
+            list: 与 rows 对应的状态字符串
+        """
+        import numpy as np
+        if not rows:
+            return []
+        table = self.compile_table([r['code'] for r in rows], [r.get('name') for r in rows],
+                                   [r.get('volume') for r in rows], [r.get('amount') for r in rows],
+                                   premium_threshold, discount_threshold, anomaly_zscore,
+                                   [r.get('category') for r in rows])
+        n = len(rows)
+        states, inverse = np.unique(np.asarray([r.get('fund_state') or "" for r in rows], dtype=object),
+                                    return_inverse=True)
+        inverse = inverse.reshape(-1)
+        pt, dt, zt = np.empty(n), np.empty(n), np.empty(n)
+        for k, state in enumerate(states):
+            values = table.resolve(state)
+            mask = inverse == k
+            pt[mask], dt[mask], zt[mask] = values[0][mask], values[1][mask], values[2][mask]
+
+        def column(key):
+            return np.fromiter((np.nan if r.get(key) is None else r[key] for r in rows), dtype=float, count=n)
+
+        premium = np.nan_to_num(column('premium_rate'), nan=0.0)
+        discount = np.nan_to_num(column('discount_rate'), nan=0.0)
+        zscore = column('zscore')
+        with np.errstate(invalid='ignore'):
+            conditions = [premium >= pt, discount >= dt, (zt > 0) & (np.abs(zscore) >= zt),
+                          premium > 0, discount > 0]
+        return np.select(conditions, STATUS_CHOICES, 'normal').tolist()
+
+
+class RuleTable:
+    """规则在一张基金表上的编译结果"""
+
+    def __init__(self, rules, codes, group, select, low, defaults):
+        self.rules = rules
+        self.group = group
+        self.select = select  # 规则 × 基金 命中掩码（不含交易状态条件）
+        self.low = low  # 规则 × 基金 低成交掩码
+        self.defaults = defaults
+        self.index = {code: i for i, code in enumerate(codes)}
+        self._by_state = {}  # 交易状态 -> (premium, discount, zscore) 阈值数组
+
+    def resolve(self, state):
+        """某一交易状态下全部基金的有效阈值数组 (premium, discount, zscore)"""
+        values = self._by_state.get(state)
+        if values is not None:
+            return values
+
+        import numpy as np
+        n = len(self.group)
+        values = [np.full(n, float(default)) for default in self.defaults]
+        excluded = np.zeros(n, dtype=bool)
+        for ri, rule in enumerate(self.rules):
+            if rule['state_regex'] is not None and not rule['state_regex'].search(state):
+                continue
+            mask = self.select[ri]
+            for k, key in enumerate(RULE_ACTIONS):
+                if key in rule['actions']:
+                    values[k][mask] = rule['actions'][key]
+            if rule['exclude']:
+                excluded |= mask
+            excluded |= mask & self.low[ri]
+        values[0][excluded] = np.inf
+        values[1][excluded] = np.inf
+        values[2][excluded] = 0.0
+        self._by_state[state] = values
+        return values
+
+    def lookup(self, code, fund_state=""):
+        i = self.index.get(code)
+        if i is None:
+            return self.defaults
+        values = self.resolve(fund_state or "")
+        return float(values[0][i]), float(values[1][i]), float(values[2][i])
+
+
+def load_rule_engine(path=RULES_FILE):
+    """
+    加载并编译规则文件
+
+    Returns:
+        RuleEngine: 规则引擎；规则文件不存在或格式错误时返回 None（使用全局阈值）
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        return RuleEngine(spec)
+    except (RuleError, ValueError, KeyError, TypeError) as e:
+        print(f"读取告警规则失败: {e}，使用全局阈值")
+        return None
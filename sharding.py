@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 分片运行模块
+
+将一轮监控按基金代码拆分到多个进程或多个 GitHub Actions 作业中并行执行：
+    - 按 crc32(基金代码) % N 稳定划分，同一基金总是落在同一分片
+    - 分片运行不改写共享状态（config.json、告警日志、历史数据、滚动统计、快照、基金列表），
+      本分片的基金数据、告警日志条目、告警去重记录、滚动统计、抓取缓存、刷新后的基金列表及未发送完的告警
+      写入 shards/shard-<i>-of-<N>.pkl
+    - merge 步骤合并全部分片文件：合并去重记录、按时间追加告警日志、写入一轮历史数据及快照、
+      更新滚动统计、抓取缓存及基金列表，并继续发送分片未发送完的告警
+
+用法:
+    python main.py --run-once --shard 0/4     # 4 个分片中的第 0 个（可同时启动多个进程）
+    python main.py merge                      # 合并 shards/ 下的分片结果
+"""
+
+import os
+import re
+import zlib
+import pickle
+from datetime import datetime
+from config import config, SHARD_DIR, NOTIFY_DRAIN_TIMEOUT
+
+SHARD_VERSION = 1
+
+SHARD_FILE_PATTERN = re.compile(r"^shard-(\d+)-of-(\d+)\.pkl$")
+
+# 分片运行时与结果文件同名前缀的附属文件：发件箱、指标、基金列表副本
+SIDE_SUFFIXES = (".outbox.json", ".metrics.json", ".metrics.prom", ".funds.csv")
+
+
+def parse_shard(text):
+    """
+    解析 'i/N' 形式的分片参数
+
+    Returns:
+        tuple: (index, count)，0 <= index < count
+    """
+    match = re.fullmatch(r"(\d+)/(\d+)", text.strip())
+    if not match:
+        raise ValueError(f"分片参数格式应为 i/N: {text}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片序号超出范围: {text}")
+    return index, count
+
+
+def shard_of(code, count):
+    """基金所属的分片序号（与进程、Python 版本无关的稳定哈希）"""
+    return zlib.crc32(str(code).encode('utf-8')) % count
+
+
+def select_shard(fund_df, shard):
+    """
+    筛选属于该分片的基金
+
+    Args:
+        fund_df: 基金列表 DataFrame（含 code 列）
+        shard: (index, count)
+
+    Returns:
+        DataFrame: 本分片的基金，行号重新从 0 开始
+    """
+    index, count = shard
+    mask = [shard_of(code, count) == index for code in fund_df['code']]
+    return fund_df[mask].reset_index(drop=True)
+
+
+def shard_path(shard, root=SHARD_DIR):
+    index, count = shard
+    return os.path.join(root, f"shard-{index}-of-{count}.pkl")
+
+
+def side_files(path):
+    """分片结果文件对应的附属文件路径"""
+    prefix = path[:-len(".pkl")]
+    return [prefix + suffix for suffix in SIDE_SUFFIXES]
+
+
+class ShardSession:
+    """
+    一次分片运行：进入后共享状态只在内存中修改，结束时写出分片结果文件
+    """
+
+    def __init__(self, shard, root=SHARD_DIR):
+        import shutil
+        import universe
+        from logger_util import capture_alerts
+        self.shard = shard
+        self.root = root
+        self.path = shard_path(shard, root)
+        self.started = datetime.now()
+        os.makedirs(root, exist_ok=True)
+        config.persist = False
+        self.alerts = capture_alerts()
+        # 各分片使用独立的发件箱及指标文件，避免同机多进程互相覆盖；
+        # 各分片都获取完整的基金列表，刷新成员时写入分片自己的副本，由 merge 写回
+        self.outbox_file, metrics_json, metrics_prom, self.universe_file = side_files(self.path)
+        self.metrics_paths = (metrics_json, metrics_prom)
+        if os.path.exists(universe.UNIVERSE_PATH):
+            shutil.copyfile(universe.UNIVERSE_PATH, self.universe_file)
+        elif os.path.exists(self.universe_file):
+            os.remove(self.universe_file)
+        self.universe_mtime = os.path.getmtime(self.universe_file) if os.path.exists(self.universe_file) else None
+        universe.UNIVERSE_PATH = self.universe_file
+
+    def save(self, funds, rows, rolling_stats, dispatcher):
+        """
+        写出分片结果
+
+        Args:
+            funds: get_all_fund_data 返回的本分片基金数据
+            rows: 本轮写入历史数据的行
+            rolling_stats: 滚动统计 (RollingStats)
+            dispatcher: 告警发送器，未发送完的条目随分片结果交给 merge
+        """
+        from fetch_cache import get_fetch_cache
+        from universe import load_universe
+        index, count = self.shard
+        with dispatcher._lock:
+            leftover = [dict(entry) for entry in dispatcher.pending.values()]
+        with rolling_stats._lock:
+            stats = {code: list(state) for code, state in rolling_stats.funds.items()
+                     if shard_of(code, count) == index}
+        payload = {
+            'version': SHARD_VERSION,
+            'shard': self.shard,
+            'started': self.started.timestamp(),
+            'funds': funds,
+            'rows': rows,
+            'alerts': list(self.alerts.entries),
+            'alert_date': config.get("last_alert_date"),
+            'alerted': [code for code in config.get("alerted_funds", []) if shard_of(code, count) == index],
+            'stats': stats,
+            'cache': get_fetch_cache().to_payload(),
+            'outbox': leftover,
+            'universe': None
+        }
+        if os.path.exists(self.universe_file):
+            if os.path.getmtime(self.universe_file) != self.universe_mtime:
+                payload['universe'] = load_universe(self.universe_file).to_dict(orient='records')
+            os.remove(self.universe_file)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            # 未发送完的告警已写入分片结果，由 merge 继续发送
+            if os.path.exists(self.outbox_file):
+                os.remove(self.outbox_file)
+            print(f"分片 {index}/{count} 结果已保存到 {self.path}: {len(funds)} 只基金, "
+                  f"{len(payload['alerts'])} 条告警日志")
+        except Exception as e:
+            print(f"保存分片结果失败: {e}")
+
+
+def load_shards(root=SHARD_DIR):
+    """
+    读取全部分片结果
+
+    Returns:
+        list: [(path, payload)]，按分片序号排序
+    """
+    if not os.path.isdir(root):
+        return []
+    results = []
+    for filename in sorted(os.listdir(root)):
+        if not SHARD_FILE_PATTERN.match(filename):
+            continue
+        path = os.path.join(root, filename)
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+        except Exception as e:
+            print(f"读取分片结果失败 {path}: {e}")
+            continue
+        if payload.get('version') == SHARD_VERSION:
+            results.append((path, payload))
+    results.sort(key=lambda item: item[1]['shard'])
+    return results
+
+
+def merge_shards(root=SHARD_DIR, keep=False):
+    """
+    合并分片结果到共享状态
+
+    Args:
+        root: 分片结果目录
+        keep: 合并后保留分片文件
+
+    Returns:
+        int: 合并的分片数
+    """
+    from logger_util import append_alert_entries
+    from history_store import append_cycle
+    from rolling_stats import get_rolling_stats, save_rolling_stats
+    from snapshot import save_snapshot
+    from notifier import get_dispatcher
+    from fetch_cache import get_fetch_cache, save_fetch_cache
+    from universe import save_universe
+
+    shards = load_shards(root)
+    if not shards:
+        print(f"{root} 下没有分片结果")
+        return 0
+
+    # 不同分片数的结果来自不同的运行（如上次遗留的文件），基金会重复或遗漏，不合并
+    counts = sorted({payload['shard'][1] for _, payload in shards})
+    if len(counts) > 1:
+        print(f"{root} 下混有不同分片数 ({', '.join(map(str, counts))}) 的结果，请删除过期的分片文件后重新合并")
+        return 0
+    count = counts[0]
+    present = {payload['shard'][0] for _, payload in shards}
+    missing = sorted(set(range(count)) - present)
+    if missing:
+        print(f"警告: 共 {count} 个分片，缺少分片 {', '.join(map(str, missing))}，只合并已有结果")
+    payloads = [payload for _, payload in shards]
+
+    # 告警去重记录：只合并当天的
+    config.check_reset_daily_alerts()
+    today = config.current_date()
+    for payload in payloads:
+        if payload['alert_date'] == today:
+            for code in payload['alerted']:
+                config.mark_fund_alerted(code)
+
+    # 告警日志按时间追加（同时更新告警历史索引）
+    entries = sorted((entry for payload in payloads for entry in payload['alerts']),
+                     key=lambda entry: entry[1].get('time', ''))
+    append_alert_entries(entries)
+
+    # 各分片的基金互不重叠，滚动统计直接按基金覆盖
+    stats = get_rolling_stats()
+    with stats._lock:
+        for payload in payloads:
+            stats.funds.update(payload['stats'])
+        stats.dirty = True
+    save_rolling_stats()
+
+    # 抓取缓存：各分片都从同一份缓存包出发，同一条目保留较新的
+    cache = get_fetch_cache()
+    for payload in payloads:
+        if payload.get('cache'):
+            cache.merge_payload(payload['cache'])
+    save_fetch_cache()
+
+    # 基金列表：各分片获取的是同一份完整列表，任一分片刷新了成员即写回
+    refreshed = [payload['universe'] for payload in payloads if payload.get('universe')]
+    if refreshed:
+        import pandas as pd
+        save_universe(pd.DataFrame(refreshed[0]))
+
+    # 合并为一轮完整的历史数据及快照
+    funds = [fund for payload in payloads for fund in payload['funds']]
+    rows = [row for payload in payloads for row in payload['rows']]
+    append_cycle(rows, datetime.fromtimestamp(min(payload['started'] for payload in payloads)))
+    save_snapshot(funds)
+
+    # 分片未发送完的告警转入主发件箱继续发送
+    leftover = [entry for payload in payloads for entry in payload['outbox']]
+    if leftover:
+        dispatcher = get_dispatcher()
+        print(f"继续发送分片遗留的 {dispatcher.adopt(leftover)} 条告警")
+        dispatcher.drain(timeout=NOTIFY_DRAIN_TIMEOUT)
+    config.flush()
+
+    if not keep:
+        for path, _ in shards:
+            for side in side_files(path):
+                if os.path.exists(side):
+                    os.remove(side)
+            os.remove(path)
+    print(f"已合并 {len(shards)} 个分片: {len(funds)} 只基金, {len(entries)} 条告警日志, "
+          f"{sum(len(p['alerted']) for p in payloads if p['alert_date'] == today)} 只基金今日已告警")
+    return len(shards)
+
+
+def run_merge_command(args):
+    """执行 merge 子命令"""
+    merge_shards(args.dir, args.keep)
+
+
+def add_merge_parser(subparsers):
+    """注册 merge 子命令参数"""
+    p = subparsers.add_parser("merge", help="Merge shard results written by --run-once --shard i/N")
+    p.add_argument("--dir", default=SHARD_DIR, help=f"分片结果目录 (默认 {SHARD_DIR})")
+    p.add_argument("--keep", action="store_true", help="合并后保留分片文件")
+    return p
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 结果输出模块
+
+--run-once 每算完一只基金就把完整记录写入一个或多个输出，下游程序无需等待整轮结束、
+也无需解析终端的对齐文本：
+    ndjson[:PATH]   每行一个 JSON 对象，默认写到标准输出（此时终端文本改写到标准错误）
+    csv:PATH        CSV，首行为表头（PATH 为 - 时写到标准输出）
+    sqlite:PATH     SQLite 表 fund_records，按轮次 (cycle) 追加
+
+记录字段见 RECORD_FIELDS。写入经过缓冲，累计 SINK_FLUSH_RECORDS 条或距上次刷新超过
+SINK_FLUSH_INTERVAL 秒时刷新（SQLite 为提交一次事务），一轮结束时全部刷新。
+下游提前关闭管道（如 | head）时只停止写入该输出，其余输出及本轮监控照常进行。
+
+用法:
+    python main.py --run-once --output ndjson | jq 'select(.status == "premium_alert")'
+    python main.py --run-once --output csv:result.csv --output sqlite:result.db
+"""
+
+import io
+import os
+import sys
+import abc
+import csv
+import json
+import time
+from config import SINK_FLUSH_RECORDS, SINK_FLUSH_INTERVAL, SINK_BUFFER_BYTES
+
+# 记录字段（与 api_server.build_row 的基金表行一致，另加轮次开始时间及场内价格时间）
+RECORD_FIELDS = (
+    'cycle', 'code', 'name', 'category', 'market_price', 'market_time', 'nav_price', 'nav_estimated',
+    'nav_date', 'premium_rate', 'discount_rate', 'zscore', 'status', 'fund_state', 'volume', 'amount'
+)
+
+# SQLite 列类型（其余为 TEXT）
+COLUMN_TYPES = {
+    'market_price': 'REAL', 'nav_price': 'REAL', 'premium_rate': 'REAL', 'discount_rate': 'REAL',
+    'zscore': 'REAL', 'volume': 'REAL', 'amount': 'REAL', 'nav_estimated': 'INTEGER'
+}
+
+SINK_KINDS = ('ndjson', 'csv', 'sqlite')
+
+
+class OutputSink(abc.ABC):
+    """输出的公共部分：按条数/时间批量刷新"""
+
+    def __init__(self):
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.closed = False
+
+    def write(self, record):
+        """写入一条记录（字段见 RECORD_FIELDS）"""
+        if self.closed:
+            return
+        try:
+            self._write(record)
+        except BrokenPipeError:
+            return self._broken()
+        self.pending += 1
+        if self.pending >= SINK_FLUSH_RECORDS or time.monotonic() - self.last_flush >= SINK_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.closed:
+            return
+        if self.pending:
+            try:
+                self._flush()
+            except BrokenPipeError:
+                return self._broken()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if not self.closed:
+            self.closed = True
+            self._close()
+
+    def _broken(self):
+        """下游关闭了管道：丢弃缓冲内容并停止写入该输出"""
+        print(f"输出 {self.path} 的下游已关闭，停止写入", file=sys.stderr)
+        self.closed = True
+        try:
+            self._close()
+        except OSError:
+            pass  # 关闭时刷新剩余缓冲再次失败，底层文件已关闭
+
+    @abc.abstractmethod
+    def _write(self, record):
+        """缓冲一条记录"""
+
+    def _flush(self):
+        pass
+
+    def _close(self):
+        pass
+
+
+def _open_text(path):
+    """打开带缓冲的文本输出；- 表示标准输出"""
+    if path == "-":
+        return io.TextIOWrapper(io.BufferedWriter(io.FileIO(os.dup(sys.__stdout__.fileno()), 'w'),
+                                                  buffer_size=SINK_BUFFER_BYTES),
+                                encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='', buffering=SINK_BUFFER_BYTES)
+
+
+class NDJSONSink(OutputSink):
+    """每行一个 JSON 对象"""
+
+    def __init__(self, path="-"):
+        super().__init__()
+        self.path = path
+        self.stream = _open_text(path)
+
+    def _write(self, record):
+        self.stream.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _flush(self):
+        self.stream.flush()
+
+    def _close(self):
+        self.stream.close()
+
+
+class CSVSink(OutputSink):
+    """CSV，首行为表头；空值写为空字符串"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.stream = _open_text(path)
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow(RECORD_FIELDS)
+
+    def _write(self, record):
+        self.writer.writerow(['' if record.get(field) is None else record.get(field) for field in RECORD_FIELDS])
+
+    def _flush(self):
+        self.stream.flush()
+
+    def _close(self):
+        self.stream.close()
+
+
+class SQLiteSink(OutputSink):
+    """SQLite 表 fund_records：缓冲的记录按批插入，每次刷新提交一次事务"""
+
+    def __init__(self, path):
+        import sqlite3
+        super().__init__()
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")  # 写入时下游仍可读取
+        self.db.execute("CREATE TABLE IF NOT EXISTS fund_records (%s)" % ", ".join(
+            f"{field} {COLUMN_TYPES.get(field, 'TEXT')}" for field in RECORD_FIELDS))
+        self.db.execute("CREATE INDEX IF NOT EXISTS fund_records_code ON fund_records (code, cycle)")
+        self.db.commit()
+        self.rows = []
+        self.insert = "INSERT INTO fund_records (%s) VALUES (%s)" % (
+            ", ".join(RECORD_FIELDS), ", ".join("?" * len(RECORD_FIELDS)))
+
+    def _write(self, record):
+        self.rows.append(tuple(record.get(field) for field in RECORD_FIELDS))
+
+    def _flush(self):
+        with self.db:
+            self.db.executemany(self.insert, self.rows)
+        self.rows = []
+
+    def _close(self):
+        self.db.close()
+
+
+def parse_sink(text):
+    """
+    解析 --output 参数 (kind[:PATH])
+
+    Returns:
+        tuple: (kind, path)
+
+    Raises:
+        ValueError: 未知的输出类型或缺少路径
+    """
+    kind, _, path = text.partition(":")
+    kind = kind.strip().lower()
+    if kind not in SINK_KINDS:
+        raise ValueError(f"未知的输出类型: {kind}（可选 {' / '.join(SINK_KINDS)}）")
+    if not path:
+        if kind != 'ndjson':
+            raise ValueError(f"{kind} 输出需要指定路径，如 {kind}:result.{'db' if kind == 'sqlite' else kind}")
+        path = "-"
+    if kind == 'sqlite' and path == "-":
+        raise ValueError("sqlite 输出不能写到标准输出")
+    return kind, path
+
+
+def open_sinks(specs):
+    """
+    按 parse_sink 的结果打开输出
+
+    Returns:
+        list: OutputSink 列表
+    """
+    classes = {'ndjson': NDJSONSink, 'csv': CSVSink, 'sqlite': SQLiteSink}
+    return [classes[kind](path) for kind, path in specs]
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 数据快照模块
+
+每轮完整获取结束后，将基金数据表以列式结构写入本地二进制快照文件，
+下次启动时直接加载，使界面无需等待首轮抓取即可展示数据。
+"""
+
+import os
+import pickle
+from datetime import datetime
+from config import SNAPSHOT_FILE
+from metrics import metrics
+
+# 快照格式版本，字段变化时递增，旧版本快照直接忽略
+SNAPSHOT_VERSION = 1
+
+# 快照保存的字段（与 data_fetcher.get_all_fund_data 输出一致）
+SNAPSHOT_COLUMNS = (
+    'code', 'name', 'market', 'market_price', 'market_time',
+    'nav_price', 'nav_date', 'fund_state', 'volume', 'amount', 'est_nav', 'category'
+)
+
+
+def save_snapshot(fund_list, path=SNAPSHOT_FILE):
+    """
+    保存基金数据快照
+
+    Args:
+        fund_list: 基金数据列表 (get_all_fund_data 的返回值)
+        path: 快照文件路径
+
+    Returns:
+        bool: 是否保存成功
+    """
+    if not fund_list:
+        return False
+
+    payload = {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'columns': {
+            col: [fund.get(col) for fund in fund_list] for col in SNAPSHOT_COLUMNS
+        }
+    }
+
+    # 先写临时文件再替换，避免中途退出留下损坏的快照
+    tmp_path = path + ".tmp"
+    try:
+        with metrics.track("snapshot_write"):
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"保存数据快照失败: {e}")
+        return False
+
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """
+    加载基金数据快照
+
+    Args:
+        path: 快照文件路径
+
+    Returns:
+        tuple: (fund_list, saved_at)
+            fund_list (list): 基金数据列表，格式同 get_all_fund_data
+            saved_at (datetime): 快照保存时间
+            无可用快照返回 ([], None)
+    """
+    if not os.path.exists(path):
+        return [], None
+
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+
+        if payload.get('version') != SNAPSHOT_VERSION:
+            return [], None
+
+        columns = payload['columns']
+        codes = columns.get('code', [])
+        # 旧快照缺少的字段补 None
+        missing = [None] * len(codes)
+        fund_list = [
+            {col: columns.get(col, missing)[i] for col in SNAPSHOT_COLUMNS}
+            for i in range(len(codes))
+        ]
+        saved_at = datetime.strptime(payload['saved_at'], "%Y-%m-%d %H:%M:%S")
+        return fund_list, saved_at
+    except Exception as e:
+        print(f"读取数据快照失败: {e}")
+        return [], None
@@ -11,17 +11,23 @@ from datetime import datetime
 from config import (
     config,  # 引入ConfigManager实例
     WINDOW_TITLE, WINDOW_WIDTH, WINDOW_HEIGHT,
-    COLOR_PREMIUM, COLOR_DISCOUNT, COLOR_BG_DARK, COLOR_BG_CARD, COLOR_ACCENT
+    COLOR_PREMIUM, COLOR_DISCOUNT, COLOR_ANOMALY, COLOR_BG_DARK, COLOR_BG_CARD, COLOR_ACCENT
 )
-from data_fetcher import get_all_fund_data
-from calculator import calculate_premium_discount, get_status
-from notifier import send_dingtalk_alert, format_alert_message
-from logger_util import log_alert
+from calculator import calculate_premium_discount, get_status, signed_premium, select_nav
+from logger_util import log_alert, flush_alerts
+from snapshot import load_snapshot
 
 
 class LOFMonitorApp:
-    def __init__(self, root):
+    def __init__(self, root, profile=False, server=None):
         self.root = root
+        self.profile = profile  # 是否对数据加载进行性能剖析
+        # 瘦客户端模式：从 --serve 实例获取数据，不直接请求上游接口，也不发送告警
+        self.client = None
+        if server:
+            from api_server import FundTableClient
+            self.client = FundTableClient(server)
+        self.listener = None  # 订阅服务器变更事件的后台线程
         self.root.title(WINDOW_TITLE)
         self.root.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}")
         self.root.configure(bg=COLOR_BG_DARK)
@@ -35,11 +41,18 @@ class LOFMonitorApp:
         self.search_var = tk.StringVar()
         self.filter_var = tk.StringVar(value="all")
         
-        # 数据存储
+        # 数据存储（fund_data 赋值时同时重建 基金代码 -> 下标 的索引）
         self.fund_data = []
         self.is_loading = False
         self.sort_column = None  # 当前排序列
         self.sort_reverse = False  # 是否降序
+        self.stale_codes = set()  # 来自快照、尚未被本轮刷新覆盖的基金代码
+        self.stale_time = ""  # 快照保存时间 (MM-DD HH:MM)
+        self.alert_digest = None  # 汇总模式下本次加载的告警汇总器
+        from delta import DeltaEngine
+        self.delta = DeltaEngine()  # 再次刷新时只重新计算、重绘输入变化的基金
+        from rules import load_rule_engine
+        self.rule_engine = load_rule_engine()  # 未配置 rules.json 时为 None，使用全局阈值
         
         # 监听配置变更并保存
         self.premium_threshold.trace("w", self.save_thresholds)
@@ -54,6 +67,101 @@ class LOFMonitorApp:
         # 绑定搜索事件
         self.search_var.trace('w', self.refresh_table_view)
         self.filter_var.trace('w', self.refresh_table_view)
+        
+        # 从上次快照预加载数据，并在后台刷新；瘦客户端直接从服务器获取
+        if self.client:
+            self.root.after(100, self.refresh_data)
+        elif self.load_snapshot_data():
+            self.root.after(100, self.refresh_data)
+    
+    @property
+    def fund_data(self):
+        """表格数据（按显示顺序）"""
+        return self._fund_data
+
+    @fund_data.setter
+    def fund_data(self, funds):
+        self._fund_data = funds
+        self.reindex_fund_data()
+
+    def reindex_fund_data(self):
+        """重建 基金代码 -> fund_data 下标 的索引（整体替换或重新排序后调用）"""
+        self.fund_index = {fund['code']: i for i, fund in enumerate(self._fund_data)}
+
+    def load_snapshot_data(self):
+        """加载本地快照数据（过期数据，仅用于启动时立即展示）"""
+        snapshot_funds, saved_at = load_snapshot()
+        if not snapshot_funds:
+            return False
+        
+        p_threshold = self.premium_threshold.get()
+        d_threshold = self.discount_threshold.get()
+        self.fund_data = [self.build_fund_info(fund, p_threshold, d_threshold)
+                          for fund in snapshot_funds]
+        if self.rule_engine:
+            self.apply_rules(p_threshold, d_threshold)
+        self.stale_codes = {fund['code'] for fund in self.fund_data}
+        self.stale_time = saved_at.strftime("%m-%d %H:%M")
+        
+        self.refresh_table()
+        self.update_completion_status()
+        self.status_label.config(text=f"数据已过期 (截至 {self.stale_time})，正在后台刷新...")
+        return True
+    
+    def build_fund_info(self, fund, p_threshold, d_threshold, observe=False):
+        """
+        根据获取的基金数据计算溢价/折价率及状态，构造表格行数据
+        
+        Args:
+            observe: 是否计入溢价率滚动统计（新抓取的数据为 True，快照数据为 False）
+        """
+        market_price = fund['market_price']
+        # 官方净值或按指数行情估算的净值
+        nav_price, nav_estimated = select_nav(fund['nav_price'], fund.get('est_nav'), config.get("nav_source"))
+        
+        # 计算溢价/折价率
+        premium_rate, discount_rate = calculate_premium_discount(market_price, nav_price)
+        
+        zscore = None
+        if observe:
+            from rolling_stats import get_rolling_stats
+            zscore = get_rolling_stats().update(fund['code'], signed_premium(premium_rate, discount_rate))
+        
+        # 判断状态（配置了规则时使用该基金的有效阈值）
+        p_limit, d_limit, z_limit = self.get_limits(fund, p_threshold, d_threshold)
+        status = get_status(premium_rate, discount_rate, p_limit, d_limit, zscore, z_limit)
+        
+        return {
+            'code': fund['code'],
+            'name': fund['name'],
+            'category': fund.get('category') or 'lof',
+            'market_price': market_price,
+            'nav_price': nav_price,
+            'nav_estimated': nav_estimated,
+            'nav_date': fund.get('nav_date', ''),
+            'volume': fund.get('volume'),
+            'amount': fund.get('amount'),
+            'premium_rate': premium_rate,
+            'discount_rate': discount_rate,
+            'zscore': zscore,
+            'status': status,
+            'fund_state': fund.get('fund_state', '')
+        }
+    
+    def get_limits(self, fund, p_threshold, d_threshold):
+        """单只基金的有效阈值 (溢价, 折价, 异动z分数)"""
+        if self.rule_engine:
+            limits = self.rule_engine.lookup(fund['code'], fund.get('fund_state', ''))
+            if limits:
+                return limits
+        return p_threshold, d_threshold, config.get("anomaly_zscore")
+    
+    def apply_rules(self, p_threshold, d_threshold):
+        """按规则对整张表向量化重新判定状态"""
+        statuses = self.rule_engine.evaluate(self.fund_data, p_threshold, d_threshold,
+                                             config.get("anomaly_zscore"))
+        for fund, status in zip(self.fund_data, statuses):
+            fund['status'] = status
     
     def save_thresholds(self, *args):
         """保存阈值配置到文件"""
@@ -85,13 +193,17 @@ class LOFMonitorApp:
         except tk.TclError:
             return  # 输入框可能为空或非法字符
             
-        for fund in self.fund_data:
-            premium_rate = fund['premium_rate']
-            discount_rate = fund['discount_rate']
-            
-            # 重新判断状态
-            status = get_status(premium_rate, discount_rate, p_threshold, d_threshold)
-            fund['status'] = status
+        if self.rule_engine:
+            self.apply_rules(p_threshold, d_threshold)
+        else:
+            for fund in self.fund_data:
+                premium_rate = fund['premium_rate']
+                discount_rate = fund['discount_rate']
+                
+                # 重新判断状态
+                status = get_status(premium_rate, discount_rate, p_threshold, d_threshold,
+                                    fund.get('zscore'), config.get("anomaly_zscore"))
+                fund['status'] = status
             
         # 刷新表格显示
         self.refresh_table()
@@ -291,6 +403,10 @@ class LOFMonitorApp:
         self.tree.tag_configure('discount_alert', foreground=COLOR_DISCOUNT,
                                 font=('Microsoft YaHei UI', 10, 'bold'))
         
+        # 异动告警 -> 琥珀色
+        self.tree.tag_configure('anomaly_alert', foreground=COLOR_ANOMALY,
+                                font=('Microsoft YaHei UI', 10, 'bold'))
+        
         # 正常状态（未超过阈值的溢价或折价） -> 白色
         self.tree.tag_configure('premium', foreground='white')
         self.tree.tag_configure('discount', foreground='white')
@@ -351,11 +467,36 @@ class LOFMonitorApp:
             return
         
         self.is_loading = True
-        self.status_label.config(text="正在加载数据...")
         
-        # 清空表格
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        if self.client:
+            self.status_label.config(text=f"正在从 {self.client.base_url} 获取数据...")
+            threading.Thread(target=self.fetch_remote, daemon=True).start()
+            return
+        
+        # 汇总模式：本次加载的告警合并发送
+        from notifier import create_alert_digest
+        self.alert_digest = create_alert_digest()
+        
+        # 每次加载重新读取规则文件，修改后无需重启
+        from rules import load_rule_engine
+        self.rule_engine = load_rule_engine()
+        
+        from delta import evaluation_context
+        try:
+            context = evaluation_context(self.premium_threshold.get(), self.discount_threshold.get(),
+                                         config.get("anomaly_zscore"), config.get("nav_source"))
+        except tk.TclError:
+            context = None  # 阈值输入框非法时按参数变化处理，全部重新计算
+        self.delta.begin_cycle(context)
+        
+        if self.stale_codes:
+            # 已有快照数据：保留表格，新数据到达后逐行替换
+            self.status_label.config(text=f"数据已过期 (截至 {self.stale_time})，正在后台刷新...")
+        elif self.fund_data:
+            # 再次刷新：保留表格，只替换输入变化的行
+            self.status_label.config(text="正在刷新数据...")
+        else:
+            self.status_label.config(text="正在加载数据...")
         
         # 启动后台线程加载数据
         thread = threading.Thread(target=self.load_data_async)
@@ -365,8 +506,18 @@ class LOFMonitorApp:
     
     def load_data_async(self):
         """异步加载数据"""
+        if self.profile:
+            from profiler import profile_session
+            with profile_session("ui-load"):
+                self._load_data()
+        else:
+            self._load_data()
+    
+    def _load_data(self):
+        """加载数据主体（后台线程执行）"""
         try:
-            self.fund_data = [] # Reset data list
+            # 延迟导入数据获取模块，窗口无需等待 akshare 加载即可显示
+            from data_fetcher import get_all_fund_data
             
             # 定义进度回调
             def progress_callback(current, total, name, fund_data):
@@ -375,75 +526,192 @@ class LOFMonitorApp:
             
             # 定义数据回调（实时处理单个基金数据）
             def on_fund_data_received(fund):
-                code = fund['code']
-                name = fund['name']
-                market_price = fund['market_price']
-                nav_price = fund['nav_price']
-                
-                # 计算溢价/折价率
-                premium_rate, discount_rate = calculate_premium_discount(market_price, nav_price)
-                
-                # 判断状态
-                status = get_status(premium_rate, discount_rate,
-                                   self.premium_threshold.get(),
-                                   self.discount_threshold.get())
+                change = self.delta.diff(fund)
+                if not change.kinds:
+                    # 输入与上一轮相同：表格行无需重绘；跨日后或上次未能提交发送的告警仍需处理
+                    previous = change.previous
+                    if self.alert_pending(previous):
+                        self.root.after(0, lambda f=previous: self.add_single_row_and_alert(f, replace=True))
+                    return
                 
                 # 构造包含状态的完整信息
-                fund_info = {
-                    'code': code,
-                    'name': name,
-                    'market_price': market_price,
-                    # 'market_time': fund.get('market_time', ''), # 移除
-                    'nav_price': nav_price,
-                    # 'nav_date': fund.get('nav_date', ''), # 移除
-                    'premium_rate': premium_rate,
-                    'discount_rate': discount_rate,
-                    'status': status,
-                    'fund_state': fund.get('fund_state', '')
-                }
+                fund_info = self.build_fund_info(fund,
+                                                 self.premium_threshold.get(),
+                                                 self.discount_threshold.get(),
+                                                 observe=True)
+                self.delta.commit(fund['code'], fund_info, fund_info['status'])
                 
-                # 添加到内部列表（注意线程安全，虽然append是原子的，但这里在回调中）
-                self.fund_data.append(fund_info)
-                
-                # 在主线程更新UI
-                self.root.after(0, lambda f=fund_info: self.add_single_row_and_alert(f))
+                # 在主线程更新内部列表及UI
+                self.root.after(0, lambda f=fund_info, r=change.previous is not None:
+                                self.add_single_row_and_alert(f, replace=r))
 
             
-            self.root.after(0, lambda: self.status_label.config(text="正在获取LOF基金数据..."))
+            # 获取基金列表后先按规则编译整张表的阈值
+            def on_fund_list(fund_df):
+                self.rule_engine.prepare(fund_df, self.premium_threshold.get(),
+                                         self.discount_threshold.get(), config.get("anomaly_zscore"))
+            
+            self.root.after(0, lambda: self.status_label.config(text="正在获取基金数据..."))
             
             # 调用数据获取函数，传入data_callback
-            get_all_fund_data(progress_callback=progress_callback, data_callback=on_fund_data_received)
+            result = get_all_fund_data(progress_callback=progress_callback, data_callback=on_fund_data_received,
+                                       list_callback=on_fund_list if self.rule_engine else None)
             
-            # 完成后更新状态栏（表格行已经在回调中添加了）
-            self.root.after(0, self.update_completion_status)
+            # 完成后清理未被刷新的快照行并更新状态栏（表格行已经在回调中添加了）
+            self.root.after(0, lambda ok=bool(result): self.finish_refresh(ok))
             
         except Exception as e:
             self.root.after(0, lambda: self.status_label.config(text=f"加载失败: {e}"))
+            self.root.after(0, self.flush_alert_digest)
         finally:
             self.is_loading = False
             
-    def add_single_row_and_alert(self, fund_info):
-        """添加单行数据并检查告警（主线程执行）"""
+    def fetch_remote(self):
+        """瘦客户端：获取服务器的基金表（未变化时服务器返回 304），首次成功后开始订阅变更事件（后台线程执行）"""
+        try:
+            payload, changed = self.client.fetch_funds()
+            self.root.after(0, lambda: self.apply_remote_table(payload, changed))
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen_events, args=(payload['event_id'],),
+                                                 daemon=True)
+                self.listener.start()
+        except Exception as e:
+            self.root.after(0, lambda: self.status_label.config(text=f"连接服务器失败: {e}"))
+        finally:
+            self.is_loading = False
+    
+    def apply_remote_table(self, payload, changed):
+        """用服务器的基金表替换表格（主线程执行）"""
+        if changed:
+            self.fund_data = list(payload['funds'])
+            if self.sort_column:
+                self.apply_sort_data()
+            self.refresh_table()
+            self.update_completion_status()
+        self.show_remote_status(payload['cycle'], "" if changed else "（数据未变化）")
+    
+    def show_remote_status(self, cycle, suffix=""):
+        state = {'running': "服务器正在刷新", 'snapshot': "服务器快照数据", 'failed': "服务器本轮刷新失败"}.get(
+            cycle.get('state'), "服务器数据")
+        updated = cycle.get('finished') or cycle.get('started') or "-"
+        self.status_label.config(text=f"已连接 {self.client.base_url} - {state}，更新时间: {updated}{suffix}")
+    
+    def listen_events(self, last_id):
+        """瘦客户端：订阅服务器的变更事件，断线后按最后的事件序号重连补发（后台线程执行）"""
+        import time
+        while True:
+            try:
+                for event_id, name, data in self.client.iter_events(last_id):
+                    last_id = event_id if event_id is not None else last_id
+                    if name == 'fund':
+                        self.root.after(0, lambda f=data: self.add_single_row_and_alert(f))
+                    elif name == 'cycle':
+                        self.root.after(0, lambda c=data: self.apply_remote_cycle(c))
+                    elif name == 'reset':
+                        # 错过的事件已被服务器淘汰：重新获取全表
+                        self.client.etag = None
+                        self.root.after(0, self.refresh_data)
+            except Exception as e:
+                self.root.after(0, lambda e=e: self.status_label.config(text=f"与服务器的连接中断: {e}，5秒后重连"))
+            time.sleep(5)
+    
+    def apply_remote_cycle(self, cycle):
+        """服务器一轮开始/结束（主线程执行）"""
+        removed = set(cycle.get('removed') or ())
+        if removed:
+            self.fund_data = [f for f in self.fund_data if f['code'] not in removed]
+            for code in removed:
+                if self.tree.exists(code):
+                    self.tree.delete(code)
+        if cycle.get('state') != 'running':
+            self.update_completion_status()
+        self.show_remote_status(cycle)
+    
+    def finish_refresh(self, success):
+        """一轮刷新结束（主线程执行）"""
+        removed = set(self.delta.end_cycle(complete=success))
+        if success and (self.stale_codes or removed):
+            # 本轮未返回的基金（如已退市）从表格中移除
+            removed |= self.stale_codes
+            self.fund_data = [f for f in self.fund_data if f['code'] not in removed]
+            for code in removed:
+                if self.tree.exists(code):
+                    self.tree.delete(code)
+            self.stale_codes = set()
+        if success:
+            from history_store import append_cycle
+            append_cycle(self.fund_data)
+            from rolling_stats import save_rolling_stats
+            save_rolling_stats()
+        from fetch_cache import save_fetch_cache
+        save_fetch_cache()
+        self.flush_alert_digest()
+        flush_alerts()
+        config.flush()
+        self.update_completion_status()
+        if success and len(self.fund_data) != self.delta.counts['added']:
+            self.status_label.config(text=self.status_label.cget("text") + f" | 本轮变化: {self.delta.summary()}")
+    
+    def flush_alert_digest(self):
+        """发送本次加载收集的汇总告警（主线程执行）"""
+        if self.alert_digest:
+            self.alert_digest.flush()
+            self.alert_digest = None
+    
+    def alert_pending(self, fund_info):
+        """处于告警状态、但今日尚未告警且不在发送队列中"""
+        if fund_info['status'] not in ['premium_alert', 'discount_alert', 'anomaly_alert']:
+            return False
+        from notifier import get_dispatcher
+        return not config.is_fund_alerted(fund_info['code']) and not get_dispatcher().is_pending(fund_info['code'])
+    
+    def add_single_row_and_alert(self, fund_info, replace=False):
+        """
+        添加单行数据并检查告警（主线程执行）
+        
+        Args:
+            replace: 表格中已有该基金（上一轮的数据），原位替换
+        """
+        code = fund_info['code']
+        replaced = False
+        if replace or code in self.stale_codes or self.client:
+            # 用新数据替换快照或上一轮的旧行（瘦客户端替换服务器推送的变化行）
+            self.stale_codes.discard(code)
+            i = self.fund_index.get(code)
+            if i is not None:
+                self.fund_data[i] = fund_info
+                replaced = True
+        if not replaced:
+            self.fund_index[code] = len(self.fund_data)
+            self.fund_data.append(fund_info)
+        
         # 如果当前有激活的排序，则重新排序并刷新整个表格
         if self.sort_column:
-            # 添加到列表（已在load_data_async中添加，这里不需要再添）
             # 直接排序并刷新
             self.apply_sort_data()
             self.refresh_table()
+        elif self.tree.exists(code):
+            # 原位更新已有行
+            self.tree.item(code, values=self.get_row_values(fund_info), tags=(fund_info['status'],))
         else:
             # 否则直接追加到表格末尾
             self.add_table_row(fund_info)
         
-        # 检查是否需要告警
+        # 检查是否需要告警（瘦客户端模式下由服务器发送告警）
         status = fund_info['status']
-        if status in ['premium_alert', 'discount_alert']:
-            alert_type = 'premium' if status == 'premium_alert' else 'discount'
-            rate = fund_info['premium_rate'] if alert_type == 'premium' else fund_info['discount_rate']
+        if not self.client and status in ['premium_alert', 'discount_alert', 'anomaly_alert']:
+            if status == 'premium_alert':
+                alert_type, rate = 'premium', fund_info['premium_rate']
+            elif status == 'discount_alert':
+                alert_type, rate = 'discount', fund_info['discount_rate']
+            else:
+                alert_type = 'anomaly'
+                rate = signed_premium(fund_info['premium_rate'], fund_info['discount_rate'])
             
-            # 每日去重逻辑
+            # 每日去重逻辑（已提交发送的基金在发送成功后标记；未配置通知时直接标记）
             if not config.is_fund_alerted(fund_info['code']):
-                self.trigger_alert(fund_info, alert_type, rate)
-                config.mark_fund_alerted(fund_info['code'])
+                if not self.trigger_alert(fund_info, alert_type, rate):
+                    config.mark_fund_alerted(fund_info['code'])
             
     def refresh_table_view(self, *args):
         """仅刷新表格视图（搜索/筛选触发）"""
@@ -471,6 +739,7 @@ class LOFMonitorApp:
                 status_filter_map = {
                     "溢价告警": "premium_alert",
                     "折价告警": "discount_alert",
+                    "异动告警": "anomaly_alert",
                     "溢价": "premium",
                     "折价": "discount"
                 }
@@ -495,6 +764,7 @@ class LOFMonitorApp:
         
         # 排序数据
         self.fund_data.sort(key=sort_key, reverse=self.sort_reverse)
+        self.reindex_fund_data()
         
         # 更新列标题显示排序方向
         direction = "▼" if self.sort_reverse else "▲"
@@ -535,29 +805,38 @@ class LOFMonitorApp:
     
     def add_table_row(self, fund_info):
         """添加表格行"""
+        values = self.get_row_values(fund_info)
+        if self.tree.exists(fund_info['code']):
+            self.tree.item(fund_info['code'], values=values, tags=(fund_info['status'],))
+            return
+        self.tree.insert("", tk.END, iid=fund_info['code'], values=values, tags=(fund_info['status'],))
+    
+    def get_row_values(self, fund_info):
+        """构造表格行显示值"""
         # 只有在溢价或折价超过阈值时，才显示基金状态
         show_state = ""
-        if fund_info['status'] in ['premium_alert', 'discount_alert']:
+        if fund_info['status'] in ['premium_alert', 'discount_alert', 'anomaly_alert']:
             show_state = fund_info.get('fund_state', '')
             
         values = (
             fund_info['code'],
             fund_info['name'],
             f"{fund_info['market_price']:.4f}" if fund_info['market_price'] else "N/A",
-            f"{fund_info['nav_price']:.4f}" if fund_info['nav_price'] else "N/A",
+            (("≈" if fund_info.get('nav_estimated') else "") + f"{fund_info['nav_price']:.4f}")
+            if fund_info['nav_price'] else "N/A",
             f"{fund_info['premium_rate']:.2f}" if fund_info['premium_rate'] is not None else "N/A",
             f"{fund_info['discount_rate']:.2f}" if fund_info['discount_rate'] is not None else "N/A",
             self.get_status_text(fund_info['status']),
             show_state
         )
-        
-        self.tree.insert("", tk.END, values=values, tags=(fund_info['status'],))
+        return values
     
     def get_status_text(self, status):
         """获取状态文本"""
         status_map = {
             'premium_alert': '⚠️ 溢价告警',
             'discount_alert': '⚠️ 折价告警',
+            'anomaly_alert': '⚠️ 异动告警',
             'premium': '📈 溢价',
             'discount': '📉 折价',
             'normal': '➖ 正常',
@@ -570,35 +849,59 @@ class LOFMonitorApp:
         total = len(self.fund_data)
         premium_alert = sum(1 for f in self.fund_data if f['status'] == 'premium_alert')
         discount_alert = sum(1 for f in self.fund_data if f['status'] == 'discount_alert')
+        anomaly_alert = sum(1 for f in self.fund_data if f['status'] == 'anomaly_alert')
         
-        now = datetime.now().strftime("%H:%M:%S")
-        self.status_label.config(text=f"数据刷新完成 - 更新时间: {now}")
-        self.count_label.config(text=f"关注: {total} | 溢价告警: {premium_alert} | 折价告警: {discount_alert}")
+        if self.stale_codes:
+            self.status_label.config(text=f"数据已过期 (截至 {self.stale_time})")
+        else:
+            now = datetime.now().strftime("%H:%M:%S")
+            self.status_label.config(text=f"数据刷新完成 - 更新时间: {now}")
+        self.count_label.config(text=f"关注: {total} | 溢价告警: {premium_alert} | 折价告警: {discount_alert} | 异动告警: {anomaly_alert}")
     
     def trigger_alert(self, fund_info, alert_type, rate):
-        """触发告警"""
+        """
+        触发告警：记录日志并提交到后台发送队列（不阻塞界面线程）
+        
+        Returns:
+            bool: 是否已提交发送
+        """
         code = fund_info['code']
         name = fund_info['name']
-        threshold = (self.premium_threshold.get() if alert_type == 'premium' 
-                    else self.discount_threshold.get())
+        p_limit, d_limit, z_limit = self.get_limits(fund_info, self.premium_threshold.get(),
+                                                    self.discount_threshold.get())
+        threshold = {'premium': p_limit, 'discount': d_limit}.get(alert_type, z_limit)
+        zscore = fund_info.get('zscore')
         
         # 记录日志
-        log_alert(code, name, alert_type, rate, threshold)
-        
-        # 发送钉钉通知（包含去重逻辑）
-        if self.webhook_url.get():
+        log_alert(code, name, alert_type, rate, threshold, zscore)
+        
+        # 发送通知到已配置的渠道（包含去重逻辑）
+        from notifier import get_backends, get_dispatcher, format_alert_message
+        if get_backends():
+            if self.alert_digest:
+                return self.alert_digest.add(
+                    code, name, alert_type, rate,
+                    fund_info['market_price'], fund_info['nav_price'],
+                    fund_info.get('fund_state', ''), zscore, fund_info.get('nav_estimated', False)
+                )
             message = format_alert_message(
                 code, name, alert_type, rate,
                 fund_info['market_price'], fund_info['nav_price'],
-                fund_info.get('fund_state', '')
+                fund_info.get('fund_state', ''), zscore, fund_info.get('nav_estimated', False)
             )
-            send_dingtalk_alert(self.webhook_url.get(), self.webhook_secret.get(), message, fund_info['code'])
+            return get_dispatcher().submit(message, fund_code=code)
+        return False
  
  
-def run_app():
-    """启动应用程序"""
+def run_app(profile=False, server=None):
+    """
+    启动应用程序
+
+    Args:
+        server: 可选的 HTTP API 服务地址，指定时界面作为该服务的瘦客户端
+    """
     root = tk.Tk()
-    app = LOFMonitorApp(root)
+    app = LOFMonitorApp(root, profile=profile, server=server)
     root.mainloop()
 
 
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+LOF基金溢价监控程序 - 基金列表缓存模块
+
+lof_funds.csv 保存最近一次完整获取的基金列表（market, code, name, category, updated）：
+    - 每个分类每隔 UNIVERSE_TTL 秒（默认一天）用实时列表刷新一次成员，打印新增及退市的基金
+    - 刷新间隔内只用实时列表更新价格，基金成员以缓存为准（实时列表缺少的基金逐只查询行情）
+    - 实时列表获取失败时，本轮使用缓存的基金列表并逐只查询行情，不会整轮落空
+updated 列为该分类上次刷新的时间，随文件一起提交或缓存即可跨运行保留；分片运行写入分片自己的副本，
+刷新结果随分片结果由 merge 写回。
+"""
+
+import os
+from datetime import datetime
+from config import LOF_FUNDS_FILE, UNIVERSE_TTL
+
+UNIVERSE_COLUMNS = ['market', 'code', 'name', 'category', 'updated']
+
+# 基金列表缓存路径（回放模式下指向临时文件，分片运行时指向分片自己的副本，避免改写仓库中的 lof_funds.csv）
+UNIVERSE_PATH = LOF_FUNDS_FILE
+
+
+def load_universe(path=None):
+    """
+    读取缓存的基金列表
+
+    Returns:
+        DataFrame: UNIVERSE_COLUMNS 字段（旧文件没有 category 列时视为 lof、没有 updated 列时视为需要刷新），
+            文件不存在或损坏时为空表
+    """
+    import pandas as pd
+
+    path = path or UNIVERSE_PATH
+    try:
+        df = pd.read_csv(path, dtype={'code': str}, encoding='utf-8-sig', keep_default_na=False)
+    except FileNotFoundError:
+        return pd.DataFrame(columns=UNIVERSE_COLUMNS)
+    except Exception as e:
+        print(f"读取基金列表缓存失败: {e}")
+        return pd.DataFrame(columns=UNIVERSE_COLUMNS)
+    if 'category' not in df.columns:
+        df['category'] = 'lof'
+    if 'updated' not in df.columns:
+        df['updated'] = ''
+    df['code'] = df['code'].str.zfill(6)
+    return df[UNIVERSE_COLUMNS]
+
+
+def universe_codes(category="lof"):
+    """缓存中某一分类的基金代码列表（回测、估值映射拟合使用）"""
+    df = load_universe()
+    return df.loc[df['category'] == category, 'code'].tolist()
+
+
+def save_universe(df, path=None):
+    """写出基金列表缓存（临时文件 + 原子替换）"""
+    path = path or UNIVERSE_PATH
+    tmp_path = path + ".tmp"
+    try:
+        df[UNIVERSE_COLUMNS].to_csv(tmp_path, index=False, encoding='utf-8-sig')
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存基金列表缓存失败: {e}")
+
+
+def refresh_due(cached_df, now=None):
+    """
+    某一分类的缓存是否需要用实时列表刷新成员
+
+    Args:
+        cached_df: 该分类的缓存行
+
+    Returns:
+        bool: 没有缓存或距上次刷新已超过 UNIVERSE_TTL 时为 True
+    """
+    if cached_df.empty:
+        return True
+    try:
+        updated = datetime.strptime(min(cached_df['updated']), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return True
+    return ((now or datetime.now()) - updated).total_seconds() >= UNIVERSE_TTL
+
+
+def stamp(df, category, now=None):
+    """实时列表 -> 带分类及刷新时间的缓存行"""
+    return df[['market', 'code', 'name']].drop_duplicates('code').assign(
+        category=category, updated=(now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def diff_universe(cached, fresh):
+    """
+    比较两份基金列表
+
+    Returns:
+        tuple: (added, removed) 新增及移除的基金，均为 [(code, name)]
+    """
+    old = dict(zip(cached['code'], cached['name']))
+    new = dict(zip(fresh['code'], fresh['name']))
+    added = [(code, name) for code, name in new.items() if code not in old]
+    removed = [(code, name) for code, name in old.items() if code not in new]
+    return added, removed
+
+
+def report_diff(label, added, removed, limit=10):
+    """打印基金列表的变化"""
+    if not added and not removed:
+        return
+
+    def names(items):
+        text = "、".join(f"{name}({code})" for code, name in items[:limit])
+        return text + (f" 等 {len(items)} 只" if len(items) > limit else "")
+
+    parts = []
+    if added:
+        parts.append(f"新增 {names(added)}")
+    if removed:
+        parts.append(f"退市/移出 {names(removed)}")
+    print(f"{label}基金列表更新: " + "；".join(parts))